@@ -0,0 +1,390 @@
+"""
+Benchmarks of every stage of the pipeline, run on the synthetic chain models.
+
+Stages:
+
+  startup                every console script in setup.py started with --help
+                         in a fresh interpreter
+  generate_c_code        C code generation, analysis included
+  generate_python_code   Python code generation, analysis included
+  sample_sbml            create_model_from_config and evaluate_model_samples
+  sample_numpy           sample_parameter_uncertainties
+  build                  configuring and compiling siss-batch, needs SUNDIALS
+  solve                  trials solved through entry_point, one solver process
+                         per trial and in batches, needs SUNDIALS
+  solve_numpy            the same trials solved in this process by the numpy
+                         solver backend, kept as ensemble statistics
+  load_trials            investigate_output_data.load_trials, csv and binary
+  load_selected_series   multi_trial_plot.load_selected_series, needs cellsolver
+
+Every measurement keeps the wall and CPU times of each repeat, the peak of
+the Python allocations during one extra traced run (tracemalloc), and for
+stages running other processes the peak resident set size of those
+processes.  Stages that cannot run here are recorded as skipped with the
+reason.  The results are written as JSON, --compare checks them against the
+results of an earlier commit and exits with status 3 when a stage got slower
+than the threshold allows.
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import re
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import libcellml
+import numpy as np
+
+from cellsolvertools.binary_output import write_output
+from cellsolvertools.common import construct_application_config
+from cellsolvertools.generate_code import generate_c_code, return_generated_python_code
+from cellsolvertools.investigate_output_data import load_trials
+from cellsolvertools.sample_parameter_uncertainties import sample_parameter_uncertainties
+from cellsolvertools.simple_sundials_solver_manager import build_simulation_code, default_chunk_size, entry_point
+
+from synthetic_model import BUNDLED_SIZES, MODELS_DIR, chain_model_file
+
+STAGES = ['startup', 'generate_c_code', 'generate_python_code', 'sample_sbml', 'sample_numpy', 'build', 'solve', 'solve_numpy', 'load_trials', 'load_selected_series']
+RESULTS_FORMAT_VERSION = 1
+
+# A stand in for the simple sundials solver sources, siss-batch is built from generated code only.
+_TOP_LEVEL_CMAKE = """cmake_minimum_required(VERSION 3.12)
+project(cellsolvertools_benchmark C)
+add_subdirectory(src)
+"""
+_SRC_CMAKE = """include(${CMAKE_CURRENT_BINARY_DIR}/model_files.cmake)
+"""
+
+
+class Skipped(Exception):
+    pass
+
+
+@contextlib.contextmanager
+def _quiet():
+    """
+    Silence the output of child processes, such as CMake and make, at the file descriptor level.
+    """
+    sys.stdout.flush()
+    saved = os.dup(1)
+    with open(os.devnull, 'w') as devnull:
+        os.dup2(devnull.fileno(), 1)
+    try:
+        yield
+    finally:
+        os.dup2(saved, 1)
+        os.close(saved)
+
+
+def _children_max_rss():
+    # Kilobytes on Linux, bytes on macOS.
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+
+
+def measure(function, repeats, trace=True, per=1):
+    """
+    Time repeated calls of function.
+    :param trace: also trace the Python allocations of one extra call.
+    :param per: number of items each call handles, times are also given per item.
+    :return: measurement dict.
+    """
+    wall_times = []
+    cpu_times = []
+    for _ in range(repeats):
+        start, cpu_start = time.perf_counter(), time.process_time()
+        function()
+        wall_times.append(time.perf_counter() - start)
+        cpu_times.append(time.process_time() - cpu_start)
+
+    measurement = {
+        'repeats': repeats,
+        'wall_times': wall_times,
+        'best': min(wall_times),
+        'median': statistics.median(wall_times),
+        'cpu_median': statistics.median(cpu_times),
+        'children_max_rss_bytes': _children_max_rss(),
+    }
+    if per != 1:
+        measurement.update({'items': per, 'median_per_item': measurement['median'] / per})
+    if trace:
+        tracemalloc.start()
+        try:
+            function()
+            measurement['python_peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    return measurement
+
+
+def _console_script_modules():
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'setup.py')) as f:
+        return sorted(set(re.findall(r"=(cellsolvertools\.\w+):main'", f.read())))
+
+
+def _uncertainties(size, count):
+    return {f'main.k_{i}': {'distribution': 'normal', 'p1': 0.5 + 0.5 * i / size, 'p2': 0.05} for i in range(1, min(size, count) + 1)}
+
+
+def _build(model_file, work_dir, sundials_dir):
+    """
+    Generate and build siss-batch for the model, with main.k_1 as the external variable.
+    :return: the application config of the build.
+    """
+    src_dir = os.path.join(work_dir, 'src-stand-in')
+    os.makedirs(os.path.join(src_dir, 'src'), exist_ok=True)
+    with open(os.path.join(src_dir, 'CMakeLists.txt'), 'w') as f:
+        f.write(_TOP_LEVEL_CMAKE)
+    with open(os.path.join(src_dir, 'src', 'CMakeLists.txt'), 'w') as f:
+        f.write(_SRC_CMAKE)
+
+    application_config = construct_application_config(work_dir, sundials_dir)
+    application_config['src_dir'] = src_dir
+    shutil.rmtree(application_config['build_dir'], ignore_errors=True)
+    os.makedirs(os.path.join(application_config['build_dir'], 'src'))
+    generate_c_code(model_file, os.path.join(application_config['build_dir'], 'src'), {'external_variables': ['main.k_1']})
+    with _quiet():
+        built = build_simulation_code(application_config['build_dir'], src_dir, sundials_dir, True)
+    if not built:
+        raise Skipped('the solver did not build')
+
+    # siss-batch is the only executable built, it stands in for siss too.
+    application_config.update({'executable': application_config['batch_executable'], 'prebuilt': True})
+    return application_config
+
+
+def _write_outputs(directory, size, trials, points):
+    """
+    Write synthetic trial outputs shaped like those of the chain model of the given size, in both formats.
+    :return: dict of format to the list of files.
+    """
+    names = ['t'] + [f'x_{i}' for i in range(1, size + 1)] + [f'{n}_{i}' for n in ['k', 'a'] for i in range(1, size + 1)]
+    column_info = [{'component': 'main', 'name': name, 'units': 'dimensionless', 'type': 'STATE'} for name in names]
+    rng = np.random.default_rng(1)
+    files = {'csv': [], 'binary': []}
+    os.makedirs(directory, exist_ok=True)
+    for trial in range(1, trials + 1):
+        data = rng.random((points, len(names)))
+        data[:, 0] = np.arange(points)
+        csv_file = os.path.join(directory, f'simulation_output_{trial:05d}.csv')
+        np.savetxt(csv_file, data, delimiter=',', header=','.join(f'main.{name}' for name in names), comments='', fmt='%.17g')
+        binary_file = os.path.join(directory, f'simulation_output_{trial:05d}.bin')
+        write_output(binary_file, data, column_info)
+        files['csv'].append(csv_file)
+        files['binary'].append(binary_file)
+
+    return files
+
+
+def run_benchmarks(args, work_dir):
+    """
+    :return: dict of case, 'stage/model/variant', to its measurement, or to {'skipped': reason}.
+    """
+    results = {}
+    stages = args.stages or STAGES
+
+    def run(case, function, repeats=args.repeats, **kwargs):
+        print(f'{case} ...', file=sys.stderr)
+        try:
+            results[case] = measure(function, repeats, **kwargs)
+        except Skipped as e:
+            results[case] = {'skipped': str(e)}
+        except ImportError as e:
+            results[case] = {'skipped': f'missing dependency, {e}'}
+
+    if 'startup' in stages:
+        for module in _console_script_modules():
+            command = [sys.executable, '-m', module, '--help']
+            run(f'startup/{module.split(".")[-1]}', lambda: subprocess.run(command, stdout=subprocess.DEVNULL, check=True), trace=False)
+
+    for size in args.sizes:
+        model_file = chain_model_file(size, MODELS_DIR if size in BUNDLED_SIZES else os.path.join(work_dir, 'models'))
+        model = os.path.splitext(os.path.basename(model_file))[0]
+        code_dir = os.path.join(work_dir, model, 'code')
+        os.makedirs(code_dir, exist_ok=True)
+
+        if 'generate_c_code' in stages:
+            run(f'generate_c_code/{model}', lambda: generate_c_code(model_file, code_dir))
+        if 'generate_python_code' in stages:
+            run(f'generate_python_code/{model}', lambda: return_generated_python_code(model_file))
+
+        uncertainties = _uncertainties(size, args.parameters)
+        if 'sample_sbml' in stages:
+            def sample_sbml():
+                from cellsolvertools.define_parameter_uncertainties import create_model_from_config
+                from cellsolvertools.evaluate_sbml_model_initial_values import evaluate_model_samples
+                evaluate_model_samples(create_model_from_config(uncertainties), args.samples)
+            run(f'sample_sbml/{model}', sample_sbml, per=args.samples)
+        if 'sample_numpy' in stages:
+            run(f'sample_numpy/{model}', lambda: sample_parameter_uncertainties(uncertainties, args.samples, seed=1), per=args.samples)
+
+        application_config = None
+        if {'build', 'solve'} & set(stages):
+            if args.sundials_dir is None:
+                for stage in ['build', 'solve']:
+                    if stage in stages:
+                        results[f'{stage}/{model}'] = {'skipped': 'no SUNDIALS, give --sundials-dir'}
+            else:
+                build_dir = os.path.join(work_dir, model, 'build')
+                built = []
+                if 'build' in stages:
+                    run(f'build/{model}', lambda: built.append(_build(model_file, build_dir, args.sundials_dir)), repeats=args.build_repeats, trace=False)
+                else:
+                    try:
+                        built.append(_build(model_file, build_dir, args.sundials_dir))
+                    except Skipped as e:
+                        results[f'solve/{model}'] = {'skipped': str(e)}
+                application_config = built[-1] if built else None
+
+        if 'solve' in stages and application_config is not None:
+            for chunk_size in [1, default_chunk_size(args.trials, args.workers)]:
+                for output_format in ['csv', 'binary']:
+                    simulation_dir = os.path.join(work_dir, model, f'solve-{chunk_size}-{output_format}')
+
+                    def solve():
+                        shutil.rmtree(simulation_dir, ignore_errors=True)
+                        os.makedirs(simulation_dir)
+                        entry_point({'num_trials': args.trials, 'workers': args.workers, 'chunk_size': chunk_size, 'output_format': output_format,
+                                     'report_interval': None, 'application': {**application_config, 'simulation_dir': simulation_dir},
+                                     'uncertainties': {'main.k_1': {'distribution': 'uniform', 'p1': 0.5, 'p2': 1.5}},
+                                     'simulation': {'StartingPoint': 0.0, 'EndingPoint': 10.0, 'PointInterval': 0.1}})
+                    run(f'solve/{model}/chunk_{chunk_size}/{output_format}', solve, trace=False, per=args.trials)
+
+        if 'solve_numpy' in stages:
+            simulation_dir = os.path.join(work_dir, model, 'solve-numpy')
+
+            def solve_numpy():
+                shutil.rmtree(simulation_dir, ignore_errors=True)
+                os.makedirs(simulation_dir)
+                entry_point({'num_trials': args.trials, 'workers': args.workers, 'solver_backend': 'numpy', 'model_file': model_file, 'statistics': True,
+                             'report_interval': None, 'application': {'simulation_dir': simulation_dir},
+                             'uncertainties': {'main.k_1': {'distribution': 'uniform', 'p1': 0.5, 'p2': 1.5}},
+                             'simulation': {'StartingPoint': 0.0, 'EndingPoint': 10.0, 'PointInterval': 0.1}})
+            run(f'solve_numpy/{model}', solve_numpy, per=args.trials)
+
+        if {'load_trials', 'load_selected_series'} & set(stages):
+            files = _write_outputs(os.path.join(work_dir, model, 'outputs'), size, args.trials, args.points)
+            columns = [1, size, 3 * size]
+            if 'load_trials' in stages:
+                for output_format in ['csv', 'binary']:
+                    run(f'load_trials/{model}/{output_format}', lambda: load_trials(files[output_format], columns, workers=args.workers), per=args.trials)
+            if 'load_selected_series' in stages:
+                def load_series():
+                    from cellsolvertools.multi_trial_plot import load_selected_series
+                    load_selected_series(files['binary'], [column - 1 for column in columns], args.workers)
+                run(f'load_selected_series/{model}/binary', load_series, trace=False, per=args.trials)
+
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_results(results, baseline, threshold):
+    """
+    Compare the median times of the cases measured in both results.
+    :return: list of (case, baseline median, median, ratio, regressed) tuples.
+    """
+    comparison = []
+    for case, measurement in results.items():
+        before = baseline.get(case, {})
+        if 'median' in measurement and 'median' in before and before['median'] > 0:
+            ratio = measurement['median'] / before['median']
+            comparison.append((case, before['median'], measurement['median'], ratio, ratio > 1.0 + threshold))
+
+    return comparison
+
+
+def process_arguments():
+    parser = argparse.ArgumentParser(description="Benchmark every stage of the pipeline on synthetic models.")
+    parser.add_argument('--sizes', nargs='+', type=int, default=BUNDLED_SIZES,
+                        help=f'compartments in the synthetic models (default: {BUNDLED_SIZES})')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=None,
+                        help='stages to benchmark (default: all)')
+    parser.add_argument('--repeats', default=5, type=int,
+                        help='timed repeats of each case (default: 5)')
+    parser.add_argument('--build-repeats', default=1, type=int,
+                        help='timed repeats of each build (default: 1)')
+    parser.add_argument('--trials', default=200, type=int,
+                        help='trials solved and loaded (default: 200)')
+    parser.add_argument('--points', default=1000, type=int,
+                        help='time points in each synthetic trial output (default: 1000)')
+    parser.add_argument('--samples', default=1000, type=int,
+                        help='samples drawn by the sampling stages (default: 1000)')
+    parser.add_argument('--parameters', default=20, type=int,
+                        help='largest number of uncertain parameters sampled (default: 20)')
+    parser.add_argument('--workers', default=os.cpu_count(), type=int,
+                        help='workers for solving and loading (default: CPU count)')
+    parser.add_argument('--sundials-dir', default=os.environ.get('SIMULATION_SUNDIALS_DIR'),
+                        help='the SUNDIALS CMake config directory (default: $SIMULATION_SUNDIALS_DIR)')
+    parser.add_argument('--output', default='benchmark-results.json',
+                        help='file to write the results to (default: benchmark-results.json)')
+    parser.add_argument('--compare', default=None,
+                        help='results of an earlier run to compare against')
+    parser.add_argument('--threshold', default=0.2, type=float,
+                        help='slow down, as a fraction of the earlier median, counted as a regression (default: 0.2)')
+
+    return parser
+
+
+def main():
+    parser = process_arguments()
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='cellsolvertools-benchmarks-')
+    try:
+        results = run_benchmarks(args, work_dir)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        'format_version': RESULTS_FORMAT_VERSION,
+        'commit': _git_commit(),
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'libcellml': libcellml.versionString(),
+        'numpy': np.__version__,
+        'settings': {k: v for k, v in vars(args).items() if k not in ['output', 'compare', 'threshold']},
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    for case, measurement in results.items():
+        if 'skipped' in measurement:
+            print(f'{case:60} skipped, {measurement["skipped"]}')
+        else:
+            print(f'{case:60} {measurement["median"]:10.4f} s')
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        comparison = compare_results(results, baseline['results'], args.threshold)
+        print(f'\nCompared with {baseline.get("commit") or args.compare}:')
+        if baseline.get('settings') != report['settings']:
+            print('The settings differ from those of the earlier run, not every case compares like with like.')
+        for case, before, after, ratio, regressed in comparison:
+            print(f'{case:60} {before:10.4f} s -> {after:10.4f} s  x{ratio:.2f}{"  REGRESSION" if regressed else ""}')
+        if any(regressed for *_, regressed in comparison):
+            sys.exit(3)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Synthetic CellML models of scalable size for the benchmarks.
+
+A chain model of size N moves a quantity along a chain of N compartments,
+each compartment having a state x_i, a rate constant k_i and a flux
+a_i = k_i x_i:
+
+  dx_1/dt = -a_1
+  dx_i/dt = a_(i-1) - a_i
+
+so the model has N states, N constants and N algebraic variables, and its
+solution stays smooth whatever its size.  The models of the sizes used by
+default are kept in the models directory.
+"""
+import argparse
+import os
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+MODELS_DIR = os.path.join(here, 'models')
+BUNDLED_SIZES = [10, 100]
+
+_MATHML = 'http://www.w3.org/1998/Math/MathML'
+_CELLML = 'http://www.cellml.org/cellml/2.0#'
+
+
+def chain_model_name(size):
+    return f'chain_{size}'
+
+
+def chain_model(size):
+    """
+    :return: the CellML 2.0 text of the chain model with size compartments.
+    """
+    variables = ['    <variable name="t" units="dimensionless" interface="public_and_private"/>']
+    equations = []
+    for i in range(1, size + 1):
+        variables.append(f'    <variable name="x_{i}" units="dimensionless" initial_value="{1.0 if i == 1 else 0.0}"/>')
+        variables.append(f'    <variable name="k_{i}" units="dimensionless" initial_value="{0.5 + 0.5 * i / size:.6g}"/>')
+        variables.append(f'    <variable name="a_{i}" units="dimensionless"/>')
+        equations.append(f'      <apply><eq/><ci>a_{i}</ci><apply><times/><ci>k_{i}</ci><ci>x_{i}</ci></apply></apply>')
+        rate = f'<apply><minus/><ci>a_{i}</ci></apply>' if i == 1 else f'<apply><minus/><ci>a_{i - 1}</ci><ci>a_{i}</ci></apply>'
+        equations.append(f'      <apply><eq/><apply><diff/><bvar><ci>t</ci></bvar><ci>x_{i}</ci></apply>{rate}</apply>')
+
+    return '\n'.join([
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        f'<model xmlns="{_CELLML}" name="{chain_model_name(size)}">',
+        '  <component name="main">',
+        *variables,
+        f'    <math xmlns="{_MATHML}">',
+        *equations,
+        '    </math>',
+        '  </component>',
+        '</model>',
+        '',
+    ])
+
+
+def chain_model_file(size, directory=MODELS_DIR):
+    """
+    The file of the chain model with size compartments, written to directory if it is not there yet.
+    """
+    filename = os.path.join(directory, f'{chain_model_name(size)}.cellml')
+    if not os.path.isfile(filename):
+        os.makedirs(directory, exist_ok=True)
+        with open(filename, 'w') as f:
+            f.write(chain_model(size))
+
+    return filename
+
+
+def process_arguments():
+    parser = argparse.ArgumentParser(description="Write synthetic chain models for the benchmarks.")
+    parser.add_argument('sizes', nargs='*', type=int, default=BUNDLED_SIZES,
+                        help=f'number of compartments of each model (default: {BUNDLED_SIZES})')
+    parser.add_argument('--directory', default=MODELS_DIR,
+                        help='directory to write the models to (default: the bundled models directory)')
+
+    return parser
+
+
+def main():
+    parser = process_arguments()
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        print(chain_model_file(size, args.directory))
+
+
+if __name__ == '__main__':
+    main()
@@ -31,14 +31,17 @@ setup(
     author='Hugh Sorby',
     author_email='h.sorby@auckland.ac.nz',
     description='A collection of scripts to enhance the usage of Cell Solver.',
-    install_requires=['matplotlib', 'cellsolver', 'libcellml', 'pandas', 'plotly'],
+    install_requires=['matplotlib', 'cellsolver', 'libcellml', 'numpy', 'pandas', 'plotly', 'scipy'],
     entry_points={
         'console_scripts': ['cellsolver-multi-process=cellsolvertools.multi_processing_script:main',
                             'cellsolver-sensitivity-plot=cellsolvertools.multi_trial_plot:main',
                             'simple-sundials-solver-manager=cellsolvertools.simple_sundials_solver_manager:main',
                             'define-parameter-uncertainties=cellsolvertools.define_parameter_uncertainties:main',
-                            'simulate-sbml-model=cellsolvertools.simulate_sbml_model:main',
+                            'sample-parameter-uncertainties=cellsolvertools.sample_parameter_uncertainties:main',
+                            'simulate-sbml-model=cellsolvertools.evaluate_sbml_model_initial_values:main',
                             'simulate-pipeline=cellsolvertools.pipeline:main',
+                            'cellsolver-work-broker=cellsolvertools.work_queue:main',
+                            'cellsolver-worker=cellsolvertools.worker_agent:main',
                             ],
     }
 )
@@ -0,0 +1,124 @@
+"""
+Adaptive stopping of Monte Carlo campaigns.
+
+A campaign with an 'adaptive' entry in its config runs its trials in waves
+and stops as soon as the confidence intervals of selected outputs are narrow
+enough, 'num_trials' becoming the trial budget.  The adaptive config holds:
+
+  targets             list of the outputs followed, each either
+                        {"variable": "membrane.v", "times": [100.0, 250.0]}
+                      for the values at the output points nearest the given
+                      times, or
+                        {"variable": "membrane.v", "reduce": "max"}
+                      for a scalar biomarker, one of REDUCTIONS
+  quantities          estimates whose intervals must converge, any of
+                      'mean' and 'std' (default: both)
+  tolerance           largest interval half width relative to its estimate
+                      (default: 0.01)
+  absolute_tolerance  largest interval half width whatever the estimate
+                      (default: 0)
+  confidence          confidence level of the intervals (default: 0.95)
+  min_trials          trials run before stopping is considered (default: 30)
+  wave_size           trials launched in each wave (default: a tenth of the
+                      budget, at least the number of workers)
+"""
+import numpy as np
+
+from cellsolvertools.ensemble_statistics import confidence_half_widths, create_statistics, update_statistics
+
+REDUCTIONS = {'min': np.min, 'max': np.max, 'mean': np.mean, 'final': lambda values: values[-1]}
+QUANTITIES = ['mean', 'std']
+
+
+class AdaptiveStoppingError(Exception):
+    pass
+
+
+def target_selection(targets, time, column_info):
+    """
+    Resolve the targets against the columns and output points of the trial outputs.
+    :param targets: list of target dicts, see the module documentation.
+    :param time: the output points, the first column of a trial output.
+    :param column_info: list of dicts with keys ['component', 'name', ...], one per column.
+    :return: list of (column, reduction, point indices) tuples, reduction being None for targets at given times.
+    """
+    columns = {f"{c['component']}.{c['name']}": index for index, c in enumerate(column_info)}
+    selection = []
+    for target in targets:
+        if target['variable'] not in columns:
+            raise AdaptiveStoppingError(f'Target variable "{target["variable"]}" is not in the trial output.')
+        reduction = target.get('reduce')
+        if reduction is not None and reduction not in REDUCTIONS:
+            raise AdaptiveStoppingError(f'Unknown reduction "{reduction}", expected one of {list(REDUCTIONS)}.')
+        indices = None
+        if reduction is None:
+            if not target.get('times'):
+                raise AdaptiveStoppingError(f'Target "{target["variable"]}" needs either times or a reduction.')
+            indices = np.abs(np.asarray(time)[:, np.newaxis] - np.asarray(target['times'], dtype=np.float64)).argmin(axis=0)
+        selection.append((columns[target['variable']], reduction, indices))
+
+    return selection
+
+
+def target_values(selection, data):
+    """
+    The values of the targets for one trial.
+    :param selection: as given by target_selection.
+    :param data: trial output of shape (time, variables).
+    :return: 1-D array of the target values.
+    """
+    values = []
+    for column, reduction, indices in selection:
+        if reduction is None:
+            values.extend(data[indices, column])
+        else:
+            values.append(REDUCTIONS[reduction](data[:, column]))
+
+    return np.array(values, dtype=np.float64)
+
+
+def convergence(statistics, adaptive_config):
+    """
+    How far the targets are from converging.
+    :param statistics: statistics dict of the target values, None before any trial is in.
+    :param adaptive_config: the adaptive config.
+    :return: dict with keys ['count', 'worst', 'converged'], worst being the largest ratio of an
+    interval half width to its tolerance, the targets having converged once it is at most one.
+    """
+    if statistics is None:
+        return {'count': 0, 'worst': np.inf, 'converged': False}
+
+    summary = {'mean': statistics['mean'], 'std': np.sqrt(statistics['m2'] / max(int(statistics['count']) - 1, 1))}
+    half_widths = confidence_half_widths(statistics, adaptive_config.get('confidence', 0.95))
+    worst = 0.0
+    for quantity in adaptive_config.get('quantities', QUANTITIES):
+        allowed = np.maximum(adaptive_config.get('tolerance', 0.01) * np.abs(summary[quantity]), adaptive_config.get('absolute_tolerance', 0.0))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratios = np.where(half_widths[quantity] == 0.0, 0.0, half_widths[quantity] / allowed)
+        # Targets that are not finite never converge.
+        ratios[~np.isfinite(ratios)] = np.inf
+        worst = max(worst, float(ratios.max()))
+
+    count = int(statistics['count'])
+    return {'count': count, 'worst': worst, 'converged': count >= adaptive_config.get('min_trials', 30) and worst <= 1.0}
+
+
+def convergence_handler(adaptive_config):
+    """
+    Trial output handler following the targets of an adaptive campaign.
+    :return: tuple of the handler and a function returning the current convergence, see convergence.
+    """
+    state = {'selection': None, 'statistics': None}
+
+    def handler(trial_index, data, column_info):
+        if state['selection'] is None:
+            state['selection'] = target_selection(adaptive_config['targets'], data[:, 0], column_info)
+        values = target_values(state['selection'], data)
+        if state['statistics'] is None:
+            state['statistics'] = create_statistics(1, len(values), quantiles=[])
+        update_statistics(state['statistics'], values[np.newaxis, :])
+
+    def current():
+        return convergence(state['statistics'], adaptive_config)
+
+    return handler, current
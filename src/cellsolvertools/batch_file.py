@@ -0,0 +1,93 @@
+"""
+Batch files of trials for the siss-batch driver, and the tasks describing them for worker agents.
+
+A batch file holds the solver settings, the output format and the
+parameter values of a block of trials, see the layout in the generated
+batch_driver.c.
+"""
+import struct
+
+import numpy as np
+
+BATCH_FILE_HEADER = struct.Struct('=8sQQQddddddqiiii')
+INTEGRATION_METHODS = {'BDF': 0, 'Adams': 1}
+ITERATION_TYPES = {'Newton': 0, 'Functional': 1}
+OUTPUT_FORMATS = {('csv', 'float64'): 0, ('binary', 'float64'): 1, ('binary', 'float32'): 2}
+COMPRESSED_OUTPUT_FORMATS = {('binary', 'float64'): 3, ('binary', 'float32'): 4}
+
+
+class SimulationConfigurationError(Exception):
+    pass
+
+
+def solver_settings(solver_config, simulation_config):
+    """
+    The settings of the batch solver, the fields of SolverSettings in the generated batch_solver.h, in order.
+    :return: dict of field name to value.
+    """
+    if solver_config.get('LinearSolver', 'Dense') != 'Dense':
+        raise SimulationConfigurationError(f'The batch solver only supports the Dense linear solver, not {solver_config["LinearSolver"]}.')
+    try:
+        integration_method = INTEGRATION_METHODS[solver_config.get('IntegrationMethod', 'BDF')]
+        iteration_type = ITERATION_TYPES[solver_config.get('IterationType', 'Newton')]
+    except KeyError as e:
+        raise SimulationConfigurationError(f'Unsupported solver setting {e}.')
+
+    return {
+        'startingPoint': simulation_config['StartingPoint'],
+        'endingPoint': simulation_config['EndingPoint'],
+        'pointInterval': simulation_config['PointInterval'],
+        'relativeTolerance': solver_config.get('RelativeTolerance', 1e-07),
+        'absoluteTolerance': solver_config.get('AbsoluteTolerance', 1e-07),
+        'maximumStep': solver_config.get('MaximumStep', 0.0),
+        'maximumNumberOfSteps': solver_config.get('MaximumNumberOfSteps', 500),
+        'integrationMethod': integration_method,
+        'iterationType': iteration_type,
+        'interpolateSolution': 1 if solver_config.get('InterpolateSolution', True) else 0,
+    }
+
+
+def _batch_header(first_trial, samples, solver_config, simulation_config, output_format, output_dtype, compress_output):
+    settings = solver_settings(solver_config, simulation_config)
+    output_formats = COMPRESSED_OUTPUT_FORMATS if compress_output else OUTPUT_FORMATS
+    if (output_format, output_dtype) not in output_formats:
+        raise SimulationConfigurationError(f'Unsupported output format {output_format} ({output_dtype}{", compressed" if compress_output else ""}).')
+
+    return BATCH_FILE_HEADER.pack(b'SISSBAT1', first_trial, samples.shape[0], samples.shape[1], *settings.values(), output_formats[(output_format, output_dtype)])
+
+
+def write_batch_file(batch_file_name, first_trial, samples, solver_config, simulation_config, output_format='csv', output_dtype='float64', compress_output=False):
+    """
+    Write a block of trials, one parameter vector per row of samples, for the siss-batch driver.
+    The output format is either 'csv' or 'binary', binary output can be stored as float64 or float32
+    and compressed in chunks with zlib.
+    """
+    samples = np.ascontiguousarray(samples, dtype=np.float64)
+    header = _batch_header(first_trial, samples, solver_config, simulation_config, output_format, output_dtype, compress_output)
+    with open(batch_file_name, 'wb') as f:
+        f.write(header)
+        f.write(samples.tobytes())
+
+
+def batch_task(index, first_trial, samples, build_key, solver_config, simulation_config, output_file_pattern, output_format='csv', output_dtype='float64',
+               compress_output=False, reply_to='results'):
+    """
+    Describe a block of trials for a worker agent, the agent runs the siss-batch built
+    under build_key in its build cache and answers on the reply_to queue.
+    """
+    samples = np.ascontiguousarray(samples, dtype=np.float64)
+    _batch_header(first_trial, samples, solver_config, simulation_config, output_format, output_dtype, compress_output)
+    return {
+        'index': index,
+        'first_trial': first_trial,
+        'trial_count': samples.shape[0],
+        'samples': samples.tolist(),
+        'build': build_key,
+        'solver': solver_config,
+        'simulation': simulation_config,
+        'output_file_pattern': output_file_pattern,
+        'output_format': output_format,
+        'output_dtype': output_dtype,
+        'compress_output': compress_output,
+        'reply_to': reply_to,
+    }
@@ -0,0 +1,295 @@
+"""
+Solve many trials of a model at once with NumPy, in this process.
+
+The Python code libCellML generates for a model is run with every state
+and variable holding an array over the trials instead of a number, so one
+call of compute_rates gives the rates of all the trials.  Each trial takes
+its external variable values from its own row of the samples.  No C code
+is compiled, no solver process is started and no file is written per trial.
+
+The trials are integrated together with the explicit Dormand-Prince 5(4)
+method, taking steps shared by all the trials and sized by the largest
+error among them.  As with CVODE, MaximumNumberOfSteps limits the steps
+between two output points.  A trial whose error stays too large at the
+smallest step size fails on its own and the other trials carry on.  An
+explicit method suits non-stiff models, stiff models are better solved by
+the compiled solver with its BDF method.
+
+Models with algebraic loops, which need a non-linear solver, are not supported.
+"""
+import sys
+import time
+
+import numpy as np
+
+from cellsolvertools import tracing
+from cellsolvertools.trial_scheduler import report_progress
+
+# Flags of failed trials, the CVODE flags the compiled solver reports for the same failures.
+TOO_MUCH_WORK = -1
+ERROR_FAILURE = -3
+
+# The outputs of a block of trials are kept in memory, blocks are sized to keep them below this many bytes.
+DEFAULT_BLOCK_BYTES = 2 ** 28
+
+_NUMPY_FUNCTIONS = {
+    'exp': np.exp, 'log': np.log, 'log10': np.log10, 'sqrt': np.sqrt, 'pow': np.power, 'fabs': np.fabs,
+    'floor': np.floor, 'ceil': np.ceil, 'fmod': np.fmod, 'min': np.minimum, 'max': np.maximum, 'where': np.where,
+    'sin': np.sin, 'cos': np.cos, 'tan': np.tan, 'asin': np.arcsin, 'acos': np.arccos, 'atan': np.arctan,
+    'sinh': np.sinh, 'cosh': np.cosh, 'tanh': np.tanh, 'asinh': np.arcsinh, 'acosh': np.arccosh, 'atanh': np.arctanh,
+    'eq_func': lambda x, y: np.equal(x, y) * 1.0,
+    'neq_func': lambda x, y: np.not_equal(x, y) * 1.0,
+    'lt_func': lambda x, y: np.less(x, y) * 1.0,
+    'leq_func': lambda x, y: np.less_equal(x, y) * 1.0,
+    'gt_func': lambda x, y: np.greater(x, y) * 1.0,
+    'geq_func': lambda x, y: np.greater_equal(x, y) * 1.0,
+    'and_func': lambda x, y: np.logical_and(x, y) * 1.0,
+    'or_func': lambda x, y: np.logical_or(x, y) * 1.0,
+    'xor_func': lambda x, y: np.logical_xor(x, y) * 1.0,
+    'not_func': lambda x: np.logical_not(x) * 1.0,
+}
+
+# Dormand-Prince 5(4) tableau, _E being the difference between the fifth and fourth order weights.
+_C = [0.0, 1.0 / 5.0, 3.0 / 10.0, 4.0 / 5.0, 8.0 / 9.0, 1.0, 1.0]
+_A = [
+    [],
+    [1.0 / 5.0],
+    [3.0 / 40.0, 9.0 / 40.0],
+    [44.0 / 45.0, -56.0 / 15.0, 32.0 / 9.0],
+    [19372.0 / 6561.0, -25360.0 / 2187.0, 64448.0 / 6561.0, -212.0 / 729.0],
+    [9017.0 / 3168.0, -355.0 / 33.0, 46732.0 / 5247.0, 49.0 / 176.0, -5103.0 / 18656.0],
+    [35.0 / 384.0, 0.0, 500.0 / 1113.0, 125.0 / 192.0, -2187.0 / 6784.0, 11.0 / 84.0],
+]
+_E = [71.0 / 57600.0, 0.0, -71.0 / 16695.0, 71.0 / 1920.0, -17253.0 / 339200.0, 22.0 / 525.0, -1.0 / 40.0]
+
+
+class BatchedSolverError(Exception):
+    pass
+
+
+def load_batched_model(model_file, external_variables=None):
+    """
+    Generate the vectorised Python code of a model and load it.
+    :param external_variables: optional list of 'component.name' variables set from the samples, in the order of the samples' columns.
+    :return: dict with keys ['name', 'functions', 'state_count', 'variable_count', 'external_indices', 'column_info'],
+    column_info describing the output columns, the variable of integration, the states and the variables.
+    """
+    from cellsolvertools.generate_code import analyse_model, analysed_model_metadata, generated_python_code
+
+    analysis = analyse_model(model_file, external_variables)
+    code = generated_python_code(analysis, vectorised=True)
+    if 'nla_solve' in code:
+        raise BatchedSolverError(f'Model "{analysis["name"]}" has algebraic loops, the batched solver cannot solve them.')
+
+    metadata = analysed_model_metadata(analysis)
+    if metadata['voi_info'] is None:
+        raise BatchedSolverError(f'Model "{analysis["name"]}" has no differential equations to solve.')
+
+    functions = {}
+    exec(compile(code, f'<{analysis["name"]}>', 'exec'), functions)
+    # The generated functions look these names up when called, so they evaluate arrays from now on.
+    functions.update(_NUMPY_FUNCTIONS)
+
+    return {
+        'name': analysis['name'],
+        'functions': functions,
+        'state_count': len(metadata['state_info']),
+        'variable_count': len(metadata['variable_info']),
+        'external_indices': [info['index'] for info in analysis['external_variable_info']],
+        'column_info': [metadata['voi_info'], *metadata['state_info'], *metadata['variable_info']],
+    }
+
+
+def output_point_count(simulation_config):
+    """
+    Number of output points, counted as the compiled solver counts them.
+    """
+    return int(np.floor((simulation_config['EndingPoint'] - simulation_config['StartingPoint']) / simulation_config['PointInterval'] + 1.0e-9)) + 1
+
+
+def block_size(model, simulation_config, block_bytes=DEFAULT_BLOCK_BYTES):
+    """
+    Number of trials to solve together so that their outputs take at most block_bytes.
+    """
+    return max(1, block_bytes // (8 * output_point_count(simulation_config) * len(model['column_info'])))
+
+
+def _error_norms(error, scale):
+    """
+    Root mean square of each trial's scaled error, infinite where it is not finite.
+    """
+    if error.shape[0] == 0:
+        return np.zeros(error.shape[1])
+
+    norms = np.sqrt(np.mean(np.square(error / scale), axis=0))
+    norms[~np.isfinite(norms)] = np.inf
+    return norms
+
+
+def _initial_step(states, rates, relative_tolerance, absolute_tolerance):
+    """
+    Starting step size from the size of the states and their rates, as suggested by Hairer, Norsett and Wanner.
+    """
+    scale = absolute_tolerance + relative_tolerance * np.abs(states)
+    d0 = np.max(_error_norms(states, scale), initial=0.0)
+    d1 = np.max(_error_norms(rates, scale), initial=0.0)
+    if not np.isfinite(d0 * d1) or d0 < 1.0e-5 or d1 < 1.0e-5:
+        return 1.0e-6
+
+    return 0.01 * d0 / d1
+
+
+def solve_trials(model, samples, simulation_config, solver_config=None):
+    """
+    Solve a block of trials together.
+    :param model: model loaded by load_batched_model.
+    :param samples: array of shape (trials, external variables), the parameter values of each trial.
+    :param simulation_config: dict with keys ['StartingPoint', 'EndingPoint', 'PointInterval'].
+    :param solver_config: optional dict with the keys 'RelativeTolerance', 'AbsoluteTolerance',
+    'MaximumStep' and 'MaximumNumberOfSteps' of the compiled solver's config, other keys are ignored.
+    :return: tuple of the outputs, an array of shape (trials, points, columns) that is NaN from where
+    a trial failed, and an array with the flag of every trial, 0 for the trials that succeeded.
+    """
+    solver_config = {} if solver_config is None else solver_config
+    relative_tolerance = solver_config.get('RelativeTolerance', 1e-07)
+    absolute_tolerance = solver_config.get('AbsoluteTolerance', 1e-07)
+    maximum_step = solver_config.get('MaximumStep', 0.0)
+    maximum_steps = solver_config.get('MaximumNumberOfSteps', 500)
+
+    samples = np.asarray(samples, dtype=np.float64)
+    trial_count = samples.shape[0]
+    samples = samples.reshape(trial_count, -1)
+    external_indices = model['external_indices']
+    if samples.shape[1] != len(external_indices):
+        raise BatchedSolverError(f'Expected {len(external_indices)} parameters per trial, the samples have {samples.shape[1]}.')
+
+    functions = model['functions']
+    state_count = model['state_count']
+    outputs = np.full((trial_count, output_point_count(simulation_config), len(model['column_info'])), np.nan)
+    flags = np.zeros(trial_count, dtype=int)
+    block = {
+        'active': np.arange(trial_count),
+        'parameters': dict(zip(external_indices, samples.T)),
+        'rates': np.full((state_count, trial_count), np.nan),
+        'variables': np.full((model['variable_count'], trial_count), np.nan),
+    }
+
+    def external_variable(voi, states, rates, variables, index):
+        return block['parameters'][index]
+
+    external_arguments = (external_variable,) if external_indices else ()
+
+    def compute_rates(voi, states):
+        functions['compute_rates'](voi, states, block['rates'], block['variables'], *external_arguments)
+        return block['rates'].copy()
+
+    def store(point, voi, states):
+        functions['compute_rates'](voi, states, block['rates'], block['variables'], *external_arguments)
+        functions['compute_variables'](voi, states, block['rates'], block['variables'], *external_arguments)
+        outputs[block['active'], point, 0] = voi
+        outputs[block['active'], point, 1:1 + state_count] = states.T
+        outputs[block['active'], point, 1 + state_count:] = block['variables'].T
+
+    def drop(failing, flag):
+        flags[block['active'][failing]] = flag
+        keep = ~failing
+        block['active'] = block['active'][keep]
+        block['parameters'] = {index: values[keep] for index, values in block['parameters'].items()}
+        block['rates'] = block['rates'][:, keep]
+        block['variables'] = block['variables'][:, keep]
+        return keep
+
+    voi = simulation_config['StartingPoint']
+    states = np.full((state_count, trial_count), np.nan)
+    with np.errstate(all='ignore'):
+        if external_indices:
+            functions['initialise_variables'](voi, states, block['rates'], block['variables'], external_variable)
+        else:
+            functions['initialise_variables'](states, block['rates'], block['variables'])
+        functions['compute_computed_constants'](block['variables'])
+        store(0, voi, states)
+
+        k = [compute_rates(voi, states)] + [None] * 6
+        step = _initial_step(states, k[0], relative_tolerance, absolute_tolerance)
+        for point in range(1, outputs.shape[1]):
+            target = simulation_config['StartingPoint'] + point * simulation_config['PointInterval']
+            steps = 0
+            while voi < target and block['active'].size:
+                if steps >= maximum_steps:
+                    drop(np.ones(block['active'].size, dtype=bool), TOO_MUCH_WORK)
+                    break
+
+                if maximum_step > 0.0:
+                    step = min(step, maximum_step)
+                truncated = step >= target - voi
+                h = target - voi if truncated else step
+                for stage in range(1, 7):
+                    increment = sum(a * k[i] for i, a in enumerate(_A[stage]) if a != 0.0)
+                    k[stage] = compute_rates(voi + _C[stage] * h, states + h * increment)
+                new_states = states + h * sum(a * k[i] for i, a in enumerate(_A[6]) if a != 0.0)
+                error = h * sum(e * k[i] for i, e in enumerate(_E) if e != 0.0)
+                norms = _error_norms(error, absolute_tolerance + relative_tolerance * np.maximum(np.abs(states), np.abs(new_states)))
+                worst = np.max(norms)
+
+                if worst <= 1.0:
+                    voi = target if truncated else voi + h
+                    states = new_states
+                    k[0] = k[6]
+                    steps += 1
+                    factor = 10.0 if worst == 0.0 else min(10.0, 0.9 * worst ** -0.2)
+                    step = max(step, h * factor) if truncated else h * factor
+                elif h <= 16.0 * np.spacing(max(abs(voi), abs(target))):
+                    keep = drop(norms > 1.0, ERROR_FAILURE)
+                    states = states[:, keep]
+                    k[0] = k[0][:, keep]
+                else:
+                    step = h * max(0.2, 0.9 * worst ** -0.2)
+
+            if block['active'].size:
+                store(point, voi, states)
+
+    return outputs, flags
+
+
+def solve_trial_blocks(model, samples, indices, simulation_config, solver_config=None, trials_per_block=None, on_complete=None,
+                       report_interval=10.0, stream=sys.stderr):
+    """
+    Solve the trials with the given zero based indices, a block of trials at a time.
+    :param samples: array of shape (all trials, external variables).
+    :param trials_per_block: number of trials solved together, by default as many as block_size() allows.
+    :param on_complete: optional callable given (trial indices, outputs, flags) as each block finishes, see solve_trials.
+    :param report_interval: seconds between throughput reports, None or 0 to stay quiet.
+    :return: summary dict with keys ['completed', 'failed', 'trial_time', 'wall_time'] as given by
+    trial_scheduler.run_trials, failed being the list of the numbers of the trials that failed.
+    """
+    if trials_per_block is None:
+        trials_per_block = block_size(model, simulation_config)
+
+    indices = list(indices)
+    summary = {'completed': 0, 'failed': [], 'trial_time': 0.0, 'wall_time': 0.0}
+    start = time.perf_counter()
+    last_report = start
+    for offset in range(0, len(indices), trials_per_block):
+        block_indices = indices[offset:offset + trials_per_block]
+        block_start = time.perf_counter()
+        with tracing.span('solve_batched', trials=len(block_indices)):
+            outputs, flags = solve_trials(model, samples[block_indices], simulation_config, solver_config)
+        summary['trial_time'] += time.perf_counter() - block_start
+        summary['completed'] += len(block_indices)
+        failed = [index + 1 for index, flag in zip(block_indices, flags) if flag != 0]
+        summary['failed'].extend(failed)
+        if failed:
+            print(f'{len(failed)} of trials {block_indices[0] + 1} to {block_indices[-1] + 1} failed.', file=stream)
+        if on_complete is not None:
+            on_complete(block_indices, outputs, flags)
+
+        if report_interval and time.perf_counter() - last_report >= report_interval:
+            report_progress(summary, start, stream)
+            last_report = time.perf_counter()
+
+    summary['wall_time'] = time.perf_counter() - start
+    if report_interval:
+        report_progress(summary, start, stream)
+
+    return summary
+
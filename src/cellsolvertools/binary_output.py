@@ -0,0 +1,156 @@
+"""
+Binary columnar trial output.
+
+A trial output file holds one column per output variable, the first
+column being the variable of integration, stored column after column so
+that a single variable can be read without touching the rest of the file.
+
+File layout, native byte order:
+
+  char[8]   magic "SISSOUT1"
+  uint32    header size, the offset of the data, a multiple of 64
+  uint32    data type, 0 for float64 and 1 for float32
+  uint64    row (time point) count
+  uint64    column count
+  uint32    compression, 0 for none and 1 for zlib compressed chunks
+  uint32    metadata size
+  char[]    JSON metadata, {"model": ..., "columns": [{"component": ..., "name": ..., "units": ..., "type": ...}, ...]},
+            compressed files add "chunk_rows", zero padded up to the header size
+  data      column count x row count values, or for compressed files a
+            table of column count x chunk count + 1 uint64 offsets (relative
+            to the end of the table) followed by the zlib compressed chunks,
+            column after column, each of at most chunk_rows values
+
+Uncompressed files are memory-mapped so reading them copies nothing.
+"""
+import json
+import os
+import struct
+import zlib
+
+import numpy as np
+
+OUTPUT_FILE_MAGIC = b'SISSOUT1'
+OUTPUT_FILE_EXTENSION = '.bin'
+OUTPUT_FILE_HEADER = struct.Struct('=8sIIQQII')
+OUTPUT_DTYPES = [np.dtype(np.float64), np.dtype(np.float32)]
+HEADER_ALIGNMENT = 64
+# Values in each compressed chunk of a column, the generated batch driver uses the same.
+COMPRESSION_CHUNK_ROWS = 65536
+
+
+class OutputFormatError(Exception):
+    pass
+
+
+def is_output_file(filename):
+    try:
+        with open(filename, 'rb') as f:
+            return f.read(len(OUTPUT_FILE_MAGIC)) == OUTPUT_FILE_MAGIC
+    except (FileNotFoundError, IsADirectoryError):
+        return False
+
+
+def read_output_header(filename):
+    """
+    Read the header of a binary trial output file.
+    :return: dict with keys ['header_size', 'dtype', 'rows', 'columns', 'compression', 'chunk_rows', 'model', 'column_info'],
+    chunk_rows being the number of values in each compressed chunk.
+    """
+    with open(filename, 'rb') as f:
+        fixed = f.read(OUTPUT_FILE_HEADER.size)
+        if len(fixed) != OUTPUT_FILE_HEADER.size:
+            raise OutputFormatError(f'File "{filename}" is too short to be a trial output file.')
+        magic, header_size, dtype_code, rows, columns, compression, metadata_size = OUTPUT_FILE_HEADER.unpack(fixed)
+        if magic != OUTPUT_FILE_MAGIC:
+            raise OutputFormatError(f'File "{filename}" is not a trial output file.')
+        metadata = json.loads(f.read(metadata_size).decode())
+
+    return {
+        'header_size': header_size,
+        'dtype': OUTPUT_DTYPES[dtype_code],
+        'rows': rows,
+        'columns': columns,
+        'compression': compression,
+        'chunk_rows': max(1, metadata.get('chunk_rows', rows)),
+        'model': metadata.get('model', ''),
+        'column_info': metadata['columns'],
+    }
+
+
+def write_output(filename, data, column_info, dtype=np.float64, compress=False, model='', chunk_rows=COMPRESSION_CHUNK_ROWS):
+    """
+    Write a binary trial output file.
+    :param filename: name of the file to write.
+    :param data: array of shape (rows, columns), one row per time point.
+    :param column_info: list of dicts describing each column, with keys ['component', 'name', 'units', 'type'].
+    :param dtype: float64 or float32.
+    :param compress: compress each column with zlib, chunk_rows values at a time.
+    :param model: name of the model the output came from.
+    :param chunk_rows: number of values in each compressed chunk.
+    """
+    dtype = np.dtype(dtype)
+    data = np.asarray(data)
+    rows, columns = data.shape
+    metadata = {'model': model, 'columns': column_info}
+    if compress:
+        metadata['chunk_rows'] = chunk_rows
+    metadata = json.dumps(metadata).encode()
+    header_size = -(-(OUTPUT_FILE_HEADER.size + len(metadata)) // HEADER_ALIGNMENT) * HEADER_ALIGNMENT
+    header = OUTPUT_FILE_HEADER.pack(OUTPUT_FILE_MAGIC, header_size, OUTPUT_DTYPES.index(dtype), rows, columns, 1 if compress else 0, len(metadata)) + metadata
+
+    column_major = np.ascontiguousarray(data.T, dtype=dtype)
+    with open(filename, 'wb') as f:
+        f.write(header.ljust(header_size, b'\0'))
+        if compress:
+            compressed = [zlib.compress(column[start:start + chunk_rows].tobytes(), 1) for column in column_major for start in range(0, rows, chunk_rows)]
+            offsets = np.cumsum([0] + [len(c) for c in compressed], dtype=np.uint64)
+            f.write(offsets.tobytes())
+            for c in compressed:
+                f.write(c)
+        else:
+            f.write(column_major.tobytes())
+
+
+def load_output(filename, columns=None):
+    """
+    Load columns from a binary trial output file.
+    Uncompressed files are memory-mapped, a slice or single column index gives a
+    view into the map, a list of columns reads only those columns.
+    :param filename: name of the file to read.
+    :param columns: None for every column, otherwise an index, slice or list of column indices.
+    :return: tuple of the header dict and an array of shape (selected columns, rows),
+    or (rows,) when columns is a single index.
+    """
+    header = read_output_header(filename)
+    shape = (header['columns'], header['rows'])
+    if columns is None:
+        columns = slice(None)
+
+    if header['compression'] == 0:
+        data = np.memmap(filename, dtype=header['dtype'], mode='r', offset=header['header_size'], shape=shape) if header['rows'] and header['columns'] \
+            else np.empty(shape, dtype=header['dtype'])
+        return header, data[columns]
+
+    chunk_rows = header['chunk_rows']
+    chunk_count = -(-header['rows'] // chunk_rows)
+    with open(filename, 'rb') as f:
+        f.seek(header['header_size'])
+        offsets = np.frombuffer(f.read((header['columns'] * chunk_count + 1) * 8), dtype=np.uint64)
+        table_end = header['header_size'] + len(offsets) * 8
+        indices = np.arange(header['columns'])[columns]
+        selected = np.empty((indices.size, header['rows']), dtype=header['dtype'])
+        for row, index in enumerate(np.atleast_1d(indices)):
+            # A column's chunks follow each other, read them at once.
+            first = index * chunk_count
+            f.seek(table_end + int(offsets[first]))
+            column = f.read(int(offsets[first + chunk_count] - offsets[first]))
+            for chunk in range(chunk_count):
+                start, end = int(offsets[first + chunk] - offsets[first]), int(offsets[first + chunk + 1] - offsets[first])
+                selected[row, chunk * chunk_rows:(chunk + 1) * chunk_rows] = np.frombuffer(zlib.decompress(column[start:end]), dtype=header['dtype'])
+
+    return header, selected[0] if np.ndim(indices) == 0 else selected
+
+
+def trial_output_file_name(directory, trial, binary=False):
+    return os.path.join(directory, f'simulation_output_{trial:05d}{OUTPUT_FILE_EXTENSION if binary else ".csv"}')
@@ -0,0 +1,117 @@
+"""
+Content-addressed cache of built solver executables.
+
+A build is identified by a hash of everything that goes into it: the
+model file, the external variables in the order the trial values are
+given to them, whether a shared library is built, the code generator, the
+libCellML version, the SUNDIALS location and the simple sundials solver
+sources.  Built executables are copied into the cache under that hash,
+so a later run with the same inputs can use them without configuring or
+compiling anything.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+EXECUTABLE_KEYS = ['executable', 'batch_executable']
+# Built only on request, cached when they were.
+OPTIONAL_EXECUTABLE_KEYS = ['solver_library']
+
+
+def _hash_file(h, filename):
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            h.update(block)
+
+
+def _hash_tree(h, directory):
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            filename = os.path.join(root, name)
+            h.update(os.path.relpath(filename, directory).encode())
+            _hash_file(h, filename)
+
+
+def build_cache_key(model_location, code_generation_config, sundials_dir, src_dir):
+    """
+    Hash identifying the build of a model.
+    :param model_location: the CellML model file.
+    :param code_generation_config: the config given to generate_c_code, only the names and order of its external
+    variables and whether it builds a shared library go into the key.
+    :param sundials_dir: the SUNDIALS CMake config directory.
+    :param src_dir: the simple sundials solver source directory.
+    :return: hexadecimal digest.
+    """
+    import libcellml
+
+    from cellsolvertools import generate_code
+
+    h = hashlib.sha256()
+    _hash_file(h, model_location)
+    # The built code reads the trial values in the order of the external variables, their distributions are not built in.
+    external_variables = code_generation_config.get('external_variables')
+    h.update(json.dumps([None if external_variables is None else list(external_variables),
+                         bool(code_generation_config.get('shared_library', False))]).encode())
+    _hash_file(h, generate_code.__file__)
+    h.update(libcellml.versionString().encode())
+    h.update(os.path.abspath(sundials_dir).encode())
+    if os.path.isdir(sundials_dir):
+        _hash_tree(h, sundials_dir)
+    _hash_tree(h, src_dir)
+    return h.hexdigest()
+
+
+def executables_build_key(application_config):
+    """
+    Hash of the built executables themselves, for builds made without the model at hand.
+    """
+    h = hashlib.sha256()
+    for k in EXECUTABLE_KEYS:
+        _hash_file(h, application_config[k])
+    return h.hexdigest()
+
+
+def cached_executables(cache_dir, key):
+    """
+    The cached executables for a build.
+    :return: dict of application config key to executable, or None when the build is not cached.
+    """
+    entry_dir = os.path.join(cache_dir, key)
+    executables = {k: os.path.join(entry_dir, k) for k in EXECUTABLE_KEYS}
+    if not all(os.path.isfile(e) for e in executables.values()):
+        return None
+
+    for k in OPTIONAL_EXECUTABLE_KEYS:
+        if os.path.isfile(os.path.join(entry_dir, k)):
+            executables[k] = os.path.join(entry_dir, k)
+    os.utime(entry_dir)
+    return executables
+
+
+def store_executables(cache_dir, key, application_config):
+    """
+    Copy the executables of a finished build into the cache.
+    The entry is assembled aside and moved into place so a failed or concurrent
+    store never leaves a partial entry behind.
+    :return: dict of application config key to cached executable, or None when the build did not produce every executable.
+    """
+    if not all(os.path.isfile(application_config[k]) for k in EXECUTABLE_KEYS):
+        return None
+
+    os.makedirs(cache_dir, exist_ok=True)
+    staging_dir = tempfile.mkdtemp(dir=cache_dir, prefix='.staging-')
+    for k in EXECUTABLE_KEYS:
+        shutil.copy2(application_config[k], os.path.join(staging_dir, k))
+    for k in OPTIONAL_EXECUTABLE_KEYS:
+        if k in application_config and os.path.isfile(application_config[k]):
+            shutil.copy2(application_config[k], os.path.join(staging_dir, k))
+    try:
+        os.rename(staging_dir, os.path.join(cache_dir, key))
+    except OSError:
+        # Stored by someone else in the meantime.
+        shutil.rmtree(staging_dir)
+
+    return cached_executables(cache_dir, key)
@@ -0,0 +1,158 @@
+"""
+Manifest of a simulation campaign, an SQLite database recording every trial.
+
+For each trial, numbered from one as in the output file names, the manifest
+keeps the parameter vector, the sampling seed, the status ('pending',
+'completed' or 'failed'), the exit code of the last attempt, the number of
+attempts, and the output file with its SHA-256 checksum.  The parameter
+ids are stored with the campaign so an interrupted campaign can be resumed
+with exactly the same parameter vectors, running only the trials that are
+not completed.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+
+import numpy as np
+
+MANIFEST_FILE = 'campaign.sqlite'
+TRIAL_STATUSES = ['pending', 'completed', 'failed']
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS campaign (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS trials (
+  trial INTEGER PRIMARY KEY,
+  parameters TEXT NOT NULL,
+  seed INTEGER,
+  status TEXT NOT NULL DEFAULT 'pending',
+  exit_code INTEGER,
+  attempts INTEGER NOT NULL DEFAULT 0,
+  output TEXT,
+  checksum TEXT
+);
+"""
+
+
+class CampaignManifestError(Exception):
+    pass
+
+
+def file_checksum(filename):
+    h = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _connect(filename):
+    # The trial scheduler records finished trials from its callback thread, never two threads at once.
+    connection = sqlite3.connect(filename, check_same_thread=False)
+    # Every finished trial is committed, keep that cheap.
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    connection.executescript(_SCHEMA)
+    return connection
+
+
+def create_manifest(filename, parameter_ids, samples, seed=None, outputs=None):
+    """
+    Create the manifest of a new campaign, replacing any existing one.
+    :param parameter_ids: ids of the sampled parameters.
+    :param samples: array of shape (trials, parameters).
+    :param seed: the seed the samples were drawn with, None if unknown.
+    :param outputs: optional list of the output file of every trial.
+    :return: open manifest.
+    """
+    for suffix in ['', '-wal', '-shm']:
+        if os.path.isfile(filename + suffix):
+            os.remove(filename + suffix)
+
+    connection = _connect(filename)
+    samples = np.asarray(samples, dtype=np.float64)
+    with connection:
+        connection.executemany('INSERT INTO campaign VALUES (?, ?)', [('parameter_ids', json.dumps(list(parameter_ids))),
+                                                                      ('seed', json.dumps(seed))])
+        connection.executemany('INSERT INTO trials (trial, parameters, seed, output) VALUES (?, ?, ?, ?)',
+                               ((index + 1, json.dumps(row), seed, None if outputs is None else outputs[index])
+                                for index, row in enumerate(samples.tolist())))
+
+    return connection
+
+
+def open_manifest(filename):
+    if not os.path.isfile(filename):
+        raise CampaignManifestError(f'No campaign manifest "{filename}".')
+
+    return _connect(filename)
+
+
+def manifest_samples(manifest):
+    """
+    The parameter ids and samples of the campaign.
+    :return: tuple of the list of parameter ids and a trials x parameters array.
+    """
+    parameter_ids = json.loads(manifest.execute("SELECT value FROM campaign WHERE key = 'parameter_ids'").fetchone()[0])
+    rows = [json.loads(parameters) for parameters, in manifest.execute('SELECT parameters FROM trials ORDER BY trial')]
+    return parameter_ids, np.array(rows, dtype=np.float64).reshape(len(rows), len(parameter_ids))
+
+
+def incomplete_trials(manifest):
+    """
+    Trials that still need running, those not completed and those whose output file has gone missing.
+    :return: sorted list of trial numbers.
+    """
+    trials = []
+    for trial, status, output in manifest.execute('SELECT trial, status, output FROM trials ORDER BY trial'):
+        if status != 'completed' or (output is not None and not os.path.isfile(output)):
+            trials.append(trial)
+
+    return trials
+
+
+def completed_trials(manifest):
+    """
+    :return: sorted list of the numbers of the completed trials.
+    """
+    return [trial for trial, in manifest.execute("SELECT trial FROM trials WHERE status = 'completed' ORDER BY trial")]
+
+
+def completed_outputs(manifest):
+    """
+    :return: list of (trial number, output file name) tuples of the completed trials whose output is still there.
+    """
+    return [(trial, output) for trial, output in manifest.execute("SELECT trial, output FROM trials WHERE status = 'completed' ORDER BY trial")
+            if output is not None and os.path.isfile(output)]
+
+
+def record_trials(manifest, outcomes):
+    """
+    Record the outcome of finished trials, checksumming the output of completed ones.
+    A trial is completed when it exited cleanly and left its output file behind, or
+    exited cleanly without an output file when its results went straight to the handlers.
+    :param outcomes: iterable of (trial number, exit code, output file name or None) tuples.
+    :return: list of the numbers of the trials that failed.
+    """
+    updates = []
+    failed = []
+    for trial, exit_code, output in outcomes:
+        completed = exit_code == 0 and (output is None or os.path.isfile(output))
+        checksum = file_checksum(output) if completed and output is not None else None
+        updates.append(('completed' if completed else 'failed', exit_code, output, checksum, trial))
+        if not completed:
+            failed.append(trial)
+
+    with manifest:
+        manifest.executemany('UPDATE trials SET status = ?, exit_code = ?, attempts = attempts + 1, output = ?, checksum = ? WHERE trial = ?', updates)
+
+    return failed
+
+
+def manifest_summary(manifest):
+    """
+    :return: dict of trial status to number of trials.
+    """
+    summary = {status: 0 for status in TRIAL_STATUSES}
+    summary.update(dict(manifest.execute('SELECT status, COUNT(*) FROM trials GROUP BY status')))
+    return summary
@@ -1,4 +1,5 @@
 import os
+import sys
 
 
 def construct_application_config(simulation_dir, sundials_cmake_config_dir):
@@ -6,4 +7,23 @@ def construct_application_config(simulation_dir, sundials_cmake_config_dir):
     src_dir = os.path.join(simulation_dir, 'simple-sundials-solver')
 
     return {'simulation_dir': simulation_dir, 'build_dir': build_dir, 'src_dir': src_dir, 'sundials_dir': sundials_cmake_config_dir,
-            'executable': os.path.join(build_dir, 'src', 'siss')}
+            'executable': os.path.join(build_dir, 'src', 'siss'), 'batch_executable': os.path.join(build_dir, 'src', 'siss-batch'),
+            'solver_library': os.path.join(build_dir, 'src', solver_library_file_name()), 'build_cache_dir': os.path.join(simulation_dir, 'build-cache')}
+
+
+def solver_library_file_name():
+    """
+    File name of the siss-solver shared library on this platform.
+    """
+    if sys.platform == 'win32':
+        return 'siss-solver.dll'
+    if sys.platform == 'darwin':
+        return 'libsiss-solver.dylib'
+    return 'libsiss-solver.so'
+
+
+def external_variable_name(parameter_name):
+    """
+    Name of a 'component.variable' parameter as an external variable, i.e. 'component__variable'.
+    """
+    return parameter_name.replace('.', '__')
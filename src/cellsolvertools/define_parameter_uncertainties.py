@@ -21,12 +21,13 @@ import json
 import os
 import sys
 
-from sbmlutils.creator import CoreModel
-from sbmlutils.factory import Parameter, InitialAssignment, ModelUnits
-from sbmlutils.units import UNIT_hr, UNIT_KIND_MOLE, UNIT_KIND_LITRE, UNIT_m, UNIT_m2, UNIT_KIND_DIMENSIONLESS
+from cellsolvertools.common import external_variable_name
 
 
 def create_template_model():
+    from sbmlutils.factory import ModelUnits
+    from sbmlutils.units import UNIT_hr, UNIT_KIND_MOLE, UNIT_KIND_LITRE, UNIT_m, UNIT_m2
+
     model_dict = {
         'mid': 'normal',
         'packages': ['distrib'],
@@ -48,7 +49,10 @@ def _sort_parameter_values_key(item):
 
 
 def add_model_parameter(model, parameter_name, parameter_values):
-    modified_name = parameter_name.replace('.', '__')
+    from sbmlutils.factory import Parameter, InitialAssignment
+    from sbmlutils.units import UNIT_KIND_DIMENSIONLESS
+
+    modified_name = external_variable_name(parameter_name)
     model['parameters'].append(Parameter(modified_name, value=parameter_values["p1"], unit=UNIT_KIND_DIMENSIONLESS))
     values = [(k, v) for k, v in parameter_values.items() if k.startswith('p')]
     sorted_values = sorted(values, key=_sort_parameter_values_key)
@@ -64,6 +68,8 @@ def process_arguments():
 
 
 def create_model_from_config(config):
+    from sbmlutils.creator import CoreModel
+
     model = create_template_model()
     for parameter in config:
         add_model_parameter(model, parameter, config[parameter])
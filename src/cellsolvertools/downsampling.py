@@ -0,0 +1,104 @@
+"""
+Downsampling of traces for plotting.
+
+A plot only has so many pixels across, drawing more points than that
+costs time in the browser without changing what is seen.  Two ways of
+choosing which points to keep are offered, both working on many traces
+at once:
+
+  lttb      Largest-Triangle-Three-Buckets (Steinarsson, 2013), keeps the
+            points that best preserve the visual shape of each trace
+  minmax    keeps the minimum and maximum of each trace in every bucket,
+            so spikes and the envelope are never lost
+
+Both return indices into the traces, so the x values, and any other
+arrays sharing the same layout, can be taken with the same indices.
+"""
+import numpy as np
+
+DOWNSAMPLING_METHODS = ['lttb', 'minmax', 'none']
+DEFAULT_MAX_POINTS = 2000
+
+
+def lttb_indices(x, y, threshold):
+    """
+    Indices of the points kept by Largest-Triangle-Three-Buckets.
+    :param x: array of shape (n,).
+    :param y: array of shape (n,) or (traces, n).
+    :param threshold: number of points to keep per trace.
+    :return: array of shape (traces, threshold), or (traces, n) when there are no more than threshold points.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.atleast_2d(np.asarray(y, dtype=np.float64))
+    traces, n = y.shape
+    if threshold >= n or threshold < 3:
+        return np.broadcast_to(np.arange(n), (traces, n))
+
+    rows = np.arange(traces)
+    every = (n - 2) / (threshold - 2)
+    edges = np.append(np.floor(np.arange(threshold - 1) * every).astype(int) + 1, n)
+    indices = np.empty((traces, threshold), dtype=np.intp)
+    indices[:, 0] = 0
+    indices[:, -1] = n - 1
+    a = np.zeros(traces, dtype=np.intp)
+    for bucket in range(threshold - 2):
+        start, end, next_end = edges[bucket], edges[bucket + 1], edges[bucket + 2]
+        average_x = x[end:next_end].mean()
+        average_y = y[:, end:next_end].mean(axis=1)
+        ax = x[a][:, np.newaxis]
+        ay = y[rows, a][:, np.newaxis]
+        area = np.abs((ax - average_x) * (y[:, start:end] - ay) - (ax - x[start:end]) * (average_y[:, np.newaxis] - ay))
+        a = area.argmax(axis=1) + start
+        indices[:, bucket + 1] = a
+
+    return indices
+
+
+def min_max_indices(y, buckets):
+    """
+    Indices of the minimum and maximum of every trace in each of the buckets, in order.
+    :param y: array of shape (n,) or (traces, n).
+    :param buckets: number of buckets, about the pixel width of the plot.
+    :return: array of shape (traces, 2 * buckets), or (traces, n) when there are no more than 2 * buckets points.
+    """
+    y = np.atleast_2d(np.asarray(y))
+    traces, n = y.shape
+    if 2 * buckets >= n or buckets < 1:
+        return np.broadcast_to(np.arange(n), (traces, n))
+
+    size = -(-n // buckets)
+    padded = np.pad(y, ((0, 0), (0, size * buckets - n)), mode='edge').reshape(traces, buckets, size)
+    offsets = (np.arange(buckets) * size)[np.newaxis, :, np.newaxis]
+    extremes = np.stack([padded.argmin(axis=2), padded.argmax(axis=2)], axis=2) + offsets
+    return np.minimum(np.sort(extremes, axis=2).reshape(traces, 2 * buckets), n - 1)
+
+
+def downsample_indices(x, y, max_points=DEFAULT_MAX_POINTS, method='lttb'):
+    """
+    Indices of the points to plot for each trace with the given method.
+    :param method: one of DOWNSAMPLING_METHODS.
+    :return: array of shape (traces, points).
+    """
+    y = np.atleast_2d(y)
+    if method == 'lttb':
+        return lttb_indices(x, y, max_points)
+    if method == 'minmax':
+        return min_max_indices(y, max_points // 2)
+    if method == 'none':
+        return np.broadcast_to(np.arange(y.shape[1]), y.shape)
+
+    raise ValueError(f'Unknown downsampling method "{method}", use one of {", ".join(DOWNSAMPLING_METHODS)}.')
+
+
+def shared_downsample_indices(x, y, max_points=DEFAULT_MAX_POINTS, method='lttb'):
+    """
+    Indices of the points to plot shared by every trace, for plots that take a single x for all traces.
+    The points kept are those chosen for the lower and upper envelopes of the traces.
+    :return: sorted array of at most 2 * max_points indices.
+    """
+    y = np.atleast_2d(y)
+    if y.shape[1] <= max_points:
+        return np.arange(y.shape[1])
+
+    envelopes = np.stack([y.min(axis=0), y.max(axis=0)])
+    return np.unique(downsample_indices(x, envelopes, max_points, method))
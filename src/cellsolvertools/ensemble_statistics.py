@@ -0,0 +1,164 @@
+"""
+Streaming ensemble statistics per time point and variable.
+
+Trials are added one at a time as they finish, the state kept is a fixed
+number of arrays the size of one trial's output whatever the number of
+trials:
+
+  mean and variance   Welford's online algorithm
+  minimum, maximum    running extremes
+  quantiles           the P-square algorithm (Jain and Chlamtac, 1985),
+                      five markers per quantile
+
+The state is a dict of NumPy arrays and can be checkpointed to, and
+restored from, a .npz file at any time.
+"""
+from statistics import NormalDist
+
+import numpy as np
+
+DEFAULT_QUANTILES = [0.05, 0.5, 0.95]
+MARKER_COUNT = 5
+
+
+def create_statistics(num_times, num_variables, quantiles=None):
+    """
+    Create an empty statistics accumulator.
+    :param num_times: number of time points in each trial.
+    :param num_variables: number of variables in each trial.
+    :param quantiles: list of quantiles to estimate, between 0 and 1.
+    :return: statistics dict.
+    """
+    quantiles = np.array(DEFAULT_QUANTILES if quantiles is None else quantiles, dtype=np.float64)
+    shape = (num_times, num_variables)
+    return {
+        'count': np.zeros((), dtype=np.int64),
+        'mean': np.zeros(shape),
+        'm2': np.zeros(shape),
+        'min': np.full(shape, np.inf),
+        'max': np.full(shape, -np.inf),
+        'quantiles': quantiles,
+        'heights': np.zeros((len(quantiles), MARKER_COUNT) + shape),
+        'positions': np.tile(np.arange(1.0, MARKER_COUNT + 1), (len(quantiles), 1))[:, :, np.newaxis, np.newaxis] * np.ones(shape),
+        'desired': np.array([[1.0, 1.0 + 2.0 * p, 1.0 + 4.0 * p, 3.0 + 2.0 * p, 5.0] for p in quantiles]),
+        'increments': np.array([[0.0, p / 2.0, p, (1.0 + p) / 2.0, 1.0] for p in quantiles]),
+    }
+
+
+def _update_markers(heights, positions, desired, increments, x):
+    # Adjust the marker positions for the new observation.
+    np.minimum(heights[0], x, out=heights[0])
+    np.maximum(heights[-1], x, out=heights[-1])
+    cell = (heights[1:-1] <= x).sum(axis=0)
+    positions += np.arange(MARKER_COUNT)[:, np.newaxis, np.newaxis] > cell
+    desired += increments
+
+    # Move the middle markers that drifted away from their desired positions.
+    for i in range(1, MARKER_COUNT - 1):
+        d = desired[i] - positions[i]
+        step_right = positions[i + 1] - positions[i]
+        step_left = positions[i - 1] - positions[i]
+        move = ((d >= 1.0) & (step_right > 1.0)) | ((d <= -1.0) & (step_left < -1.0))
+        if not move.any():
+            continue
+        d = np.where(move, np.sign(d), 0.0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            parabolic = heights[i] + d / (positions[i + 1] - positions[i - 1]) * (
+                (positions[i] - positions[i - 1] + d) * (heights[i + 1] - heights[i]) / step_right
+                + (positions[i + 1] - positions[i] - d) * (heights[i] - heights[i - 1]) / -step_left)
+            neighbour_height = np.where(d > 0, heights[i + 1], heights[i - 1])
+            neighbour_position = np.where(d > 0, positions[i + 1], positions[i - 1])
+            linear = heights[i] + d * (neighbour_height - heights[i]) / (neighbour_position - positions[i])
+        parabolic_ok = (heights[i - 1] < parabolic) & (parabolic < heights[i + 1])
+        heights[i] = np.where(move, np.where(parabolic_ok, parabolic, linear), heights[i])
+        positions[i] += d
+
+
+def update_statistics(statistics, data):
+    """
+    Add the output of one trial to the statistics.
+    :param statistics: statistics dict.
+    :param data: array of shape (time, variables).
+    """
+    x = np.asarray(data, dtype=np.float64)
+    count = int(statistics['count']) + 1
+    statistics['count'] = np.array(count, dtype=np.int64)
+
+    delta = x - statistics['mean']
+    statistics['mean'] += delta / count
+    statistics['m2'] += delta * (x - statistics['mean'])
+    np.minimum(statistics['min'], x, out=statistics['min'])
+    np.maximum(statistics['max'], x, out=statistics['max'])
+
+    heights = statistics['heights']
+    if count <= MARKER_COUNT:
+        # The first observations become the initial marker heights.
+        heights[:, count - 1] = x
+        if count == MARKER_COUNT:
+            heights.sort(axis=1)
+        return
+
+    for q in range(len(statistics['quantiles'])):
+        _update_markers(heights[q], statistics['positions'][q], statistics['desired'][q], statistics['increments'][q], x)
+
+
+def statistics_summary(statistics):
+    """
+    Current ensemble statistics.
+    :param statistics: statistics dict.
+    :return: dict with keys ['count', 'mean', 'std', 'min', 'max', 'quantiles'], quantiles mapping
+    each quantile to its estimate, every estimate being an array of shape (time, variables).
+    """
+    count = int(statistics['count'])
+    if count < MARKER_COUNT:
+        observations = np.sort(statistics['heights'][0, :count], axis=0)
+        estimates = [np.quantile(observations, p, axis=0) if count else np.full(statistics['mean'].shape, np.nan) for p in statistics['quantiles']]
+    else:
+        estimates = list(statistics['heights'][:, 2])
+
+    return {
+        'count': count,
+        'mean': statistics['mean'],
+        'std': np.sqrt(statistics['m2'] / (count - 1)) if count > 1 else np.zeros_like(statistics['m2']),
+        'min': statistics['min'],
+        'max': statistics['max'],
+        'quantiles': dict(zip(statistics['quantiles'].tolist(), estimates)),
+    }
+
+
+def confidence_half_widths(statistics, confidence=0.95):
+    """
+    Half widths of the confidence intervals of the mean and the standard deviation,
+    using the normal approximations z s / sqrt(n) and z s / sqrt(2 (n - 1)).
+    :param statistics: statistics dict.
+    :param confidence: confidence level of the intervals.
+    :return: dict with keys ['mean', 'std'], arrays of shape (time, variables), infinite before two trials are in.
+    """
+    count = int(statistics['count'])
+    if count < 2:
+        return {'mean': np.full(statistics['mean'].shape, np.inf), 'std': np.full(statistics['mean'].shape, np.inf)}
+
+    z = NormalDist().inv_cdf(0.5 + confidence / 2.0)
+    std = np.sqrt(statistics['m2'] / (count - 1))
+    return {'mean': z * std / np.sqrt(count), 'std': z * std / np.sqrt(2.0 * (count - 1))}
+
+
+def save_statistics(statistics, filename, column_info=None, trials=None):
+    """
+    Checkpoint the statistics, with the column information of the variables and the
+    indices of the trials they include when given.
+    """
+    extra = {} if column_info is None else {'variable_ids': np.array([f"{c['component']}.{c['name']}" for c in column_info])}
+    if trials is not None:
+        extra['trials'] = np.array(sorted(trials), dtype=np.int64)
+    with open(filename, 'wb') as f:
+        np.savez(f, **{**statistics, **extra})
+
+
+def load_statistics(filename):
+    """
+    Restore checkpointed statistics, updating them further carries on where the checkpoint left off.
+    :return: statistics dict, with 'variable_ids' and 'trials' when they were saved.
+    """
+    with np.load(filename) as data:
+        return {key: data[key] for key in data.files}
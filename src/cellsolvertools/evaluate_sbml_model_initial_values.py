@@ -6,7 +6,7 @@ initial values.
 """
 import argparse
 import json
-import roadrunner
+import numpy as np
 import os
 import sys
 
@@ -30,6 +30,8 @@ def evaluate_parameter_initial_values(rr):
 
 
 def load_model(sbml_model):
+    import roadrunner
+
     return roadrunner.RoadRunner(sbml_model)
 
 
@@ -39,6 +41,33 @@ def evaluate_model(sbml_model):
     return evaluate_parameter_initial_values(rr)
 
 
+def evaluate_parameter_samples(rr, num_samples):
+    """
+    Draw a number of samples from an already loaded model.
+    The model is reset to its origin between samples so that every
+    initial assignment, and therefore every distribution, is re-evaluated.
+    :param rr: roadrunner instance of the model.
+    :param num_samples: number of samples to draw.
+    :return: tuple of the list of parameter ids and a num_samples x num_parameters array.
+    """
+    executable_model = rr.getModel()
+    parameter_ids = [executable_model.getGlobalParameterId(p) for p in range(executable_model.getNumGlobalParameters())]
+    samples = np.empty((num_samples, len(parameter_ids)))
+    for i in range(num_samples):
+        samples[i, :] = rr.getModel().getGlobalParameterValues()
+        rr.resetToOrigin()
+
+    return parameter_ids, samples
+
+
+def evaluate_model_samples(sbml_model, num_samples):
+    """
+    Load the model once and draw all the samples from it.
+    """
+    rr = load_model(sbml_model)
+    return evaluate_parameter_samples(rr, num_samples)
+
+
 def main():
     parser = process_arguments()
     args = parser.parse_args()
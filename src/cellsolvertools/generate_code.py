@@ -3,6 +3,8 @@ import os
 import libcellml
 from libcellml import Parser, Validator, GeneratorProfile, Generator, Analyser
 
+from cellsolvertools import tracing
+
 
 class ModelGenerationError(Exception):
     pass
@@ -16,7 +18,31 @@ ModelValidationError = ModelParseError
 ModelAnalysisError = ModelParseError
 
 
-def return_generated_python_code(model_location):
+def _write_if_changed(filename, contents):
+    """
+    Write contents to filename unless the file already holds exactly that, leaving
+    unchanged files untouched so that make does not rebuild what depends on them.
+    """
+    try:
+        with open(filename) as f:
+            if f.read() == contents:
+                return False
+    except FileNotFoundError:
+        pass
+
+    with open(filename, 'w') as f:
+        f.write(contents)
+    return True
+
+
+def analyse_model(model_location, external_variables=None):
+    """
+    Parse, validate and analyse a model once, for generating any of its code and metadata.
+    :param model_location: the CellML model file.
+    :param external_variables: optional list of 'component.name' variables to make external.
+    :return: dict with keys ['name', 'model', 'analysed_model', 'variable_index', 'external_variable_info'],
+    variable_index mapping (component, name) to the analyser variable of every state and variable.
+    """
     p = Parser()
 
     with open(model_location) as f:
@@ -33,130 +59,854 @@ def return_generated_python_code(model_location):
     if val.errorCount() > 0:
         raise ModelValidationError(f'Validated model has {val.errorCount()} error(s).')
 
-    profile = GeneratorProfile(GeneratorProfile.Profile.PYTHON)
+    a = Analyser()
 
-    g = Generator()
-    g.setProfile(profile)
+    external_variables = [] if external_variables is None else list(external_variables)
+    for ext_variable in external_variables:
+        component_name, variable_name = ext_variable.split('.')
+        c = m.component(component_name)
+        v = None if c is None else c.variable(variable_name)
+        if v is None:
+            raise ModelAnalysisError(f'External variable "{ext_variable}" is not in the model.')
+        a.addExternalVariable(libcellml.AnalyserExternalVariable(v))
 
-    a = Analyser()
     a.analyseModel(m)
 
     if a.errorCount() > 0:
         raise ModelAnalysisError(f'Model analysis came back with {a.errorCount()} error(s).')
 
     am = a.model()
-    g.setModel(am)
-
-    return g.implementationCode()
-
 
-def generate_c_code(model_location, output_location, config=None):
-    p = Parser()
-
-    with open(model_location) as f:
-        contents = f.read()
+    variable_index = {}
+    for av in [*am.states(), *am.variables()]:
+        v = av.variable()
+        variable_index[(v.parent().name(), v.name())] = av
 
-    m = p.parseModel(contents)
+    external_variable_info = []
+    for ext_variable in external_variables:
+        component_name, variable_name = ext_variable.split('.')
+        external_variable_info.append({
+            'index': variable_index[(component_name, variable_name)].index(),
+            'name': variable_name,
+            'component_name': component_name
+        })
+
+    return {'name': m.name(), 'model': m, 'analysed_model': am, 'variable_index': variable_index, 'external_variable_info': external_variable_info}
+
+
+def _variable_info(av):
+    v = av.variable()
+    return {'name': v.name(), 'units': v.units().name(), 'component': v.parent().name(), 'type': libcellml.AnalyserVariable.typeAsString(av.type()).upper()}
+
+
+def analysed_model_metadata(analysis):
+    """
+    The variable information of an analysed model, as the VOI_INFO, STATE_INFO and
+    VARIABLE_INFO of the generated code with each type given by its name, e.g. 'STATE'.
+    :return: dict with keys ['voi_info', 'state_info', 'variable_info'].
+    """
+    am = analysis['analysed_model']
+    return {
+        'voi_info': _variable_info(am.voi()) if am.voi() is not None else None,
+        'state_info': [_variable_info(av) for av in am.states()],
+        'variable_info': [_variable_info(av) for av in am.variables()],
+    }
+
+
+def generated_python_code(analysis, vectorised=False):
+    """
+    The Python code of an analysed model.
+    :param vectorised: write piecewise expressions as NumPy where() calls instead of
+    conditional expressions, so the code also evaluates arrays, see batched_solver.
+    """
+    profile = GeneratorProfile(GeneratorProfile.Profile.PYTHON)
+    if vectorised:
+        profile.setConditionalOperatorIfString('where([CONDITION], [IF_STATEMENT]')
+        profile.setConditionalOperatorElseString(', [ELSE_STATEMENT])')
 
-    if p.errorCount() > 0:
-        raise ModelParseError(f'Parsed model has {p.errorCount()} error(s).')
+    g = Generator()
+    g.setProfile(profile)
+    g.setModel(analysis['analysed_model'])
 
-    val = Validator()
-    val.validateModel(m)
+    return g.implementationCode()
 
-    if val.errorCount() > 0:
-        raise ModelValidationError(f'Validated model has {val.errorCount()} error(s).')
 
+def write_c_code(analysis, output_location):
+    """
+    Write the C code of an analysed model, with its external variable, batch solver
+    and CMake code, to output_location.
+    """
+    model_name = analysis['name']
     profile = GeneratorProfile(GeneratorProfile.Profile.C)
-    header_filename = f'{m.name()}.h'
+    header_filename = f'{model_name}.h'
     profile.setInterfaceFileNameString(header_filename)
 
     g = Generator()
     g.setProfile(profile)
 
-    a = Analyser()
-
-    if config is not None and 'external_variables' in config:
-        for ext_variable in config['external_variables']:
-            component_name, variable_name = ext_variable.split('.')
-            v = m.component(component_name).variable(variable_name)
-            ev = libcellml.AnalyserExternalVariable(v)
-            a.addExternalVariable(ev)
-            # am.
+    external_variable_info = analysis['external_variable_info']
+    if external_variable_info:
+        generate_external_variable_c_code(external_variable_info, output_location)
 
-    a.analyseModel(m)
+    generate_cmake_code(model_name, output_location, len(external_variable_info) > 0)
+    generate_batch_solver_c_code(model_name, output_location)
 
-    if a.errorCount() > 0:
-        raise ModelAnalysisError(f'Model analysis came back with {a.errorCount()} error(s).')
+    g.setModel(analysis['analysed_model'])
 
-    am = a.model()
+    _write_if_changed(os.path.join(output_location, header_filename), g.interfaceCode())
+    _write_if_changed(os.path.join(output_location, f'{model_name}.c'), g.implementationCode())
 
-    external_variable_info = []
-    if config is not None and 'external_variables' in config:
-        for ext_variable in config['external_variables']:
-            component_name, variable_name = ext_variable.split('.')
-            avs = am.variables()
-            for av in avs:
-                v = av.variable()
-                if v.name() == variable_name and v.parent().name() == component_name:
-                    external_variable_info.append({
-                        'index': av.index(),
-                        'name': variable_name,
-                        'component_name': component_name
-                    })
 
-        generate_external_variable_c_code(external_variable_info, output_location)
+@tracing.traced('generate_python_code')
+def return_generated_python_code(model_location):
+    return generated_python_code(analyse_model(model_location))
 
-    generate_cmake_code(m.name(), output_location, len(external_variable_info) > 0)
 
-    g.setModel(am)
+@tracing.traced('generate_c_code')
+def generate_c_code(model_location, output_location, config=None):
+    external_variables = None
+    if config is not None and 'external_variables' in config:
+        external_variables = config['external_variables']
 
-    with open(os.path.join(output_location, header_filename), 'w') as f:
-        f.write(g.interfaceCode())
-    with open(os.path.join(output_location, f'{m.name()}.c'), 'w') as f:
-        f.write(g.implementationCode())
+    write_c_code(analyse_model(model_location, external_variables), output_location)
 
 
 def generate_external_variable_c_code(external_variable_info, output_location):
-    interface_code = """  
+    """
+    Generate the external variable functions for the given external variables.
+    The values are read once, on first use, into a static array indexed by the
+    analyser variable index.  They are read either from the binary file (native
+    doubles, in external variable order) named by the EXTERNAL_VARIABLES_FILE
+    environment variable, '-' meaning stdin, or from one environment variable
+    per external variable.
+    """
+    count = len(external_variable_info)
+    interface_code = f"""
 #pragma once
 
 #include <stddef.h>
 
+#define EXTERNAL_VARIABLE_COUNT {count}
+
+extern const char *EXTERNAL_VARIABLE_NAMES[];
+
+int loadExternalVariables(void);
+void setExternalVariableValues(const double *values);
 double computeExternalVariable(double voi, double *states, double *variables, size_t index);
 """
-    with open(os.path.join(output_location, 'external_variables.h'), 'w') as f:
-        f.write(interface_code)
+    _write_if_changed(os.path.join(output_location, 'external_variables.h'), interface_code)
 
-    if_statement = ''
-    for info in external_variable_info:
-        index = info['index']
-        value = f"{info['component_name']}__{info['name']}"
-
-        if_statement += f'  if (index == {index}) return atof(getenv("{value}"));\n'
+    names = ',\n'.join([f'  "{info["component_name"]}__{info["name"]}"' for info in external_variable_info])
+    indices = ', '.join([str(info['index']) for info in external_variable_info])
+    index_count = max([info['index'] for info in external_variable_info], default=-1) + 1
 
     implementation_code = f"""
 #include "external_variables.h"
 
+#include <stdio.h>
 #include <stdlib.h>
+#include <string.h>
+
+const char *EXTERNAL_VARIABLE_NAMES[] = {{
+{names}
+}};
+
+static const size_t EXTERNAL_VARIABLE_INDICES[] = {{{indices}}};
+
+static double externalVariableValues[{max(index_count, 1)}];
+static int externalVariablesLoaded = 0;
+
+static int readExternalVariables(double *values)
+{{
+  const char *parameterFile = getenv("EXTERNAL_VARIABLES_FILE");
+  if (parameterFile != NULL) {{
+    FILE *file = strcmp(parameterFile, "-") == 0 ? stdin : fopen(parameterFile, "rb");
+    if (file == NULL) {{
+      fprintf(stderr, "Could not open external variables file '%s'.\\n", parameterFile);
+      return 0;
+    }}
+    size_t read = fread(values, sizeof(double), EXTERNAL_VARIABLE_COUNT, file);
+    if (file != stdin) {{
+      fclose(file);
+    }}
+    if (read != EXTERNAL_VARIABLE_COUNT) {{
+      fprintf(stderr, "Expected %d external variable values, read %zu.\\n", EXTERNAL_VARIABLE_COUNT, read);
+      return 0;
+    }}
+    return 1;
+  }}
+
+  for (size_t i = 0; i < EXTERNAL_VARIABLE_COUNT; ++i) {{
+    const char *value = getenv(EXTERNAL_VARIABLE_NAMES[i]);
+    if (value == NULL) {{
+      fprintf(stderr, "External variable '%s' is not set.\\n", EXTERNAL_VARIABLE_NAMES[i]);
+      return 0;
+    }}
+    values[i] = strtod(value, NULL);
+  }}
+  return 1;
+}}
+
+void setExternalVariableValues(const double *values)
+{{
+  for (size_t i = 0; i < EXTERNAL_VARIABLE_COUNT; ++i) {{
+    externalVariableValues[EXTERNAL_VARIABLE_INDICES[i]] = values[i];
+  }}
+  externalVariablesLoaded = 1;
+}}
+
+int loadExternalVariables(void)
+{{
+  double values[EXTERNAL_VARIABLE_COUNT];
+  if (!readExternalVariables(values)) {{
+    return 0;
+  }}
+  setExternalVariableValues(values);
+  return 1;
+}}
 
 double computeExternalVariable(double voi, double *states, double *variables, size_t index)
 {{
-  
-{if_statement}
-  return 0.0;
+  if (!externalVariablesLoaded && !loadExternalVariables()) {{
+    exit(EXIT_FAILURE);
+  }}
+  return externalVariableValues[index];
 }}
 """
-    with open(os.path.join(output_location, 'external_variables.c'), 'w') as f:
-        f.write(implementation_code)
+    _write_if_changed(os.path.join(output_location, 'external_variables.c'), implementation_code)
+
+
+BATCH_SOLVER_INTERFACE_CODE = """
+#pragma once
+
+#include <stddef.h>
+
+#define SOLVER_BDF 0
+#define SOLVER_ADAMS 1
+
+#define SOLVER_NEWTON 0
+#define SOLVER_FUNCTIONAL 1
+
+typedef struct {
+  double startingPoint;
+  double endingPoint;
+  double pointInterval;
+  double relativeTolerance;
+  double absoluteTolerance;
+  double maximumStep;
+  long maximumNumberOfSteps;
+  int integrationMethod;
+  int iterationType;
+  int interpolateSolution;
+} SolverSettings;
+
+typedef struct Solver Solver;
+
+size_t solverOutputColumnCount(void);
+size_t solverOutputPointCount(const SolverSettings *settings);
+
+Solver *createSolver(const SolverSettings *settings);
+int solveTrial(Solver *solver, const double *parameters, double *output);
+void deleteSolver(Solver *solver);
+"""
+
+BATCH_SOLVER_IMPLEMENTATION_CODE = """
+#include <math.h>
+#include <stdlib.h>
+
+#include <cvode/cvode.h>
+#include <nvector/nvector_serial.h>
+#include <sundials/sundials_config.h>
+#include <sunlinsol/sunlinsol_dense.h>
+#include <sunmatrix/sunmatrix_dense.h>
+#include <sunnonlinsol/sunnonlinsol_fixedpoint.h>
+
+#ifdef EXTERNAL_VARIABLES
+#  include "external_variables.h"
+#  define EXTERNAL_VARIABLE_ARGUMENT , externalVariable
+#else
+#  define EXTERNAL_VARIABLE_ARGUMENT
+#endif
+
+#if SUNDIALS_VERSION_MAJOR < 6
+typedef realtype sunrealtype;
+#  define SOLVER_CONTEXT
+#else
+#  define SOLVER_CONTEXT , solver->context
+#endif
+
+struct Solver {
+#if SUNDIALS_VERSION_MAJOR >= 6
+  SUNContext context;
+#endif
+  SolverSettings settings;
+  void *cvodeMemory;
+  N_Vector y;
+  SUNMatrix matrix;
+  SUNLinearSolver linearSolver;
+  SUNNonlinearSolver nonlinearSolver;
+  double *rates;
+  double *variables;
+};
+
+#ifdef EXTERNAL_VARIABLES
+static double externalVariable(double voi, double *states, double *rates, double *variables, size_t index)
+{
+  (void) rates;
+  return computeExternalVariable(voi, states, variables, index);
+}
+#endif
+
+static int rightHandSide(sunrealtype voi, N_Vector y, N_Vector yDot, void *userData)
+{
+  Solver *solver = (Solver *) userData;
+  computeRates(voi, N_VGetArrayPointer(y), N_VGetArrayPointer(yDot), solver->variables EXTERNAL_VARIABLE_ARGUMENT);
+  return 0;
+}
+
+static void storePoint(double *row, double voi, const double *states, const double *variables)
+{
+  row[0] = voi;
+  for (size_t i = 0; i < STATE_COUNT; ++i) {
+    row[1 + i] = states[i];
+  }
+  for (size_t i = 0; i < VARIABLE_COUNT; ++i) {
+    row[1 + STATE_COUNT + i] = variables[i];
+  }
+}
+
+size_t solverOutputColumnCount(void)
+{
+  return 1 + STATE_COUNT + VARIABLE_COUNT;
+}
+
+size_t solverOutputPointCount(const SolverSettings *settings)
+{
+  return (size_t) floor((settings->endingPoint - settings->startingPoint) / settings->pointInterval + 1.0e-9) + 1;
+}
+
+Solver *createSolver(const SolverSettings *settings)
+{
+  Solver *solver = (Solver *) calloc(1, sizeof(Solver));
+  if (solver == NULL) {
+    return NULL;
+  }
+  solver->settings = *settings;
+
+#if SUNDIALS_VERSION_MAJOR >= 7
+  SUNContext_Create(SUN_COMM_NULL, &solver->context);
+#elif SUNDIALS_VERSION_MAJOR == 6
+  SUNContext_Create(NULL, &solver->context);
+#endif
+
+  solver->rates = createStatesArray();
+  solver->variables = createVariablesArray();
+  solver->y = N_VNew_Serial((sunindextype) STATE_COUNT SOLVER_CONTEXT);
+  solver->cvodeMemory = CVodeCreate((settings->integrationMethod == SOLVER_ADAMS) ? CV_ADAMS : CV_BDF SOLVER_CONTEXT);
+  if ((solver->y == NULL) || (solver->cvodeMemory == NULL)) {
+    deleteSolver(solver);
+    return NULL;
+  }
+
+  N_VConst(0.0, solver->y);
+  int flag = CVodeInit(solver->cvodeMemory, rightHandSide, settings->startingPoint, solver->y);
+  flag = (flag == CV_SUCCESS) ? CVodeSetUserData(solver->cvodeMemory, solver) : flag;
+  flag = (flag == CV_SUCCESS) ? CVodeSStolerances(solver->cvodeMemory, settings->relativeTolerance, settings->absoluteTolerance) : flag;
+  flag = (flag == CV_SUCCESS) ? CVodeSetMaxNumSteps(solver->cvodeMemory, settings->maximumNumberOfSteps) : flag;
+  if ((flag == CV_SUCCESS) && (settings->maximumStep > 0.0)) {
+    flag = CVodeSetMaxStep(solver->cvodeMemory, settings->maximumStep);
+  }
+
+  if (flag == CV_SUCCESS) {
+    if (settings->iterationType == SOLVER_FUNCTIONAL) {
+      solver->nonlinearSolver = SUNNonlinSol_FixedPoint(solver->y, 0 SOLVER_CONTEXT);
+      flag = CVodeSetNonlinearSolver(solver->cvodeMemory, solver->nonlinearSolver);
+    } else {
+      solver->matrix = SUNDenseMatrix((sunindextype) STATE_COUNT, (sunindextype) STATE_COUNT SOLVER_CONTEXT);
+      solver->linearSolver = SUNLinSol_Dense(solver->y, solver->matrix SOLVER_CONTEXT);
+      flag = CVodeSetLinearSolver(solver->cvodeMemory, solver->linearSolver, solver->matrix);
+    }
+  }
+
+  if (flag != CV_SUCCESS) {
+    deleteSolver(solver);
+    return NULL;
+  }
+
+  return solver;
+}
+
+int solveTrial(Solver *solver, const double *parameters, double *output)
+{
+  const SolverSettings *settings = &solver->settings;
+  size_t columnCount = solverOutputColumnCount();
+  size_t pointCount = solverOutputPointCount(settings);
+  double *states = N_VGetArrayPointer(solver->y);
+  sunrealtype voi = settings->startingPoint;
+
+#ifdef EXTERNAL_VARIABLES
+  setExternalVariableValues(parameters);
+  initialiseVariables(voi, states, solver->rates, solver->variables, externalVariable);
+#else
+  (void) parameters;
+  initialiseVariables(states, solver->rates, solver->variables);
+#endif
+  computeComputedConstants(solver->variables);
+  computeRates(voi, states, solver->rates, solver->variables EXTERNAL_VARIABLE_ARGUMENT);
+  computeVariables(voi, states, solver->rates, solver->variables EXTERNAL_VARIABLE_ARGUMENT);
+  storePoint(output, voi, states, solver->variables);
+
+  int flag = CVodeReInit(solver->cvodeMemory, voi, solver->y);
+  for (size_t i = 1; (i < pointCount) && (flag >= 0); ++i) {
+    sunrealtype voiOut = settings->startingPoint + (double) i * settings->pointInterval;
+    if (!settings->interpolateSolution) {
+      CVodeSetStopTime(solver->cvodeMemory, voiOut);
+    }
+    flag = CVode(solver->cvodeMemory, voiOut, solver->y, &voi, CV_NORMAL);
+    if (flag >= 0) {
+      computeRates(voi, states, solver->rates, solver->variables EXTERNAL_VARIABLE_ARGUMENT);
+      computeVariables(voi, states, solver->rates, solver->variables EXTERNAL_VARIABLE_ARGUMENT);
+      storePoint(output + i * columnCount, voi, states, solver->variables);
+    } else {
+      for (size_t j = i * columnCount; j < pointCount * columnCount; ++j) {
+        output[j] = NAN;
+      }
+    }
+  }
+
+  return (flag < 0) ? flag : 0;
+}
+
+void deleteSolver(Solver *solver)
+{
+  if (solver == NULL) {
+    return;
+  }
+
+  if (solver->cvodeMemory != NULL) {
+    CVodeFree(&solver->cvodeMemory);
+  }
+  if (solver->linearSolver != NULL) {
+    SUNLinSolFree(solver->linearSolver);
+  }
+  if (solver->matrix != NULL) {
+    SUNMatDestroy(solver->matrix);
+  }
+  if (solver->nonlinearSolver != NULL) {
+    SUNNonlinSolFree(solver->nonlinearSolver);
+  }
+  if (solver->y != NULL) {
+    N_VDestroy(solver->y);
+  }
+  deleteArray(solver->rates);
+  deleteArray(solver->variables);
+#if SUNDIALS_VERSION_MAJOR >= 6
+  SUNContext_Free(&solver->context);
+#endif
+  free(solver);
+}
+"""
+
+BATCH_DRIVER_CODE = """
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+#ifdef EXTERNAL_VARIABLES
+#  include "external_variables.h"
+#endif
+#ifdef HAVE_ZLIB
+#  include <zlib.h>
+#endif
+
+/*
+ * Batch file layout, native byte order:
+ *   char[8]  magic "SISSBAT1"
+ *   uint64   index of the first trial, uint64 trial count, uint64 parameter count
+ *   double   starting point, ending point, point interval,
+ *            relative tolerance, absolute tolerance, maximum step
+ *   int64    maximum number of steps
+ *   int32    integration method, iteration type, interpolate solution, output format
+ *   double   trial count x parameter count parameter values
+ */
+#define OUTPUT_CSV 0
+#define OUTPUT_BINARY_FLOAT64 1
+#define OUTPUT_BINARY_FLOAT32 2
+#define OUTPUT_COMPRESSED_FLOAT64 3
+#define OUTPUT_COMPRESSED_FLOAT32 4
+
+/* Values in each compressed chunk of a column, as binary_output.COMPRESSION_CHUNK_ROWS. */
+#define OUTPUT_CHUNK_POINTS 65536
+
+static const char *VARIABLE_TYPE_NAMES[] = {"VARIABLE_OF_INTEGRATION", "STATE", "CONSTANT", "COMPUTED_CONSTANT", "ALGEBRAIC", "EXTERNAL"};
+
+static int readBatchHeader(FILE *file, uint64_t *firstTrial, uint64_t *trialCount, uint64_t *parameterCount, SolverSettings *settings, int *outputFormat)
+{
+  char magic[8];
+  uint64_t counts[3];
+  double values[6];
+  int64_t maximumNumberOfSteps;
+  int32_t options[4];
+
+  if ((fread(magic, 1, 8, file) != 8) || (memcmp(magic, "SISSBAT1", 8) != 0)
+      || (fread(counts, sizeof(uint64_t), 3, file) != 3)
+      || (fread(values, sizeof(double), 6, file) != 6)
+      || (fread(&maximumNumberOfSteps, sizeof(int64_t), 1, file) != 1)
+      || (fread(options, sizeof(int32_t), 4, file) != 4)) {
+    return 0;
+  }
+
+  *firstTrial = counts[0];
+  *trialCount = counts[1];
+  *parameterCount = counts[2];
+  settings->startingPoint = values[0];
+  settings->endingPoint = values[1];
+  settings->pointInterval = values[2];
+  settings->relativeTolerance = values[3];
+  settings->absoluteTolerance = values[4];
+  settings->maximumStep = values[5];
+  settings->maximumNumberOfSteps = (long) maximumNumberOfSteps;
+  settings->integrationMethod = options[0];
+  settings->iterationType = options[1];
+  settings->interpolateSolution = options[2];
+  *outputFormat = options[3];
+
+  return 1;
+}
+
+static void writeHeader(FILE *file)
+{
+  fprintf(file, "%s.%s", VOI_INFO.component, VOI_INFO.name);
+  for (size_t i = 0; i < STATE_COUNT; ++i) {
+    fprintf(file, ",%s.%s", STATE_INFO[i].component, STATE_INFO[i].name);
+  }
+  for (size_t i = 0; i < VARIABLE_COUNT; ++i) {
+    fprintf(file, ",%s.%s", VARIABLE_INFO[i].component, VARIABLE_INFO[i].name);
+  }
+  fprintf(file, "\\n");
+}
+
+static const VariableInfo *columnInfo(size_t column)
+{
+  if (column == 0) {
+    return &VOI_INFO;
+  }
+  return (column <= STATE_COUNT) ? &STATE_INFO[column - 1] : &VARIABLE_INFO[column - 1 - STATE_COUNT];
+}
+
+#ifdef HAVE_ZLIB
+static int writeCompressedChunks(FILE *file, const unsigned char *column, size_t pointCount, size_t valueSize, uint64_t *offsets)
+{
+  unsigned char *chunk = (unsigned char *) malloc(compressBound(OUTPUT_CHUNK_POINTS * valueSize));
+  int written = chunk != NULL;
+  for (size_t first = 0; written && (first < pointCount); first += OUTPUT_CHUNK_POINTS, ++offsets) {
+    size_t count = (pointCount - first < OUTPUT_CHUNK_POINTS) ? pointCount - first : OUTPUT_CHUNK_POINTS;
+    uLongf chunkSize = compressBound(count * valueSize);
+    written = (compress2(chunk, &chunkSize, column + first * valueSize, count * valueSize, 1) == Z_OK) && (fwrite(chunk, 1, chunkSize, file) == chunkSize);
+    offsets[1] = offsets[0] + chunkSize;
+  }
+  free(chunk);
+  return written;
+}
+#else
+static int writeCompressedChunks(FILE *file, const unsigned char *column, size_t pointCount, size_t valueSize, uint64_t *offsets)
+{
+  return 0;
+}
+#endif
+
+/* See binary_output.py for the layout of binary output files. */
+static int writeBinaryOutput(const char *fileName, const double *output, size_t pointCount, size_t columnCount, int singlePrecision, int compressed)
+{
+  FILE *file = fopen(fileName, "wb");
+  if (file == NULL) {
+    return 0;
+  }
+
+  uint32_t fixed[2] = {0, singlePrecision ? 1 : 0};
+  uint64_t counts[2] = {pointCount, columnCount};
+  uint32_t sizes[2] = {compressed ? 1 : 0, 0};
+  fwrite("SISSOUT1", 1, 8, file);
+  fwrite(fixed, sizeof(uint32_t), 2, file);
+  fwrite(counts, sizeof(uint64_t), 2, file);
+  fwrite(sizes, sizeof(uint32_t), 2, file);
+
+  long metadataSize = fprintf(file, "{\\"model\\": \\"%s\\", \\"columns\\": [", MODEL_NAME);
+  for (size_t j = 0; j < columnCount; ++j) {
+    const VariableInfo *info = columnInfo(j);
+    metadataSize += fprintf(file, "%s{\\"component\\": \\"%s\\", \\"name\\": \\"%s\\", \\"units\\": \\"%s\\", \\"type\\": \\"%s\\"}",
+                            (j == 0) ? "" : ", ", info->component, info->name, info->units, VARIABLE_TYPE_NAMES[info->type]);
+  }
+  metadataSize += compressed ? fprintf(file, "], \\"chunk_rows\\": %d}", OUTPUT_CHUNK_POINTS) : fprintf(file, "]}");
+
+  long headerSize = ((40 + metadataSize + 63) / 64) * 64;
+  for (long i = 40 + metadataSize; i < headerSize; ++i) {
+    fputc(0, file);
+  }
+
+  /* Compressed columns are preceded by the table of their chunks' offsets, written once the chunks are. */
+  size_t valueSize = singlePrecision ? sizeof(float) : sizeof(double);
+  size_t chunkCount = (pointCount + OUTPUT_CHUNK_POINTS - 1) / OUTPUT_CHUNK_POINTS;
+  size_t offsetCount = compressed ? columnCount * chunkCount + 1 : 0;
+  uint64_t *offsets = (uint64_t *) calloc(offsetCount + 1, sizeof(uint64_t));
+  fwrite(offsets, sizeof(uint64_t), offsetCount, file);
+
+  int compressedWritten = 1;
+  void *column = malloc(pointCount * sizeof(double));
+  for (size_t j = 0; j < columnCount; ++j) {
+    for (size_t i = 0; i < pointCount; ++i) {
+      if (singlePrecision) {
+        ((float *) column)[i] = (float) output[i * columnCount + j];
+      } else {
+        ((double *) column)[i] = output[i * columnCount + j];
+      }
+    }
+    if (compressed) {
+      compressedWritten = compressedWritten && writeCompressedChunks(file, (const unsigned char *) column, pointCount, valueSize, offsets + j * chunkCount);
+    } else {
+      fwrite(column, valueSize, pointCount, file);
+    }
+  }
+  free(column);
+  if (compressed) {
+    fseek(file, headerSize, SEEK_SET);
+    fwrite(offsets, sizeof(uint64_t), offsetCount, file);
+  }
+  free(offsets);
+
+  fixed[0] = (uint32_t) headerSize;
+  sizes[1] = (uint32_t) metadataSize;
+  fseek(file, 8, SEEK_SET);
+  fwrite(fixed, sizeof(uint32_t), 1, file);
+  fseek(file, 36, SEEK_SET);
+  fwrite(&sizes[1], sizeof(uint32_t), 1, file);
+
+  int written = (ferror(file) == 0) && compressedWritten;
+  return (fclose(file) == 0) && written;
+}
+
+static int writeOutput(const char *fileName, const double *output, size_t pointCount, size_t columnCount, int outputFormat)
+{
+  if (outputFormat != OUTPUT_CSV) {
+    return writeBinaryOutput(fileName, output, pointCount, columnCount, (outputFormat == OUTPUT_BINARY_FLOAT32) || (outputFormat == OUTPUT_COMPRESSED_FLOAT32),
+                             outputFormat >= OUTPUT_COMPRESSED_FLOAT64);
+  }
+
+  FILE *file = fopen(fileName, "w");
+  if (file == NULL) {
+    return 0;
+  }
+
+  writeHeader(file);
+  for (size_t i = 0; i < pointCount; ++i) {
+    for (size_t j = 0; j < columnCount; ++j) {
+      fprintf(file, (j == 0) ? "%.17g" : ",%.17g", output[i * columnCount + j]);
+    }
+    fprintf(file, "\\n");
+  }
+
+  return fclose(file) == 0;
+}
+
+int main(int argc, char *argv[])
+{
+  if (argc < 3) {
+    fprintf(stderr, "usage: %s <batch file> <output file name pattern>\\n", argv[0]);
+    return EXIT_FAILURE;
+  }
+
+  FILE *batchFile = fopen(argv[1], "rb");
+  if (batchFile == NULL) {
+    fprintf(stderr, "Could not open batch file '%s'.\\n", argv[1]);
+    return EXIT_FAILURE;
+  }
+
+  uint64_t firstTrial;
+  uint64_t trialCount;
+  uint64_t parameterCount;
+  SolverSettings settings;
+  int outputFormat;
+  if (!readBatchHeader(batchFile, &firstTrial, &trialCount, &parameterCount, &settings, &outputFormat)) {
+    fprintf(stderr, "Batch file '%s' is not valid.\\n", argv[1]);
+    fclose(batchFile);
+    return EXIT_FAILURE;
+  }
+
+#ifndef HAVE_ZLIB
+  if (outputFormat >= OUTPUT_COMPRESSED_FLOAT64) {
+    fprintf(stderr, "siss-batch was built without zlib, it cannot compress its output.\\n");
+    fclose(batchFile);
+    return EXIT_FAILURE;
+  }
+#endif
+
+#ifdef EXTERNAL_VARIABLES
+  if (parameterCount != EXTERNAL_VARIABLE_COUNT) {
+    fprintf(stderr, "Expected %d parameters per trial, batch file has %llu.\\n", EXTERNAL_VARIABLE_COUNT, (unsigned long long) parameterCount);
+    fclose(batchFile);
+    return EXIT_FAILURE;
+  }
+#endif
+
+  Solver *solver = createSolver(&settings);
+  if (solver == NULL) {
+    fprintf(stderr, "Could not create the solver.\\n");
+    fclose(batchFile);
+    return EXIT_FAILURE;
+  }
+
+  size_t columnCount = solverOutputColumnCount();
+  size_t pointCount = solverOutputPointCount(&settings);
+  double *parameters = (double *) malloc((parameterCount + 1) * sizeof(double));
+  double *output = (double *) malloc(pointCount * columnCount * sizeof(double));
+  char fileName[4096];
+  char partialFileName[4101];
+  uint64_t failures = 0;
+
+  for (uint64_t i = 0; i < trialCount; ++i) {
+    unsigned long long trial = (unsigned long long) (firstTrial + i + 1);
+    if (fread(parameters, sizeof(double), parameterCount, batchFile) != parameterCount) {
+      fprintf(stderr, "Batch file '%s' ended before trial %llu.\\n", argv[1], trial);
+      failures += trialCount - i;
+      break;
+    }
+
+    snprintf(fileName, sizeof(fileName), argv[2], trial);
+    /* Outputs are written aside and renamed into place, so an output file is always complete. */
+    snprintf(partialFileName, sizeof(partialFileName), "%s.part", fileName);
+    int flag = solveTrial(solver, parameters, output);
+    if (flag != 0) {
+      fprintf(stderr, "Trial %llu failed with CVODE flag %d.\\n", trial, flag);
+      ++failures;
+    } else if (!writeOutput(partialFileName, output, pointCount, columnCount, outputFormat) || (rename(partialFileName, fileName) != 0)) {
+      fprintf(stderr, "Could not write output file '%s'.\\n", fileName);
+      remove(partialFileName);
+      flag = -1;
+      ++failures;
+    }
+    printf("%llu %d\\n", trial, flag);
+  }
+
+  free(parameters);
+  free(output);
+  deleteSolver(solver);
+  fclose(batchFile);
+
+  return (failures == 0) ? EXIT_SUCCESS : EXIT_FAILURE;
+}
+"""
+
+
+SOLVER_LIBRARY_CODE = """
+#ifdef EXTERNAL_VARIABLES
+#  include "external_variables.h"
+#endif
+
+#if defined(_WIN32)
+#  define SISS_EXPORT __declspec(dllexport)
+#else
+#  define SISS_EXPORT __attribute__((visibility("default")))
+#endif
+
+/*
+ * C ABI of the siss-solver shared library, see shared_library_solver.py.
+ * Only these functions are exported.  A solver is created once for its settings
+ * and solves any number of trials, one at a time, each from its parameter values,
+ * one per external variable, into a caller provided buffer of point count by
+ * column count doubles, in row major order.
+ */
+
+static const char *VARIABLE_TYPE_NAMES[] = {"VARIABLE_OF_INTEGRATION", "STATE", "CONSTANT", "COMPUTED_CONSTANT", "ALGEBRAIC", "EXTERNAL"};
+
+SISS_EXPORT const char *sissModelName(void)
+{
+  return MODEL_NAME;
+}
+
+SISS_EXPORT size_t sissParameterCount(void)
+{
+#ifdef EXTERNAL_VARIABLES
+  return EXTERNAL_VARIABLE_COUNT;
+#else
+  return 0;
+#endif
+}
+
+SISS_EXPORT size_t sissColumnCount(void)
+{
+  return solverOutputColumnCount();
+}
+
+SISS_EXPORT size_t sissPointCount(const SolverSettings *settings)
+{
+  return solverOutputPointCount(settings);
+}
+
+SISS_EXPORT int sissColumnInfo(size_t column, const char **component, const char **name, const char **units, const char **type)
+{
+  const VariableInfo *info;
+  if (column == 0) {
+    info = &VOI_INFO;
+  } else if (column <= STATE_COUNT) {
+    info = &STATE_INFO[column - 1];
+  } else if (column < solverOutputColumnCount()) {
+    info = &VARIABLE_INFO[column - 1 - STATE_COUNT];
+  } else {
+    return 0;
+  }
+
+  *component = info->component;
+  *name = info->name;
+  *units = info->units;
+  *type = VARIABLE_TYPE_NAMES[info->type];
+  return 1;
+}
+
+SISS_EXPORT Solver *sissCreateSolver(const SolverSettings *settings)
+{
+  return createSolver(settings);
+}
+
+SISS_EXPORT int sissSolve(Solver *solver, const double *parameters, double *output)
+{
+  return solveTrial(solver, parameters, output);
+}
+
+SISS_EXPORT void sissDeleteSolver(Solver *solver)
+{
+  deleteSolver(solver);
+}
+"""
+
+
+def generate_batch_solver_c_code(model_name, output_location):
+    """
+    Generate the batch solver, which solves many trials with one reused CVODE
+    instance, the siss-batch driver that reads a block of parameter vectors
+    from a batch file and writes one output file per trial, and the C ABI of
+    the siss-solver shared library.
+    """
+    _write_if_changed(os.path.join(output_location, 'batch_solver.h'), BATCH_SOLVER_INTERFACE_CODE)
+    _write_if_changed(os.path.join(output_location, 'batch_solver.c'), f'\n#include "batch_solver.h"\n#include "{model_name}.h"\n{BATCH_SOLVER_IMPLEMENTATION_CODE}')
+    _write_if_changed(os.path.join(output_location, 'batch_driver.c'), f'\n#include "batch_solver.h"\n#include "{model_name}.h"\n\n#define MODEL_NAME "{model_name}"\n{BATCH_DRIVER_CODE}')
+    _write_if_changed(os.path.join(output_location, 'solver_library.c'),
+                      f'\n#include "batch_solver.h"\n#include "{model_name}.h"\n\n#define MODEL_NAME "{model_name}"\n{SOLVER_LIBRARY_CODE}')
 
 
 def generate_cmake_code(model_name, output_location, external_variables=False):
     external_variables_files = ''
+    external_variables_definition = ''
     if external_variables:
         external_variables_files = """
   ${CMAKE_CURRENT_BINARY_DIR}/external_variables.h
   ${CMAKE_CURRENT_BINARY_DIR}/external_variables.c
+"""
+        external_variables_definition = """
+target_compile_definitions(siss-batch PRIVATE EXTERNAL_VARIABLES)
+if(BUILD_SOLVER_LIBRARY)
+  target_compile_definitions(siss-solver PRIVATE EXTERNAL_VARIABLES)
+endif()
 """
     model_cmake = f"""
 set(HEADER_FILENAME
@@ -166,6 +916,39 @@ set(MODEL_FILES
   ${{CMAKE_CURRENT_BINARY_DIR}}/{model_name}.h
   ${{CMAKE_CURRENT_BINARY_DIR}}/{model_name}.c
 {external_variables_files})
-"""
-    with open(os.path.join(output_location, 'model_files.cmake'), 'w') as f:
-        f.write(model_cmake)
+
+set(BATCH_SOLVER_FILES
+  ${{CMAKE_CURRENT_BINARY_DIR}}/batch_solver.h
+  ${{CMAKE_CURRENT_BINARY_DIR}}/batch_solver.c
+)
+
+if(NOT TARGET SUNDIALS::cvode)
+  find_package(SUNDIALS REQUIRED CONFIG)
+endif()
+
+add_executable(siss-batch ${{CMAKE_CURRENT_BINARY_DIR}}/batch_driver.c ${{BATCH_SOLVER_FILES}} ${{MODEL_FILES}})
+target_include_directories(siss-batch PRIVATE ${{CMAKE_CURRENT_BINARY_DIR}})
+target_link_libraries(siss-batch PRIVATE SUNDIALS::cvode SUNDIALS::nvecserial)
+if(UNIX)
+  target_link_libraries(siss-batch PRIVATE m)
+endif()
+
+# Compressed binary output needs zlib, without it siss-batch refuses batches asking for it.
+find_package(ZLIB)
+if(ZLIB_FOUND)
+  target_compile_definitions(siss-batch PRIVATE HAVE_ZLIB)
+  target_link_libraries(siss-batch PRIVATE ZLIB::ZLIB)
+endif()
+
+# The solver as a shared library, exporting only the functions in solver_library.c.
+if(BUILD_SOLVER_LIBRARY)
+  add_library(siss-solver SHARED ${{CMAKE_CURRENT_BINARY_DIR}}/solver_library.c ${{BATCH_SOLVER_FILES}} ${{MODEL_FILES}})
+  set_target_properties(siss-solver PROPERTIES C_VISIBILITY_PRESET hidden)
+  target_include_directories(siss-solver PRIVATE ${{CMAKE_CURRENT_BINARY_DIR}})
+  target_link_libraries(siss-solver PRIVATE SUNDIALS::cvode SUNDIALS::nvecserial)
+  if(UNIX)
+    target_link_libraries(siss-solver PRIVATE m)
+  endif()
+endif()
+{external_variables_definition}"""
+    _write_if_changed(os.path.join(output_location, 'model_files.cmake'), model_cmake)
@@ -3,12 +3,16 @@ import json
 import math
 import os
 
+import numpy as np
+
 # Take too long to load in forking process so try to delay it.
 # import pandas as pd
 # import plotly.graph_objects as go
 
-from cellsolvertools.generate_code import ModelGenerationError, return_generated_python_code
-from cellsolvertools.utilities import import_code
+from cellsolvertools.binary_output import OUTPUT_FILE_EXTENSION, is_output_file, load_output
+from cellsolvertools.downsampling import DEFAULT_MAX_POINTS, DOWNSAMPLING_METHODS, downsample_indices, shared_downsample_indices
+from cellsolvertools.ensemble_statistics import load_statistics, statistics_summary
+from cellsolvertools.result_cube import is_result_cube, open_result_cube, variable_view
 
 
 def process_arguments():
@@ -23,139 +27,218 @@ def process_arguments():
                         help='instead of plotting list the available solutions')
     parser.add_argument('--model-file', required=True,
                         help='the CellML model file associated with the data in the data directory')
-    parser.add_argument('--plot-traces', store_default=True,
+    parser.add_argument('--plot-traces', action='store_true',
                         help='plot individual traces.')
+    parser.add_argument('--max-points', default=DEFAULT_MAX_POINTS, type=int,
+                        help=f'maximum number of points plotted per trace (default: {DEFAULT_MAX_POINTS})')
+    parser.add_argument('--downsampling', default='lttb', choices=DOWNSAMPLING_METHODS,
+                        help='how points are chosen when a trace has more than the maximum (default: lttb)')
+    parser.add_argument('--dump-data', action='store_true',
+                        help='also write the plotted data, at full resolution, to full_data.csv and full_data.json')
+    parser.add_argument('--statistics-file', default=None,
+                        help='plot the ensemble bands from a statistics checkpoint instead of the trial outputs')
+    parser.add_argument('--workers', default=None, type=int,
+                        help='number of files read in parallel (default: CPU count)')
+    parser.add_argument('--dtype', default='float64', choices=['float64', 'float32'],
+                        help='data type of the loaded values (default: float64)')
 
     return parser
 
 
-def _load_files(filenames, cols):
+def _read_columns(filename, columns, dtype):
+    """
+    Read the given columns, in the given order, of a csv or binary trial output file.
+    Binary files are memory-mapped and only the wanted columns are read.
+    :return: array of shape (rows, columns).
+    """
+    if is_output_file(filename):
+        _, data = load_output(filename, columns)
+        return data.T.astype(dtype, copy=False)
+
     import pandas as pd
+    # usecols keeps the file's column order, put the columns back in the requested order.
+    file_order = sorted(set(columns))
+    data = pd.read_csv(filename, usecols=file_order, dtype=dtype).to_numpy(dtype=dtype)
+    return data[:, [file_order.index(column) for column in columns]]
+
+
+def load_trials(filenames, columns, dtype=np.float64, workers=None, processes=False):
+    """
+    Load the given columns from every trial output file in parallel.
+    :param filenames: csv or binary trial output files, all with the same number of rows.
+    :param columns: list of column indices to read, in the order wanted.
+    :param dtype: data type of the loaded values, e.g. float32 to halve the memory used.
+    :param workers: number of parallel readers, None for the CPU count.
+    :param processes: read in a pool of processes rather than threads, faster when parsing csv files.
+    :return: array of shape (trials, rows, columns).
+    """
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+    if not filenames:
+        return np.empty((0, 0, len(columns)), dtype=dtype)
+
+    first = _read_columns(filenames[0], columns, dtype)
+    data = np.empty((len(filenames),) + first.shape, dtype=dtype)
+    data[0] = first
+    executor = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with executor(max_workers=workers) as pool:
+        trials = pool.map(_read_columns, filenames[1:], [columns] * (len(filenames) - 1), [dtype] * (len(filenames) - 1))
+        for index, trial in enumerate(trials, start=1):
+            data[index] = trial
+
+    return data
+
+
+def trial_output_files(data_directory):
     """
-    Load csv files one by one yielding the wanted columns.
-    Only the first file keeps the first col, assumed to be time.
-    Subsequent files only have cols[1:].
-    :param filenames: csv filenames to read.
-    :param cols: list of columns to keep.
-    :return: yield a dataframe.
+    The trial output files in a directory, in trial order.
     """
-    first = True
-    for filename in filenames:
-        yield pd.read_csv(
-            filename,
-            usecols=cols
-        )
-        if first:
-            first = False
-            cols.pop(0)
-
-
-def _plot_traces(data):
+    return sorted(os.path.join(data_directory, f) for f in os.listdir(data_directory) if os.path.splitext(f)[1] in ['.csv', OUTPUT_FILE_EXTENSION])
+
+
+def _plot_traces(time, series, max_points=DEFAULT_MAX_POINTS, method='lttb', dump_data=False):
     import plotly.graph_objects as go
-    data.to_csv('full_data.csv')
-    data.to_json('full_data.json')
+    if dump_data:
+        data = _result_frame(time, series)
+        data.to_csv('full_data.csv')
+        data.to_json('full_data.json')
+
+    names = _trace_names(series)
+    # One variable over every trial at a time, so only that much of the data is read in at once.
+    kept = {variable_id: downsample_indices(time, values, max_points, method) for variable_id, values in series.items()}
 
     fig = go.Figure()
-    names = data.columns
-    for index, name in enumerate(names[1:]):
-        fig.add_trace(go.Scatter(
-            x=data['time'],
-            y=data.iloc[:, index + 1],
-            name=name
-        ))
+    for trial in range(_trial_count(series)):
+        for variable_id, values in series.items():
+            indices = kept[variable_id][trial]
+            fig.add_trace(go.Scattergl(
+                x=time[indices],
+                y=values[trial][indices],
+                name=names[variable_id][trial]
+            ))
 
     fig.show()
 
 
-def _plot_aggs(parameter_names, epochs, data):
+def _plot_statistics(variable_ids, statistics_file, max_points=DEFAULT_MAX_POINTS, method='lttb'):
     import plotly.graph_objects as go
-    import pandas as pd
 
-    no_time_df = data.drop('time', 1)
-    no_time_df = no_time_df.assign(epochs=epochs)
-    reformed_df = no_time_df.groupby('epochs').agg(['min', 'mean', 'max', "std"])
-    print(reformed_df.columns)
+    statistics = load_statistics(statistics_file)
+    if 'variable_ids' not in statistics:
+        raise ValueError(f'Statistics file "{statistics_file}" does not list its variables.')
+    summary = statistics_summary(statistics)
+    index = {variable_id: i for i, variable_id in enumerate(statistics['variable_ids'].tolist())}
+    time = summary['mean'][:, 0]
+    quantiles = sorted(summary['quantiles'])
+
     fig = go.Figure()
-    for name in parameter_names:
-        y_upper = reformed_df[name, 'mean'] + reformed_df[name, 'std']
-        y_lower = reformed_df[name, 'mean'] - reformed_df[name, 'std']
-        df = pd.concat([y_upper, y_lower[::-1]])
-        df.to_csv('lower_upper.csv')
-        # fig.add_trace(go.Scatter(
-        #     x=data['time'],
-        #     y=pd.concat([y_upper, y_lower[::-1]]),
-        #     fill='toself',
-        #     hoveron='points',
-        #     name=name
-        # ))
-        fig.add_trace(go.Scatter(
-            x=data['time'],
-            y=reformed_df[name, 'mean'],
-            hoveron='points',
+    for name in variable_ids:
+        column = index[name]
+        bands = np.stack([summary['min'][:, column], summary['max'][:, column], *[summary['quantiles'][p][:, column] for p in quantiles]])
+        kept = shared_downsample_indices(time, bands, max_points, method)
+        band_time = np.concatenate([time[kept], time[kept][::-1]])
+        fig.add_trace(go.Scattergl(
+            x=time[kept],
+            y=summary['mean'][kept, column],
             name=f"{name} - mean"
         ))
-        min_ = reformed_df[name, 'min']
-        max_ = reformed_df[name, 'max']
-        fig.add_trace(go.Scatter(
-            x=data['time'],
-            y=pd.concat([max_, min_[::-1]]),
-            hoveron='points',
+        fig.add_trace(go.Scattergl(
+            x=band_time,
+            y=np.concatenate([summary['max'][kept, column], summary['min'][kept, column][::-1]]),
             fill='toself',
             name=f"{name} - range"
         ))
-        # fig.add_trace(go.Scatter(
-        #     x=data['time'],
-        #     y=reformed_df[name, 'max'],
-        #     hoveron='points',
-        #     name=f"{name} - max"
-        # ))
-
+        if len(quantiles) > 1:
+            fig.add_trace(go.Scattergl(
+                x=band_time,
+                y=np.concatenate([summary['quantiles'][quantiles[-1]][kept, column], summary['quantiles'][quantiles[0]][kept, column][::-1]]),
+                fill='toself',
+                name=f"{name} - {quantiles[0]:g} to {quantiles[-1]:g} quantiles"
+            ))
+
+    fig.update_layout(title=f"{summary['count']} trials")
     fig.show()
 
 
 def parameter_list(model_file):
+    from cellsolvertools.generate_code import ModelGenerationError
+    from cellsolvertools.model_cache import model_metadata
+
     try:
-        python_code = return_generated_python_code(model_file)
+        metadata = model_metadata(model_file)
     except ModelGenerationError:
         return {}
 
-    m = import_code(python_code, 'generated_model_python_code')
+    return [*metadata['state_info'], *metadata['variable_info']]
 
-    state_info = m.STATE_INFO
-    variable_info = m.VARIABLE_INFO
 
-    return [*state_info, *variable_info]
+def variable_column_index(model_file):
+    """
+    Map of 'component.name' to the column holding that variable in the trial output files,
+    the first column being the variable of integration.
+    """
+    return {f"{p['component']}.{p['name']}": index + 1 for index, p in enumerate(parameter_list(model_file))}
 
 
-def extract_result_for_config(model_file, config, data_directory):
-    import pandas as pd
+def result_cube_views(data_directory, variable_ids, first_trial=0, last_trial=None):
+    """
+    Views of variables over a range of trials from the result cube in data_directory.
+    Nothing is read until the views are used and no data is copied, so campaigns
+    larger than memory can be analysed a trial range at a time.
+    :param data_directory: directory holding the result cube.
+    :param variable_ids: list of 'component.name' variable ids.
+    :param first_trial: zero based index of the first trial.
+    :param last_trial: index one past the last trial, None for every remaining trial.
+    :return: tuple of the time points and a dict of variable id to array of shape (trials, time).
+    """
+    cube = open_result_cube(data_directory)
+    trials = slice(first_trial, last_trial)
+    time = cube['data'][0, :, 0]
+    return time, {variable_id: variable_view(cube, variable_id, trials) for variable_id in variable_ids}
 
-    parameters = parameter_list(model_file)
 
-    # Auto include time.
-    parameter_indices = [0]
-    parameter_names = ['time']
-    for c in config:
-        parts = c['id'].split('.')
+def _trial_count(series):
+    return next(iter(series.values())).shape[0] if series else 0
 
-        parameter_index = next((index for index, x in enumerate(parameters) if x['name'] == parts[1] and x['component'] == parts[0]), None)
 
-        parameter_index += 1
-        parameter_names.append(c['id'])
-        parameter_indices.append(parameter_index)
+def _trace_names(series):
+    num_trials = _trial_count(series)
+    fill = math.floor(math.log10(max(1, len(series) * num_trials))) + 1
+    return {variable_id: [f"{variable_id} #{str(trial + 1).zfill(fill)}" for trial in range(num_trials)] for variable_id in series}
 
-    data_files = [os.path.join(data_directory, f) for f in os.listdir(data_directory)]
 
-    # data_files_count = len(data_files)
-    data = pd.concat(_load_files(data_files, parameter_indices), axis=1)
-    column_headers = [parameter_names[0]]
-    fill = math.floor(math.log10(len(parameter_names[1:] * (data.shape[1] - 1)))) + 1
-    headers = [f"{name} #{str(trial + 1).zfill(fill)}" for trial in range(data.shape[1] - 1) for name in parameter_names[1:]]
-    # parameter_names[1:] * (data.shape[1] - 1)
-    column_headers.extend(headers)
-    data.columns = column_headers
+def _result_frame(time, series):
+    import pandas as pd
 
-    return data
+    names = _trace_names(series)
+    columns = {'time': time}
+    for trial in range(_trial_count(series)):
+        for variable_id, values in series.items():
+            columns[names[variable_id][trial]] = values[trial]
+
+    return pd.DataFrame(columns)
+
+
+def extract_result_for_config(model_file, config, data_directory, dtype=np.float64, workers=None):
+    """
+    The configured variables of every trial in data_directory, from its result cube or its trial output files.
+    :return: tuple of the time points and a dict of variable id to array of shape (trials, time), views of the
+    result cube or of the trials as loaded, nothing being copied.
+    """
+    variable_ids = [c['id'] for c in config]
+    if is_result_cube(data_directory):
+        return result_cube_views(data_directory, variable_ids)
+
+    index = variable_column_index(model_file)
+    missing = [variable_id for variable_id in variable_ids if variable_id not in index]
+    if missing:
+        raise ValueError(f'Variables {", ".join(missing)} are not in the model.')
+
+    # Auto include time.
+    columns = [0] + [index[variable_id] for variable_id in variable_ids]
+    data = load_trials(trial_output_files(data_directory), columns, dtype, workers)
+    time = data[0, :, 0] if len(data) else np.empty(0, dtype=dtype)
+    return time, {variable_id: data[:, :, k + 1] for k, variable_id in enumerate(variable_ids)}
 
 
 def main():
@@ -165,11 +248,14 @@ def main():
     with open(args.config) as f:
         config = json.load(f)
 
-    data = extract_result_for_config(args.model_file, config, args.data_directory)
+    if args.statistics_file:
+        _plot_statistics([c['id'] for c in config], args.statistics_file, args.max_points, args.downsampling)
+        return
+
+    time, series = extract_result_for_config(args.model_file, config, args.data_directory, args.dtype, args.workers)
 
-    # _plot_aggs(parameter_names, epochs, data)
     if args.plot_traces:
-        _plot_traces(data)
+        _plot_traces(time, series, args.max_points, args.downsampling, args.dump_data)
 
 
 if __name__ == '__main__':
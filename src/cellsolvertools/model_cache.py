@@ -0,0 +1,125 @@
+"""
+Cache of libCellML generated Python code and model metadata.
+
+Generating code parses, validates and analyses the whole model, which for
+large models takes seconds.  The generated code and the variable
+information read from it are kept on disk, keyed by a hash of the model
+file and the libCellML version, and in memory for the rest of the
+process.  The least recently used entries are evicted once the cache
+holds more than MAX_CACHE_ENTRIES models.
+
+The cache lives in $CELLSOLVERTOOLS_CACHE_DIR/models, or
+~/.cache/cellsolvertools/models when that is not set.
+"""
+import hashlib
+import json
+import os
+import tempfile
+
+import libcellml
+
+from cellsolvertools.generate_code import analyse_model, analysed_model_metadata, generated_python_code
+
+MAX_CACHE_ENTRIES = 32
+
+_memo = {}
+
+
+def model_cache_dir():
+    return os.path.join(os.environ.get('CELLSOLVERTOOLS_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'cellsolvertools')), 'models')
+
+
+def model_cache_key(model_file):
+    h = hashlib.sha256(libcellml.versionString().encode())
+    with open(model_file, 'rb') as f:
+        h.update(f.read())
+    return h.hexdigest()
+
+
+def clear_memo():
+    _memo.clear()
+
+
+def _atomic_write(filename, contents):
+    fd, temporary_name = tempfile.mkstemp(dir=os.path.dirname(filename), prefix='.tmp-')
+    with os.fdopen(fd, 'w') as f:
+        f.write(contents)
+    os.replace(temporary_name, filename)
+
+
+def _evict(cache_dir, max_entries):
+    entries = [os.path.join(cache_dir, f) for f in os.listdir(cache_dir) if f.endswith('.json')]
+    if len(entries) <= max_entries:
+        return
+
+    entries.sort(key=lambda f: os.stat(f).st_mtime)
+    for metadata_file in entries[:len(entries) - max_entries]:
+        for filename in [metadata_file, f'{metadata_file[:-len(".json")]}.py']:
+            try:
+                os.remove(filename)
+            except FileNotFoundError:
+                pass
+
+
+def _generate_entry(model_file, cache_dir, key, max_entries):
+    analysis = analyse_model(model_file)
+    python_code = generated_python_code(analysis)
+    metadata = analysed_model_metadata(analysis)
+
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        _atomic_write(os.path.join(cache_dir, f'{key}.py'), python_code)
+        _atomic_write(os.path.join(cache_dir, f'{key}.json'), json.dumps(metadata))
+        _evict(cache_dir, max_entries)
+    except OSError:
+        # An unwritable cache only costs the time to generate the code again.
+        pass
+
+    return {'python_code': python_code, 'metadata': metadata}
+
+
+def _read_entry(cache_dir, key):
+    try:
+        with open(os.path.join(cache_dir, f'{key}.py')) as f:
+            python_code = f.read()
+        metadata_file = os.path.join(cache_dir, f'{key}.json')
+        with open(metadata_file) as f:
+            metadata = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    try:
+        os.utime(metadata_file)
+    except OSError:
+        pass
+    return {'python_code': python_code, 'metadata': metadata}
+
+
+def _cache_entry(model_file, cache_dir, max_entries):
+    cache_dir = model_cache_dir() if cache_dir is None else cache_dir
+    status = os.stat(model_file)
+    memo_key = (os.path.abspath(model_file), status.st_mtime_ns, status.st_size, cache_dir)
+    if memo_key not in _memo:
+        key = model_cache_key(model_file)
+        _memo[memo_key] = _read_entry(cache_dir, key) or _generate_entry(model_file, cache_dir, key, max_entries)
+
+    return _memo[memo_key]
+
+
+def cached_python_code(model_file, cache_dir=None, max_entries=MAX_CACHE_ENTRIES):
+    """
+    The libCellML generated Python code for a model, from the cache when possible.
+    :raises ModelGenerationError: if the model cannot be generated.
+    """
+    return _cache_entry(model_file, cache_dir, max_entries)['python_code']
+
+
+def model_metadata(model_file, cache_dir=None, max_entries=MAX_CACHE_ENTRIES):
+    """
+    The variable information of a model, from the cache when possible.
+    :return: dict with keys ['voi_info', 'state_info', 'variable_info'], as the
+    VOI_INFO, STATE_INFO and VARIABLE_INFO of the generated code with each type
+    given by its name, e.g. 'STATE'.
+    :raises ModelGenerationError: if the model cannot be generated.
+    """
+    return _cache_entry(model_file, cache_dir, max_entries)['metadata']
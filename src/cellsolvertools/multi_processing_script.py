@@ -2,17 +2,29 @@ import argparse
 import multiprocessing
 import os
 import subprocess
+import sys
 
-from concurrent.futures import ProcessPoolExecutor
+from cellsolvertools.trial_scheduler import run_trials
 
 here = os.path.dirname(os.path.abspath(__file__))
 
+# The console script entry point of the cellsolver command line, called in warm worker processes unless trials are isolated.
+CELLSOLVER_ENTRY_POINT = 'cellsolver.main:main'
+
+
+def _cellsolver_command(output_file_name, model, external_variables_module, config):
+    return ["cellsolver", model,
+            "--output-file", output_file_name,
+            "--config", config,
+            "--ext-var", external_variables_module]
+
 
 def run_simulation(output_file_name, model, external_variables_module, config):
-    subprocess.run(["cellsolver", model,
-                    "--output-file", output_file_name,
-                    "--config", config,
-                    "--ext-var", external_variables_module])
+    return subprocess.run(_cellsolver_command(output_file_name, model, external_variables_module, config)).returncode
+
+
+def simulation_trial(index, output_file_name, model, external_variables_module, config):
+    return {'index': index, 'args': _cellsolver_command(output_file_name, model, external_variables_module, config)}
 
 
 def run_simple_sundials_solver():
@@ -31,6 +43,9 @@ def process_arguments():
                         help='the external variable functions module for the model')
     parser.add_argument('--cs-model',
                         help='the libCellML generated model to solve')
+    parser.add_argument('--isolated', action='store_true',
+                        help='start a cellsolver process for every trial instead of solving the trials in worker processes '
+                             'that import cellsolver once')
 
     return parser
 
@@ -39,11 +54,11 @@ def main():
     parser = process_arguments()
     args = parser.parse_args()
 
-    output_file_names = [os.path.join(here, 'dist', f'simulation_output_{i + 1:05d}.pickle') for i in range(args.trials)]
-    with ProcessPoolExecutor(max_workers=args.workers) as executor:
-
-        for output_file_name in output_file_names:
-            executor.submit(run_simulation, output_file_name, args.cs_model, args.cs_ext_var, args.cs_config)
+    trials = (simulation_trial(i + 1, os.path.join(here, 'dist', f'simulation_output_{i + 1:05d}.pickle'), args.cs_model, args.cs_ext_var, args.cs_config)
+              for i in range(args.trials))
+    summary = run_trials(trials, args.workers, entry_point=None if args.isolated else CELLSOLVER_ENTRY_POINT)
+    if summary['failed']:
+        sys.exit(3)
 
 
 if __name__ == '__main__':
@@ -3,10 +3,13 @@ import os
 import pickle
 import sys
 
-from cellsolver.main import apply_config
-from cellsolver.plot import plot_solution, plot_sensitivity
+from concurrent.futures import ProcessPoolExecutor
 
-from cellsolver.utilities import load_config
+import numpy as np
+
+from cellsolvertools.binary_output import is_output_file, load_output
+from cellsolvertools.downsampling import DEFAULT_MAX_POINTS, DOWNSAMPLING_METHODS, shared_downsample_indices
+from cellsolvertools.result_cube import read_trial_output
 
 
 def process_arguments():
@@ -19,16 +22,85 @@ def process_arguments():
                         help='the index of the solution to use in the plot')
     parser.add_argument('--list-solutions', action='store_true',
                         help='instead of plotting list the available solutions')
+    parser.add_argument('--workers', default=None, type=int,
+                        help='number of processes loading data files (default: CPU count)')
+    parser.add_argument('--max-points', default=DEFAULT_MAX_POINTS, type=int,
+                        help=f'maximum number of points plotted per trace (default: {DEFAULT_MAX_POINTS})')
+    parser.add_argument('--downsampling', default='lttb', choices=DOWNSAMPLING_METHODS,
+                        help='how points are chosen when traces have more than the maximum (default: lttb)')
 
     return parser
 
 
+def _is_csv_file(data_file):
+    return os.path.splitext(data_file)[1] == '.csv'
+
+
+def _load_data_file(data_file):
+    """
+    Load a Cell Solver pickle, or a csv or memory-mapped binary trial output file into the same layout.
+    """
+    if is_output_file(data_file) or _is_csv_file(data_file):
+        if is_output_file(data_file):
+            header, data = load_output(data_file)
+            column_info = header['column_info']
+            title = header['model']
+        else:
+            data, column_info = read_trial_output(data_file)
+            data = data.T
+            # csv files do not name their model.
+            title = ''
+        return {
+            'x': data[0],
+            'x_info': column_info[0],
+            'y_n': [data[i] for i in range(1, len(column_info))],
+            'y_n_info': column_info[1:],
+            'title': title,
+        }
+
+    with open(data_file, 'rb') as fb:
+        return pickle.load(fb)
+
+
+def _load_selected_series(data_file, indices):
+    """
+    Load only the selected y_n series of a data file.
+    Binary and csv trial output files read just the selected columns, pickles are
+    loaded in full but only the selected series are returned.
+    """
+    if is_output_file(data_file):
+        _, data = load_output(data_file, [index + 1 for index in indices])
+        return list(data)
+    if _is_csv_file(data_file):
+        return list(np.loadtxt(data_file, delimiter=',', skiprows=1, usecols=[index + 1 for index in indices], ndmin=2).T)
+
+    data = _load_data_file(data_file)
+    return [data['y_n'][index] for index in indices]
+
+
+def load_selected_series(data_files, indices, workers=None):
+    """
+    Load the selected y_n series from every data file in a pool of worker processes,
+    only the selected series are sent back from the workers.
+    :return: list of the selected series, file after file.
+    """
+    selected = []
+    chunk_size = max(1, len(data_files) // (4 * (workers or os.cpu_count() or 1)))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for series in pool.map(_load_selected_series, data_files, [indices] * len(data_files), chunksize=chunk_size):
+            selected.extend(series)
+
+    return selected
+
+
 def main():
     parser = process_arguments()
     args = parser.parse_args()
 
     config = {}
     if args.config is not None:
+        from cellsolver.utilities import load_config
+
         config.update(load_config(args.config))
 
     data_files = []
@@ -39,9 +111,8 @@ def main():
     if len(data_files) == 0:
         sys.exit(-1)
 
-    data_file = data_files[0]
-    with open(data_file, 'rb') as fb:
-        data = pickle.load(fb)
+    data_files.sort()
+    data = _load_data_file(data_files[0])
 
     available_solutions = []
     for entry in data['y_n_info']:
@@ -55,35 +126,34 @@ def main():
             print(f"{index:5d}  {entry}")
         return
 
+    # Cell Solver's plotting stack is only needed once there is something to plot.
+    from cellsolver.main import apply_config
+    from cellsolver.plot import plot_sensitivity
+
     if args.solution_index is not None:
         active_config = {'plot_includes': [available_solutions[args.solution_index]]}
     else:
         active_config = config
 
-    y_n_combined = []
-    y_n_info = None
-    x = None
-    x_info = None
-    title = None
-    # if x is None:
-    #     data_file = data_files[0]
-    for data_file in data_files:
-        with open(data_file, 'rb') as fb:
-            data = pickle.load(fb)
-
-        y_n_wanted, y_info_wanted = apply_config(active_config, data['y_n'], data['y_n_info'])
-        y_n_combined.extend(y_n_wanted)
-        if x is None:
-            x = data['x']
-        if x_info is None:
-            x_info = data['x_info']
-        if y_n_info is None:
-            y_n_info = y_info_wanted[0]
-        if title is None:
-            title = data['title']
+    # Select from the series indices once, every data file shares the first file's layout.
+    indices, y_info_wanted = apply_config(active_config, list(range(len(data['y_n_info']))), data['y_n_info'])
+    x = data['x']
+    x_info = data['x_info']
+    y_n_info = y_info_wanted[0]
+    title = data['title']
+
+    y_n_combined = [data['y_n'][index] for index in indices]
+    del data
+    y_n_combined.extend(load_selected_series(data_files[1:], indices, args.workers))
+
+    if args.downsampling != 'none':
+        kept = shared_downsample_indices(x, np.asarray(y_n_combined), args.max_points, args.downsampling)
+        x = np.asarray(x)[kept]
+        y_n_combined = [np.asarray(y)[kept] for y in y_n_combined]
 
     # plot_solution(x, y_n_combined, x_info, y_n_info, 'bob')
-    plot_sensitivity(x, y_n_combined, x_info, y_n_info, f'{title} - {y_n_info["component"]}.{y_n_info["name"]}')
+    series_name = f'{y_n_info["component"]}.{y_n_info["name"]}'
+    plot_sensitivity(x, y_n_combined, x_info, y_n_info, f'{title} - {series_name}' if title else series_name)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,220 @@
+"""
+Read COMBINE/OMEX archives without extracting all of them.
+
+An OMEX archive is a zip file whose manifest.xml lists its contents and
+their formats.  Ingesting an archive reads the manifest, the JSON pipeline
+config and the SED-ML simulation settings straight from the zip, and
+extracts only the CellML files, the master model and the models it may
+import, keeping their places in the archive so imports resolve.  The extracted files and
+the parsed manifest, config and settings are cached in a directory keyed
+by a hash of the archive, ingesting the same archive again reads nothing
+but the cached description.  The least recently used archives are evicted
+once the cache holds more than MAX_CACHE_ENTRIES of them.
+
+The cache lives in $CELLSOLVERTOOLS_CACHE_DIR/omex, or
+~/.cache/cellsolvertools/omex when that is not set.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+from xml.etree import ElementTree
+from zipfile import ZipFile, BadZipfile
+
+OMEX_MANIFEST = 'manifest.xml'
+OMEX_MANIFEST_NAMESPACE = 'http://identifiers.org/combine.specifications/omex-manifest'
+# Format identifiers, without their scheme as both http and https are in use.
+CELLML_FORMAT = 'identifiers.org/combine.specifications/cellml'
+SEDML_FORMAT = 'identifiers.org/combine.specifications/sed-ml'
+SEDML_NAMESPACE_PREFIX = 'http://sed-ml.org/'
+
+MAX_CACHE_ENTRIES = 32
+
+# Written last, an archive's cache directory without it is incomplete.
+_DESCRIPTION_FILE = 'archive.json'
+
+
+class OmexArchiveError(Exception):
+    pass
+
+
+def omex_cache_dir():
+    return os.path.join(os.environ.get('CELLSOLVERTOOLS_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'cellsolvertools')), 'omex')
+
+
+def archive_hash(filename):
+    h = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _has_format(entry, format_identifier):
+    return entry['format'].split('://', 1)[-1].startswith(format_identifier)
+
+
+def read_manifest(omex_zip):
+    """
+    Read the manifest of an open archive.
+    :return: list of dicts with keys ['location', 'format', 'master'], locations relative to the root of the archive.
+    """
+    try:
+        root = ElementTree.fromstring(omex_zip.read(OMEX_MANIFEST))
+    except KeyError:
+        raise OmexArchiveError(f'The archive has no {OMEX_MANIFEST}.')
+    except ElementTree.ParseError as e:
+        raise OmexArchiveError(f'The archive\'s {OMEX_MANIFEST} is not valid XML: {e}')
+
+    entries = []
+    for content in root.iter(f'{{{OMEX_MANIFEST_NAMESPACE}}}content'):
+        location = os.path.normpath(content.get('location', '')).replace(os.sep, '/')
+        if location in ['.', OMEX_MANIFEST]:
+            continue
+        if location.startswith('/') or location.split('/')[0] == '..':
+            raise OmexArchiveError(f'The archive lists content outside of it, "{content.get("location")}".')
+        entries.append({'location': location, 'format': content.get('format', ''), 'master': content.get('master', 'false') == 'true'})
+
+    return entries
+
+
+def _open_entry(omex_zip, location):
+    try:
+        return omex_zip.open(location)
+    except KeyError:
+        raise OmexArchiveError(f'The archive lists "{location}" but does not hold it.')
+
+
+def _master_model(entries):
+    models = [entry for entry in entries if _has_format(entry, CELLML_FORMAT)]
+    if not models:
+        raise OmexArchiveError('The archive has no CellML model.')
+
+    return next((entry for entry in models if entry['master']), models[0])
+
+
+def _read_config(omex_zip, entries):
+    for entry in entries:
+        if entry['format'].endswith('json') or entry['location'].endswith('.json'):
+            with _open_entry(omex_zip, entry['location']) as f:
+                try:
+                    return json.load(f)
+                except ValueError as e:
+                    raise OmexArchiveError(f'The config "{entry["location"]}" is not valid JSON: {e}')
+
+    return None
+
+
+def _read_simulation(omex_zip, entries):
+    """
+    The simulation settings of the first uniform time course in the archive's SED-ML, streamed from the zip.
+    """
+    for entry in entries:
+        if _has_format(entry, SEDML_FORMAT):
+            with _open_entry(omex_zip, entry['location']) as f:
+                try:
+                    for _, element in ElementTree.iterparse(f, events=['start']):
+                        if element.tag.startswith(f'{{{SEDML_NAMESPACE_PREFIX}') and element.tag.endswith('}uniformTimeCourse'):
+                            start = float(element.get('outputStartTime'))
+                            end = float(element.get('outputEndTime'))
+                            # numberOfPoints before SED-ML L1V3, counting the intervals all the same.
+                            steps = int(element.get('numberOfSteps', element.get('numberOfPoints')))
+                            return {'StartingPoint': start, 'EndingPoint': end, 'PointInterval': (end - start) / steps}
+                except (ElementTree.ParseError, TypeError, ValueError, ZeroDivisionError) as e:
+                    raise OmexArchiveError(f'Could not read the simulation of "{entry["location"]}": {e}')
+
+    return None
+
+
+def _extract(omex_zip, locations, directory):
+    for location in locations:
+        filename = os.path.join(directory, *location.split('/'))
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with _open_entry(omex_zip, location) as source, open(filename, 'wb') as target:
+            shutil.copyfileobj(source, target)
+
+
+def _evict(cache_dir, max_entries):
+    entries = [os.path.join(cache_dir, d) for d in os.listdir(cache_dir) if os.path.isfile(os.path.join(cache_dir, d, _DESCRIPTION_FILE))]
+    if len(entries) <= max_entries:
+        return
+
+    entries.sort(key=lambda d: os.stat(os.path.join(d, _DESCRIPTION_FILE)).st_mtime)
+    for directory in entries[:len(entries) - max_entries]:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def _read_description(directory):
+    description_file = os.path.join(directory, _DESCRIPTION_FILE)
+    try:
+        with open(description_file) as f:
+            description = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    try:
+        os.utime(description_file)
+    except OSError:
+        pass
+    return description
+
+
+def _ingest(filename, directory):
+    try:
+        with ZipFile(filename) as omex_zip:
+            entries = read_manifest(omex_zip)
+            model = _master_model(entries)
+            description = {
+                'manifest': entries,
+                'model': model['location'],
+                'config': _read_config(omex_zip, entries),
+                'simulation': _read_simulation(omex_zip, entries),
+            }
+            _extract(omex_zip, [entry['location'] for entry in entries if _has_format(entry, CELLML_FORMAT)], directory)
+    except BadZipfile as e:
+        raise OmexArchiveError(f'"{filename}" is not a zip archive: {e}')
+
+    with open(os.path.join(directory, _DESCRIPTION_FILE), 'w') as f:
+        json.dump(description, f)
+    return description
+
+
+def ingest_omex_archive(filename, cache_dir=None, max_entries=MAX_CACHE_ENTRIES):
+    """
+    Extract what a simulation needs from an OMEX archive, or find it in the cache.
+    :return: dict with keys ['hash', 'directory', 'model_file', 'manifest', 'config', 'simulation'],
+    model_file being the extracted master CellML model, config the archive's JSON pipeline config
+    and simulation the SED-ML time course as a simulation config, each None when the archive has none.
+    :raises OmexArchiveError: if the archive cannot be read or holds no CellML model.
+    """
+    cache_dir = omex_cache_dir() if cache_dir is None else cache_dir
+    key = archive_hash(filename)
+    directory = os.path.join(cache_dir, key)
+    description = _read_description(directory)
+    if description is None:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Extract next to the cache entry and move it in place, a concurrent ingestion of the same archive finds it complete or not at all.
+        staging_dir = tempfile.mkdtemp(dir=cache_dir, prefix='.tmp-')
+        try:
+            description = _ingest(filename, staging_dir)
+            try:
+                os.rename(staging_dir, directory)
+            except OSError:
+                # Another process got there first, or an incomplete entry is in the way.
+                if _read_description(directory) is None:
+                    shutil.rmtree(directory, ignore_errors=True)
+                    os.rename(staging_dir, directory)
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+        _evict(cache_dir, max_entries)
+
+    return {
+        'hash': key,
+        'directory': directory,
+        'model_file': os.path.join(directory, *description['model'].split('/')),
+        'manifest': description['manifest'],
+        'config': description['config'],
+        'simulation': description['simulation'],
+    }
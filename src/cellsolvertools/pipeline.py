@@ -2,12 +2,13 @@ import argparse
 import json
 import multiprocessing
 import os
-import shutil
 import sys
 
+from cellsolvertools import tracing
+from cellsolvertools.build_code import build_cache_key, cached_executables, store_executables
 from cellsolvertools.common import construct_application_config
-from cellsolvertools.generate_code import generate_c_code
-from cellsolvertools.simple_sundials_solver_manager import entry_point
+from cellsolvertools.omex_archive import OmexArchiveError, ingest_omex_archive
+from cellsolvertools.simple_sundials_solver_manager import PARAMETER_CHANNELS, SOLVER_BACKENDS, build_simulation_code, entry_point
 from cellsolvertools.utilities import is_omex_file, is_cellml_file
 
 
@@ -21,12 +22,39 @@ def check_simulation_dir():
     if not os.path.isfile(os.path.join(os.environ['SIMULATION_DIR'], 'simple-sundials-solver', 'CMakeLists.txt')):
         return False
 
-    build_dir = os.path.join(os.environ['SIMULATION_DIR'], 'build-simple-sundials-solver', 'src')
-    if os.path.isdir(build_dir):
-        shutil.rmtree(os.path.join(os.environ['SIMULATION_DIR'], 'build-simple-sundials-solver'))
+    # Keep an existing build directory, make only rebuilds what changed.
+    os.makedirs(os.path.join(os.environ['SIMULATION_DIR'], 'build-simple-sundials-solver', 'src'), exist_ok=True)
+
+    return True
 
-    os.makedirs(build_dir)
 
+@tracing.traced('prepare_application')
+def prepare_application(model_file, code_generation_config, application_config):
+    """
+    Generate and build the solver for a model, unless a build with the same inputs is
+    in the build cache, and point the application config at the cached executables.
+    :return: True if the solver is ready to run.
+    """
+    cache_dir = application_config['build_cache_dir']
+    key = build_cache_key(model_file, code_generation_config, application_config['sundials_dir'], application_config['src_dir'])
+    executables = cached_executables(cache_dir, key)
+    if executables is None:
+        print('Building solver.')
+        from cellsolvertools.generate_code import generate_c_code
+
+        generate_c_code(model_file, os.path.join(application_config['build_dir'], 'src'), code_generation_config)
+        if not build_simulation_code(application_config['build_dir'], application_config['src_dir'], application_config['sundials_dir'],
+                                     'external_variables' in code_generation_config, code_generation_config.get('shared_library', False)):
+            return False
+        executables = store_executables(cache_dir, key, application_config)
+        if executables is None:
+            return False
+    else:
+        print('Using cached solver build.')
+
+    application_config.update(executables)
+    application_config['prebuilt'] = True
+    application_config['build_key'] = key
     return True
 
 
@@ -34,10 +62,19 @@ def is_valid_config(config):
     if 'uncertainties' in config and type(config['uncertainties']) != dict:
         return False
 
-    if 'num_trials' not in config:
+    if 'sensitivity' in config:
+        # The trials of a sensitivity analysis are its Saltelli design, num_trials is not used.
+        if type(config['sensitivity']) != dict or not config.get('uncertainties') or config['sensitivity'].get('base_samples', 0) < 1:
+            return False
+    elif 'num_trials' not in config:
+        return False
+    elif config['num_trials'] < 1:
         return False
 
-    if config['num_trials'] < 1:
+    if config.get('parameter_channel', 'environment') not in PARAMETER_CHANNELS:
+        return False
+
+    if config.get('solver_backend', 'sundials') not in SOLVER_BACKENDS:
         return False
 
     return True
@@ -51,6 +88,8 @@ def process_arguments():
                         help='the configuration for the model, not required if not doing sensitivity analysis or the model input is an OMEX file.')
     parser.add_argument('--workers', default=multiprocessing.cpu_count(), type=int,
                         help='number of workers to use (default: CPU count)')
+    parser.add_argument('--trace', default=None,
+                        help='write a Chrome trace of the run to this file and print a timing summary')
 
     return parser
 
@@ -58,6 +97,18 @@ def process_arguments():
 def main():
     parser = process_arguments()
     args = parser.parse_args()
+
+    if args.trace:
+        tracing.enable()
+    try:
+        with tracing.span('pipeline'):
+            _run_pipeline(args)
+    finally:
+        if args.trace:
+            tracing.write_report(args.trace)
+
+
+def _run_pipeline(args):
     print('Running pipeline ...')
 
     if not check_simulation_dir():
@@ -77,23 +128,50 @@ def main():
         config = None
 
     if is_omex_file(args.model):
-        print('Handle OMEX archive.')
-    elif is_cellml_file(args.model) and config is not None:
+        print('Process OMEX archive')
+        try:
+            archive = ingest_omex_archive(args.model)
+        except OmexArchiveError as e:
+            print(e)
+            sys.exit(2)
+        model_file = archive['model_file']
+        # A config given on the command line takes precedence over the archive's.
+        if config is None and archive['config'] is not None and is_valid_config(archive['config']):
+            config = archive['config']
+        if config is not None and archive['simulation'] is not None:
+            config.setdefault('simulation', archive['simulation'])
+    elif is_cellml_file(args.model):
         print('Process CellML with config')
-        code_generation_config = {}
-        if 'uncertainties' in config:
-            code_generation_config['external_variables'] = config['uncertainties']
-
-        generate_c_code(args.model, os.path.join(os.environ['SIMULATION_DIR'], 'build-simple-sundials-solver', 'src'), code_generation_config)
-
-        config['application'] = construct_application_config(os.environ['SIMULATION_DIR'], os.environ['SIMULATION_SUNDIALS_DIR'])
-        config['workers'] = args.workers
-
-        # Compile application
-        entry_point(config)
+        model_file = args.model
     else:
         sys.exit(2)
 
+    if config is None:
+        sys.exit(2)
+
+    code_generation_config = {}
+    if 'uncertainties' in config:
+        code_generation_config['external_variables'] = config['uncertainties']
+    if config.get('solver_backend') == 'library':
+        code_generation_config['shared_library'] = True
+
+    config['application'] = construct_application_config(os.environ['SIMULATION_DIR'], os.environ['SIMULATION_SUNDIALS_DIR'])
+    config['workers'] = args.workers
+
+    if config.get('solver_backend', 'sundials') == 'numpy':
+        config['model_file'] = model_file
+    # Compile application, if not already built.
+    elif not prepare_application(model_file, code_generation_config, config['application']):
+        sys.exit(4)
+    summary = entry_point(config)
+    if 'sensitivity' in summary:
+        from cellsolvertools.sample_parameter_uncertainties import parameter_names
+        from cellsolvertools.sensitivity_analysis import sensitivity_summary
+
+        print('\n'.join(sensitivity_summary(summary['sensitivity'], parameter_names(config['uncertainties']))))
+    if summary['failed']:
+        sys.exit(3)
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,159 @@
+"""
+Consolidated trials x time x variables result cube.
+
+Each finished trial is appended into a single memory-mapped array on disk
+so that analyses can take views of any variable over any range of trials
+without loading, or even fitting, the whole campaign in memory.
+
+A result cube is a directory holding:
+
+  data.npy       the trials x time x variables array (NumPy .npy format)
+  completed.npy  a flag per trial, set once the trial has been appended
+  index.json     the column information of the variables, the first
+                 variable being the variable of integration
+"""
+import json
+import os
+
+import numpy as np
+
+from cellsolvertools.binary_output import is_output_file, load_output
+
+DATA_FILE = 'data.npy'
+COMPLETED_FILE = 'completed.npy'
+INDEX_FILE = 'index.json'
+
+
+class ResultCubeError(Exception):
+    pass
+
+
+def is_result_cube(directory):
+    return os.path.isfile(os.path.join(directory, INDEX_FILE)) and os.path.isfile(os.path.join(directory, DATA_FILE))
+
+
+def _variable_index(column_info):
+    return {f"{c['component']}.{c['name']}": index for index, c in enumerate(column_info)}
+
+
+def create_result_cube(directory, num_trials, num_times, column_info, dtype=np.float64):
+    """
+    Create an empty result cube, not yet completed trials are filled with NaN.
+    :param directory: directory to hold the result cube.
+    :param num_trials: number of trials.
+    :param num_times: number of time points in each trial.
+    :param column_info: list of dicts with keys ['component', 'name', ...], one per variable.
+    :param dtype: float64 or float32.
+    :return: the result cube opened for writing.
+    """
+    os.makedirs(directory, exist_ok=True)
+    data = np.lib.format.open_memmap(os.path.join(directory, DATA_FILE), mode='w+', dtype=dtype, shape=(num_trials, num_times, len(column_info)))
+    data[:] = np.nan
+    completed = np.lib.format.open_memmap(os.path.join(directory, COMPLETED_FILE), mode='w+', dtype=np.bool_, shape=(num_trials,))
+    with open(os.path.join(directory, INDEX_FILE), 'w') as f:
+        json.dump({'column_info': column_info}, f)
+
+    return {'directory': directory, 'data': data, 'completed': completed, 'column_info': column_info, 'index': _variable_index(column_info)}
+
+
+def open_result_cube(directory, mode='r'):
+    """
+    Open an existing result cube.
+    :param directory: directory holding the result cube.
+    :param mode: 'r' to read, 'r+' to append more trials.
+    :return: dict with keys ['directory', 'data', 'completed', 'column_info', 'index'],
+    index mapping 'component.name' to the variable index.
+    """
+    if not is_result_cube(directory):
+        raise ResultCubeError(f'Directory "{directory}" does not hold a result cube.')
+
+    with open(os.path.join(directory, INDEX_FILE)) as f:
+        column_info = json.load(f)['column_info']
+
+    return {
+        'directory': directory,
+        'data': np.load(os.path.join(directory, DATA_FILE), mmap_mode=mode),
+        'completed': np.load(os.path.join(directory, COMPLETED_FILE), mmap_mode=mode),
+        'column_info': column_info,
+        'index': _variable_index(column_info),
+    }
+
+
+def append_trial(cube, trial_index, data):
+    """
+    Store the output of one trial in the result cube.
+    :param cube: result cube opened for writing.
+    :param trial_index: zero based index of the trial.
+    :param data: array of shape (time, variables).
+    """
+    if data.shape != cube['data'].shape[1:]:
+        raise ResultCubeError(f'Trial output of shape {data.shape} does not fit a result cube of shape {cube["data"].shape[1:]}.')
+
+    cube['data'][trial_index] = data
+    cube['completed'][trial_index] = True
+
+
+def read_trial_output(filename):
+    """
+    Read a csv or binary trial output file as an array of shape (time, variables), with its column information.
+    """
+    if is_output_file(filename):
+        header, data = load_output(filename)
+        return data.T, header['column_info']
+
+    with open(filename) as f:
+        names = f.readline().strip().split(',')
+    column_info = [dict(zip(['component', 'name'], name.rsplit('.', 1) if '.' in name else ['', name])) for name in names]
+    return np.loadtxt(filename, delimiter=',', skiprows=1, ndmin=2), column_info
+
+
+def remove_result_cube(directory):
+    """
+    Remove the result cube in directory, if there is one, leaving anything else there.
+    """
+    for name in [INDEX_FILE, DATA_FILE, COMPLETED_FILE]:
+        filename = os.path.join(directory, name)
+        if os.path.isfile(filename):
+            os.remove(filename)
+
+
+def _check_result_cube(cube, num_trials, num_times, column_info):
+    variable_ids = list(_variable_index(column_info))
+    if cube['data'].shape[:2] != (num_trials, num_times) or list(cube['index']) != variable_ids:
+        raise ResultCubeError(f'The result cube in "{cube["directory"]}" holds {cube["data"].shape[0]} trials of {cube["data"].shape[1]} time points '
+                              f'of {list(cube["index"])}, not {num_trials} trials of {num_times} time points of {variable_ids}.')
+
+
+def consolidate_trial(directory, num_trials, trial_index, data, column_info, dtype=np.float64, cube=None):
+    """
+    Append the output of a trial to the result cube in directory, creating the cube from
+    the first trial output if needed.  An existing cube has to be of the same campaign.
+    :param data: array of shape (time, variables), as given by read_trial_output.
+    :return: the result cube, pass it back in to avoid reopening the cube for every trial.
+    :raises ResultCubeError: if the existing cube differs in its number of trials, time points or variables.
+    """
+    if cube is None:
+        if is_result_cube(directory):
+            cube = open_result_cube(directory, mode='r+')
+            _check_result_cube(cube, num_trials, data.shape[0], column_info)
+        else:
+            cube = create_result_cube(directory, num_trials, data.shape[0], column_info, dtype)
+
+    append_trial(cube, trial_index, data)
+    return cube
+
+
+def variable_view(cube, variable_id, trials=slice(None)):
+    """
+    View of one variable over a range of trials, no data is copied.
+    :param cube: open result cube.
+    :param variable_id: 'component.name' of the variable.
+    :param trials: slice selecting the trials.
+    :return: array of shape (trials, time).
+    """
+    try:
+        index = cube['index'][variable_id]
+    except KeyError:
+        raise ResultCubeError(f'Variable "{variable_id}" is not in the result cube.')
+
+    return cube['data'][trials, :, index]
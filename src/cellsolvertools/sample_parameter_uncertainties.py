@@ -0,0 +1,446 @@
+"""
+Sample parameter uncertainties directly with NumPy.
+
+Reads the same JSON description of parameter uncertainties as
+define_parameter_uncertainties, but draws every trial at once without
+going through SBML-distrib and libroadrunner.
+
+Supported designs:
+
+  random  independent draws, trial i always comes from the same stream
+  lhs     Latin hypercube design
+  sobol   scrambled Sobol' sequence
+
+Parameters can be correlated through a Gaussian copula by giving a
+correlation matrix ordered the same way as the configuration.
+
+The returned parameter names are the component__name form expected by
+the generated external variable code.
+"""
+import argparse
+import json
+import math
+import os
+import sys
+
+import numpy as np
+
+from cellsolvertools.common import external_variable_name
+
+# Trials are drawn in blocks, each block has its own stream derived from the seed.
+# Trial i is therefore the same no matter how many trials are drawn, or where the
+# drawing starts.
+STREAM_BLOCK_SIZE = 1024
+
+DESIGNS = ['random', 'lhs', 'sobol']
+
+# Redraws of a truncated parameter without a cumulative distribution function before
+# its bounds are taken to hold too little of the distribution to sample from.
+MAX_REJECTION_ROUNDS = 1000
+
+
+class SamplingError(Exception):
+    pass
+
+
+def _standard_normal_cdf(z):
+    from scipy.special import ndtr
+
+    return ndtr(z)
+
+
+def _standard_normal_ppf(u):
+    from scipy.special import ndtri
+
+    return ndtri(np.asarray(u, dtype=float))
+
+
+def _normal_cdf(x, mean, stdev):
+    return 0.5 * math.erfc(-(x - mean) / (stdev * math.sqrt(2.0)))
+
+
+# Each distribution has the number of its own parameters (the remaining two, if given,
+# are the truncation bounds), a cumulative distribution function used to truncate,
+# an inverse cumulative distribution function used by the designs and the copula, and
+# a native NumPy generator draw.
+def _normal_ppf(u, p):
+    return p[0] + p[1] * _standard_normal_ppf(u)
+
+
+def _lognormal_ppf(u, p):
+    return np.exp(_normal_ppf(u, p))
+
+
+def _uniform_ppf(u, p):
+    return p[0] + (p[1] - p[0]) * u
+
+
+def _exponential_ppf(u, p):
+    return -np.log1p(-u) / p[0]
+
+
+def _cauchy_ppf(u, p):
+    return p[0] + p[1] * np.tan(math.pi * (u - 0.5))
+
+
+def _laplace_ppf(u, p):
+    return p[0] - p[1] * np.sign(u - 0.5) * np.log1p(-2.0 * np.abs(u - 0.5))
+
+
+def _rayleigh_ppf(u, p):
+    return p[0] * np.sqrt(-2.0 * np.log1p(-u))
+
+
+def _bernoulli_ppf(u, p):
+    return (u > 1.0 - p[0]).astype(float)
+
+
+_DISTRIBUTIONS = {
+    'normal': {
+        'size': 2,
+        'cdf': lambda x, p: _normal_cdf(x, p[0], p[1]),
+        'ppf': _normal_ppf,
+        'draw': lambda rng, p, n: p[0] + p[1] * rng.standard_normal(n),
+    },
+    'lognormal': {
+        'size': 2,
+        'cdf': lambda x, p: _normal_cdf(math.log(x), p[0], p[1]) if x > 0 else 0.0,
+        'ppf': _lognormal_ppf,
+        'draw': lambda rng, p, n: np.exp(p[0] + p[1] * rng.standard_normal(n)),
+    },
+    'uniform': {
+        'size': 2,
+        'cdf': lambda x, p: min(max((x - p[0]) / (p[1] - p[0]), 0.0), 1.0),
+        'ppf': _uniform_ppf,
+        'draw': lambda rng, p, n: p[0] + (p[1] - p[0]) * rng.random(n),
+    },
+    'exponential': {
+        'size': 1,
+        'cdf': lambda x, p: 1.0 - math.exp(-p[0] * x) if x > 0 else 0.0,
+        'ppf': _exponential_ppf,
+        'draw': lambda rng, p, n: rng.standard_exponential(n) / p[0],
+    },
+    'cauchy': {
+        'size': 2,
+        'cdf': lambda x, p: 0.5 + math.atan((x - p[0]) / p[1]) / math.pi,
+        'ppf': _cauchy_ppf,
+        'draw': lambda rng, p, n: p[0] + p[1] * rng.standard_cauchy(n),
+    },
+    'laplace': {
+        'size': 2,
+        'cdf': lambda x, p: 0.5 * math.exp((x - p[0]) / p[1]) if x < p[0] else 1.0 - 0.5 * math.exp(-(x - p[0]) / p[1]),
+        'ppf': _laplace_ppf,
+        'draw': lambda rng, p, n: rng.laplace(p[0], p[1], n),
+    },
+    'rayleigh': {
+        'size': 1,
+        'cdf': lambda x, p: 1.0 - math.exp(-x * x / (2.0 * p[0] * p[0])) if x > 0 else 0.0,
+        'ppf': _rayleigh_ppf,
+        'draw': lambda rng, p, n: p[0] * np.sqrt(2.0 * rng.standard_exponential(n)),
+    },
+    'bernoulli': {
+        'size': 1,
+        'cdf': None,
+        'ppf': _bernoulli_ppf,
+        'draw': lambda rng, p, n: rng.binomial(1, p[0], n).astype(float),
+    },
+    'gamma': {
+        'size': 2,
+        'cdf': None,
+        'ppf': None,
+        'draw': lambda rng, p, n: rng.gamma(p[0], p[1], n),
+    },
+    'chisquare': {
+        'size': 1,
+        'cdf': None,
+        'ppf': None,
+        'draw': lambda rng, p, n: rng.chisquare(p[0], n),
+    },
+    'poisson': {
+        'size': 1,
+        'cdf': None,
+        'ppf': None,
+        'draw': lambda rng, p, n: rng.poisson(p[0], n).astype(float),
+    },
+    'binomial': {
+        'size': 2,
+        'cdf': None,
+        'ppf': None,
+        'draw': lambda rng, p, n: rng.binomial(np.asarray(p[0]).astype(int), p[1], n).astype(float),
+    },
+}
+
+
+def _sort_parameter_values_key(item):
+    return item[0]
+
+
+def _distribution_values(parameter_values):
+    values = [(k, v) for k, v in parameter_values.items() if k.startswith('p')]
+    return [float(v[1]) for v in sorted(values, key=_sort_parameter_values_key)]
+
+
+def parameter_names(config):
+    """
+    The external variable names, in order, of the parameters in the uncertainty configuration.
+    """
+    return [external_variable_name(parameter) for parameter in config]
+
+
+def describe_parameters(config):
+    """
+    Validate an uncertainty configuration and describe each parameter's distribution.
+    :param config: dict of parameter name to distribution description.
+    :return: list of dicts with keys ['name', 'distribution', 'values', 'bounds'].
+    """
+    descriptions = []
+    for parameter in config:
+        parameter_values = config[parameter]
+        distribution = parameter_values.get('distribution')
+        if distribution not in _DISTRIBUTIONS:
+            raise SamplingError(f'Parameter "{parameter}" has unsupported distribution "{distribution}".')
+
+        values = _distribution_values(parameter_values)
+        size = _DISTRIBUTIONS[distribution]['size']
+        if len(values) not in [size, size + 2]:
+            raise SamplingError(f'Parameter "{parameter}" requires {size} (or {size + 2} when truncated) values for distribution "{distribution}", found {len(values)}.')
+
+        descriptions.append({
+            'name': external_variable_name(parameter),
+            'distribution': distribution,
+            'values': values[:size],
+            'bounds': values[size:] if len(values) > size else None,
+        })
+
+    return descriptions
+
+
+def _block_generator(seed, block):
+    return np.random.Generator(np.random.PCG64(np.random.SeedSequence(seed, spawn_key=(block,))))
+
+
+def _truncated_cdf_range(description):
+    distribution = _DISTRIBUTIONS[description['distribution']]
+    if description['bounds'] is None:
+        return 0.0, 1.0
+
+    if distribution['cdf'] is None:
+        raise SamplingError(f'Distribution "{description["distribution"]}" does not support truncation.')
+
+    lower, upper = description['bounds']
+    return distribution['cdf'](lower, description['values']), distribution['cdf'](upper, description['values'])
+
+
+def apply_marginals(uniforms, descriptions):
+    """
+    Map points of the unit hypercube to parameter values through each parameter's inverse cumulative distribution function.
+    :param descriptions: parameter descriptions, see describe_parameters.
+    """
+    samples = np.empty_like(uniforms)
+    for column, description in enumerate(descriptions):
+        distribution = _DISTRIBUTIONS[description['distribution']]
+        if distribution['ppf'] is None:
+            raise SamplingError(f'Distribution "{description["distribution"]}" can only be sampled with the "random" design and no correlation.')
+
+        lower, upper = _truncated_cdf_range(description)
+        u = uniforms[:, column]
+        if description['bounds'] is not None:
+            u = lower + (upper - lower) * u
+        samples[:, column] = distribution['ppf'](u, description['values'])
+
+    return samples
+
+
+def _random_uniforms(seed, num_parameters, start, num_samples):
+    uniforms = np.empty((num_samples, num_parameters))
+    first_block = start // STREAM_BLOCK_SIZE
+    last_block = (start + num_samples - 1) // STREAM_BLOCK_SIZE
+    for block in range(first_block, last_block + 1):
+        block_start = block * STREAM_BLOCK_SIZE
+        lo = max(start, block_start)
+        hi = min(start + num_samples, block_start + STREAM_BLOCK_SIZE)
+        block_uniforms = _block_generator(seed, block).random((STREAM_BLOCK_SIZE, num_parameters))
+        uniforms[lo - start:hi - start, :] = block_uniforms[lo - block_start:hi - block_start, :]
+
+    return uniforms
+
+
+def _random_native(seed, descriptions, start, num_samples):
+    # Untruncated, uncorrelated parameters are drawn with NumPy's own generators, all
+    # the parameters sharing a distribution in one call.  Truncated parameters go through
+    # the inverse cumulative distribution function where available and are otherwise
+    # resampled until they land inside their bounds.
+    groups = {}
+    truncated = []
+    for column, description in enumerate(descriptions):
+        if description['bounds'] is None:
+            groups.setdefault(description['distribution'], []).append(column)
+        else:
+            truncated.append(column)
+    group_values = {distribution: np.array([descriptions[c]['values'] for c in columns]).T for distribution, columns in groups.items()}
+
+    samples = np.empty((num_samples, len(descriptions)))
+    first_block = start // STREAM_BLOCK_SIZE
+    last_block = (start + num_samples - 1) // STREAM_BLOCK_SIZE
+    for block in range(first_block, last_block + 1):
+        block_start = block * STREAM_BLOCK_SIZE
+        lo = max(start, block_start)
+        hi = min(start + num_samples, block_start + STREAM_BLOCK_SIZE)
+        rng = _block_generator(seed, block)
+        for distribution, columns in groups.items():
+            block_samples = _DISTRIBUTIONS[distribution]['draw'](rng, group_values[distribution], (STREAM_BLOCK_SIZE, len(columns)))
+            samples[lo - start:hi - start, columns] = block_samples[lo - block_start:hi - block_start, :]
+
+        for column in truncated:
+            description = descriptions[column]
+            distribution = _DISTRIBUTIONS[description['distribution']]
+            values = description['values']
+            if distribution['ppf'] is not None and distribution['cdf'] is not None:
+                lower, upper = _truncated_cdf_range(description)
+                block_samples = distribution['ppf'](lower + (upper - lower) * rng.random(STREAM_BLOCK_SIZE), values)
+            else:
+                lower, upper = description['bounds']
+                block_samples = distribution['draw'](rng, values, STREAM_BLOCK_SIZE)
+                outside = (block_samples < lower) | (block_samples > upper)
+                for _ in range(MAX_REJECTION_ROUNDS):
+                    if not outside.any():
+                        break
+                    block_samples[outside] = distribution['draw'](rng, values, int(outside.sum()))
+                    outside = (block_samples < lower) | (block_samples > upper)
+                else:
+                    raise SamplingError(f'Parameter "{description["name"]}" could not be drawn inside its bounds [{lower}, {upper}] '
+                                        f'in {MAX_REJECTION_ROUNDS} rounds, they hold too little of its distribution.')
+
+            samples[lo - start:hi - start, column] = block_samples[lo - block_start:hi - block_start]
+
+    return samples
+
+
+def latin_hypercube(num_samples, num_parameters, rng):
+    """
+    Latin hypercube design on the unit hypercube, one random point in each stratum.
+    """
+    strata = rng.permuted(np.tile(np.arange(num_samples), (num_parameters, 1)), axis=1).T
+    return (strata + rng.random((num_samples, num_parameters))) / num_samples
+
+
+def sobol_sequence(num_samples, num_parameters, seed, start=0):
+    """
+    Scrambled Sobol' design on the unit hypercube, skipping the first start points.
+    """
+    from scipy.stats import qmc
+
+    sampler = qmc.Sobol(d=num_parameters, scramble=True, seed=np.random.default_rng(seed))
+    if start:
+        sampler.fast_forward(start)
+    return sampler.random(num_samples)
+
+
+def design_uniforms(num_samples, num_parameters, method, seed, start=0):
+    """
+    Points of a design on the unit hypercube.
+    :param method: design to use, one of DESIGNS.
+    :return: num_samples x num_parameters array.
+    """
+    if method == 'random':
+        return _random_uniforms(seed, num_parameters, start, num_samples)
+    if method == 'lhs':
+        return latin_hypercube(num_samples, num_parameters, _block_generator(seed, start))
+    return sobol_sequence(num_samples, num_parameters, seed, start)
+
+
+def _correlate(uniforms, correlation):
+    correlation = np.asarray(correlation, dtype=float)
+    num_parameters = uniforms.shape[1]
+    if correlation.shape != (num_parameters, num_parameters):
+        raise SamplingError(f'Correlation matrix must be {num_parameters}x{num_parameters}, found {correlation.shape}.')
+
+    try:
+        lower = np.linalg.cholesky(correlation)
+    except np.linalg.LinAlgError:
+        raise SamplingError('Correlation matrix is not positive definite.')
+
+    # Keep the uniforms strictly inside (0, 1) so the normal scores are finite.
+    uniforms = np.clip(uniforms, np.finfo(float).tiny, 1.0 - np.finfo(float).epsneg)
+    normal_scores = _standard_normal_ppf(uniforms) @ lower.T
+    return _standard_normal_cdf(normal_scores)
+
+
+def sample_parameter_uncertainties(config, num_samples, method='random', seed=None, correlation=None, start=0):
+    """
+    Draw samples for all the parameters in an uncertainty configuration.
+    :param config: dict of parameter name to distribution description.
+    :param num_samples: number of samples (trials) to draw.
+    :param method: design to use, one of DESIGNS.
+    :param seed: seed for the random streams, None for fresh entropy.
+    :param correlation: optional correlation matrix between the parameters, in configuration order.
+    :param start: index of the first trial to draw, earlier trials are skipped.
+    :return: tuple of the list of parameter names and a num_samples x num_parameters array.
+    """
+    if method not in DESIGNS:
+        raise SamplingError(f'Unknown sampling design "{method}", expected one of {DESIGNS}.')
+
+    descriptions = describe_parameters(config)
+    names = [d['name'] for d in descriptions]
+    num_parameters = len(descriptions)
+    if num_samples < 1 or num_parameters == 0:
+        return names, np.empty((max(num_samples, 0), num_parameters))
+
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+
+    if method == 'random' and correlation is None:
+        return names, _random_native(seed, descriptions, start, num_samples)
+
+    uniforms = design_uniforms(num_samples, num_parameters, method, seed, start)
+    if correlation is not None:
+        uniforms = _correlate(uniforms, correlation)
+
+    return names, apply_marginals(uniforms, descriptions)
+
+
+def process_arguments():
+    parser = argparse.ArgumentParser(description="Sample parameter uncertainties with NumPy.")
+    parser.add_argument('config', help='configuration for the parameters')
+    parser.add_argument('--trials', default=10, type=int,
+                        help='number of trials to sample (default: 10)')
+    parser.add_argument('--method', default='random', choices=DESIGNS,
+                        help='sampling design to use (default: random)')
+    parser.add_argument('--seed', default=None, type=int,
+                        help='seed for the random streams')
+    parser.add_argument('--correlation', default=None,
+                        help='JSON file with the correlation matrix for the parameters')
+
+    return parser
+
+
+def main():
+    parser = process_arguments()
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.config):
+        sys.exit(1)
+
+    try:
+        with open(args.config) as f:
+            config = json.load(f)
+        correlation = None
+        if args.correlation is not None:
+            with open(args.correlation) as f:
+                correlation = json.load(f)
+    except json.JSONDecodeError:
+        sys.exit(2)
+
+    try:
+        names, samples = sample_parameter_uncertainties(config, args.trials, args.method, args.seed, correlation)
+    except SamplingError as e:
+        print(e, file=sys.stderr)
+        sys.exit(3)
+
+    print(','.join(names))
+    for sample in samples:
+        print(','.join([repr(v) for v in sample.tolist()]))
+
+
+if __name__ == '__main__':
+    main()
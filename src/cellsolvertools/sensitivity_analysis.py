@@ -0,0 +1,244 @@
+"""
+Variance-based global sensitivity analysis, Sobol' indices from a Saltelli design.
+
+For P uncertain parameters and N base samples the design is N (P + 2)
+trials, the matrices A, B, AB_1, ..., AB_P of N trials each one after the
+other, AB_i being A with its i-th parameter taken from B.  The indices of
+every output are estimated at once with NumPy:
+
+  first-order   S_i  = E[f(B) (f(AB_i) - f(A))] / V    (Saltelli et al., 2010)
+  total-order   ST_i = E[(f(A) - f(AB_i))^2] / 2 V      (Jansen, 1999)
+
+V being the variance of f over A and B together.  The trial outputs are
+read from the result cube a chunk of base samples at a time, so only the
+sums behind the estimators are kept in memory whatever the number of
+trials.  A base sample counts only when all of its P + 2 trials completed.
+
+Confidence intervals come from a Poisson bootstrap, each base sample
+weighted by a Poisson(1) draw in every resample, which suits reading the
+trials in chunks.  The weights are drawn per block of base samples from
+the seed, in a stream of their own apart from the design's, so the
+intervals do not depend on the chunk size.
+"""
+import warnings
+
+import numpy as np
+
+from cellsolvertools.sample_parameter_uncertainties import DESIGNS, SamplingError, apply_marginals, describe_parameters, design_uniforms
+
+SENSITIVITY_FILE = 'sensitivity.npz'
+
+DEFAULT_BOOTSTRAP = 100
+DEFAULT_CONFIDENCE = 0.95
+# Upper bound on the trial outputs read from the result cube at a time.
+DEFAULT_BLOCK_BYTES = 2 ** 27
+WEIGHT_BLOCK_SIZE = 1024
+# The weights' streams are spawned under this key, apart from the design's streams drawn from the same seed.
+WEIGHT_STREAM = 1
+
+# How a trial's output over time is reduced before its indices are estimated, 'none' keeps every time point.
+REDUCTIONS = ['none', 'final', 'mean', 'min', 'max']
+
+
+class SensitivityAnalysisError(Exception):
+    pass
+
+
+def saltelli_trial_count(base_samples, num_parameters):
+    return base_samples * (num_parameters + 2)
+
+
+def saltelli_samples(config, base_samples, method='random', seed=None):
+    """
+    Saltelli design for the parameters of an uncertainty configuration.
+    :param config: dict of parameter name to distribution description.
+    :param base_samples: number of rows, N, of each matrix.
+    :param method: design to draw A and B from, one of DESIGNS.
+    :param seed: seed for the design, None for fresh entropy.
+    :return: tuple of the list of parameter names and a N (P + 2) x P array holding A, B, AB_1, ..., AB_P.
+    """
+    if method not in DESIGNS:
+        raise SamplingError(f'Unknown sampling design "{method}", expected one of {DESIGNS}.')
+    if base_samples < 1:
+        raise SensitivityAnalysisError('A Saltelli design needs at least one base sample.')
+
+    descriptions = describe_parameters(config)
+    num_parameters = len(descriptions)
+    if num_parameters == 0:
+        raise SensitivityAnalysisError('A Saltelli design needs at least one uncertain parameter.')
+
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+
+    # A and B are the two halves of one design in twice the dimensions, so they are independent of each other.
+    uniforms = design_uniforms(base_samples, 2 * num_parameters, method, seed)
+    a = apply_marginals(uniforms[:, :num_parameters], descriptions)
+    b = apply_marginals(uniforms[:, num_parameters:], descriptions)
+    ab = np.repeat(a[np.newaxis], num_parameters, axis=0)
+    ab[np.arange(num_parameters), :, np.arange(num_parameters)] = b.T
+
+    return [d['name'] for d in descriptions], np.concatenate([a, b, ab.reshape(-1, num_parameters)])
+
+
+def _poisson_weights(seed, bootstrap, start, stop):
+    weights = np.empty((bootstrap, stop - start))
+    for block in range(start // WEIGHT_BLOCK_SIZE, (stop - 1) // WEIGHT_BLOCK_SIZE + 1):
+        block_start = block * WEIGHT_BLOCK_SIZE
+        lo = max(start, block_start)
+        hi = min(stop, block_start + WEIGHT_BLOCK_SIZE)
+        rng = np.random.Generator(np.random.PCG64(np.random.SeedSequence(seed, spawn_key=(WEIGHT_STREAM, block))))
+        weights[:, lo - start:hi - start] = rng.poisson(1.0, (bootstrap, WEIGHT_BLOCK_SIZE))[:, lo - block_start:hi - block_start]
+
+    return weights
+
+
+def _reduce(values, reduction):
+    # values of shape (trials, time, outputs).
+    if reduction == 'final':
+        return values[:, -1:]
+    if reduction == 'mean':
+        return values.mean(axis=1, keepdims=True)
+    if reduction == 'min':
+        return values.min(axis=1, keepdims=True)
+    if reduction == 'max':
+        return values.max(axis=1, keepdims=True)
+    return values
+
+
+def sobol_indices(cube, base_samples, num_parameters, outputs=None, reduction='none', bootstrap=DEFAULT_BOOTSTRAP, confidence=DEFAULT_CONFIDENCE,
+                  seed=0, block_bytes=DEFAULT_BLOCK_BYTES):
+    """
+    Estimate the first-order and total-order Sobol' indices of the outputs of a Saltelli design.
+    The sums kept take (bootstrap + 1) x (2 num_parameters + 2) x times x outputs values.
+    :param cube: open result cube holding the trials of saltelli_samples, in the same order.
+    :param outputs: list of 'component.name' variables to analyse, by default every variable but the variable of integration.
+    :param reduction: one of REDUCTIONS.
+    :param bootstrap: number of bootstrap resamples, 0 for no confidence intervals.
+    :param confidence: confidence level of the intervals.
+    :param seed: seed of the bootstrap weights.
+    :return: dict with keys ['variable_ids', 'first_order', 'total_order', 'variance', 'count'] and, with bootstrap resamples,
+    ['first_order_interval', 'total_order_interval'].  Indices have shape (parameters, times, outputs), intervals
+    (2, parameters, times, outputs) and variance (times, outputs), times being 1 when the outputs are reduced.
+    count is the number of base samples used.  Outputs without variance have NaN indices.
+    """
+    if reduction not in REDUCTIONS:
+        raise SensitivityAnalysisError(f'Unknown reduction "{reduction}", expected one of {REDUCTIONS}.')
+    data = cube['data']
+    matrices = num_parameters + 2
+    if data.shape[0] != saltelli_trial_count(base_samples, num_parameters):
+        raise SensitivityAnalysisError(f'The result cube holds {data.shape[0]} trials, a Saltelli design of {base_samples} base samples and '
+                                       f'{num_parameters} parameters has {saltelli_trial_count(base_samples, num_parameters)}.')
+    if outputs is None:
+        outputs = [f"{c['component']}.{c['name']}" for c in cube['column_info'][1:]]
+    try:
+        columns = [cube['index'][output] for output in outputs]
+    except KeyError as e:
+        raise SensitivityAnalysisError(f'Variable {e} is not in the result cube.')
+
+    num_times = data.shape[1] if reduction == 'none' else 1
+    width = num_times * len(columns)
+    # Resample 0 is the estimate itself, every base sample weighted once.
+    resamples = 1 + bootstrap
+    sums = {
+        'weight': np.zeros(resamples),
+        'outputs': np.zeros((resamples, width)),
+        'squares': np.zeros((resamples, width)),
+        'first': np.zeros((resamples, num_parameters, width)),
+        'total': np.zeros((resamples, num_parameters, width)),
+    }
+    shift = None
+    chunk_size = max(1, block_bytes // (8 * matrices * data.shape[1] * len(columns)))
+    for start in range(0, base_samples, chunk_size):
+        stop = min(base_samples, start + chunk_size)
+        rows = [slice(m * base_samples + start, m * base_samples + stop) for m in range(matrices)]
+        values = np.stack([_reduce(np.asarray(data[r][:, :, columns], dtype=np.float64), reduction).reshape(stop - start, width) for r in rows])
+        used = np.all([cube['completed'][r] for r in rows], axis=0) & np.all(np.isfinite(values), axis=(0, 2))
+        if shift is None and used.any():
+            # Centring the outputs on a sample keeps the variance from cancelling out.  The first-order estimator changes
+            # with the shift, taking it from the first base sample used leaves the indices independent of the chunk size.
+            shift = values[0, np.argmax(used)].copy()
+        if shift is not None:
+            values -= shift
+        values[:, ~used] = 0.0
+
+        weights = np.ones((resamples, stop - start))
+        if bootstrap:
+            weights[1:] = _poisson_weights(seed, bootstrap, start, stop)
+        weights[:, ~used] = 0.0
+
+        f_a, f_b, f_ab = values[0], values[1], values[2:]
+        differences = f_ab - f_a
+        sums['weight'] += weights.sum(axis=1)
+        sums['outputs'] += weights @ (f_a + f_b)
+        sums['squares'] += weights @ (f_a ** 2 + f_b ** 2)
+        sums['first'] += np.einsum('rn,pnx->rpx', weights, f_b * differences)
+        sums['total'] += np.einsum('rn,pnx->rpx', weights, differences ** 2)
+
+    weight = sums['weight'][:, np.newaxis]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = sums['outputs'] / (2.0 * weight)
+        variance = sums['squares'] / (2.0 * weight) - mean ** 2
+        # An output without variance has none to apportion.
+        variance = np.where(variance > 0.0, variance, np.nan)
+        first = sums['first'] / weight[:, :, np.newaxis] / variance[:, np.newaxis]
+        total = sums['total'] / (2.0 * weight[:, :, np.newaxis]) / variance[:, np.newaxis]
+
+    shape = (resamples, num_parameters, num_times, len(columns))
+    first = first.reshape(shape)
+    total = total.reshape(shape)
+    indices = {
+        'variable_ids': np.array(outputs),
+        'first_order': first[0],
+        'total_order': total[0],
+        'variance': np.nan_to_num(variance[0]).reshape(num_times, len(columns)),
+        'count': int(sums['weight'][0]),
+    }
+    if bootstrap:
+        percentiles = [50.0 * (1.0 - confidence), 50.0 * (1.0 + confidence)]
+        with warnings.catch_warnings():
+            # Outputs without variance have no interval either.
+            warnings.simplefilter('ignore', RuntimeWarning)
+            indices['first_order_interval'] = np.nanpercentile(first[1:], percentiles, axis=0)
+            indices['total_order_interval'] = np.nanpercentile(total[1:], percentiles, axis=0)
+
+    return indices
+
+
+def save_sensitivity(indices, filename, parameter_names=None):
+    """
+    Save the indices, with the names of the parameters in design order when given.
+    """
+    extra = {} if parameter_names is None else {'parameter_names': np.array(parameter_names)}
+    with open(filename, 'wb') as f:
+        np.savez(f, **{**indices, **extra})
+
+
+def load_sensitivity(filename):
+    """
+    :return: indices dict as saved, with 'parameter_names' when they were saved.
+    """
+    with np.load(filename) as data:
+        indices = {key: data[key] for key in data.files}
+    indices['count'] = int(indices['count'])
+    return indices
+
+
+def sensitivity_summary(indices, parameter_names, time_index=-1):
+    """
+    Lines of a table of the indices of every output at one time point.
+    """
+    intervals = 'first_order_interval' in indices
+    lines = [f"Sobol' indices from {indices['count']} base samples."]
+    for column, variable_id in enumerate(indices['variable_ids']):
+        lines.append(f'{variable_id}:')
+        for row, name in enumerate(parameter_names):
+            first = indices['first_order'][row, time_index, column]
+            total = indices['total_order'][row, time_index, column]
+            if intervals:
+                first_low, first_high = indices['first_order_interval'][:, row, time_index, column]
+                total_low, total_high = indices['total_order_interval'][:, row, time_index, column]
+                lines.append(f'  {name:30} S1 {first:7.3f} [{first_low:7.3f}, {first_high:7.3f}]  ST {total:7.3f} [{total_low:7.3f}, {total_high:7.3f}]')
+            else:
+                lines.append(f'  {name:30} S1 {first:7.3f}  ST {total:7.3f}')
+
+    return lines
@@ -0,0 +1,277 @@
+"""
+Solve trials with the compiled solver loaded as a shared library by long-lived worker processes.
+
+Built with BUILD_SOLVER_LIBRARY, see build_simulation_code, the generated
+solver is also the siss-solver shared library, with a small C ABI (see
+solver_library.c): create a solver for its settings, solve a trial from its
+parameter values into a caller provided buffer and describe the output
+columns.  A solver pool starts worker processes that each load the library
+once with ctypes and create one solver, then solve block after block of
+trials straight into a shared memory buffer the parent process reads as a
+NumPy array.  No process is started and nothing is written or parsed as text
+per trial.
+
+Each worker has one buffer, a worker is given its next block once the
+outputs of its last block have been handed on, so the outputs need to be
+copied by whoever keeps them.  A worker that dies, e.g. from a crash in the
+model code, fails its block and is replaced.
+"""
+import ctypes
+import multiprocessing
+import os
+import queue
+import sys
+import time
+
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from cellsolvertools import tracing
+from cellsolvertools.trial_scheduler import report_progress
+
+# Upper bound on the outputs of a block of trials, the size of each worker's buffer.
+DEFAULT_BLOCK_BYTES = 2 ** 26
+
+# Seconds to wait for results before checking that the workers are alive.
+_POLL_INTERVAL = 1.0
+
+
+class SharedLibrarySolverError(Exception):
+    pass
+
+
+class _SolverSettings(ctypes.Structure):
+    # SolverSettings in the generated batch_solver.h.
+    _fields_ = [
+        ('startingPoint', ctypes.c_double),
+        ('endingPoint', ctypes.c_double),
+        ('pointInterval', ctypes.c_double),
+        ('relativeTolerance', ctypes.c_double),
+        ('absoluteTolerance', ctypes.c_double),
+        ('maximumStep', ctypes.c_double),
+        ('maximumNumberOfSteps', ctypes.c_long),
+        ('integrationMethod', ctypes.c_int),
+        ('iterationType', ctypes.c_int),
+        ('interpolateSolution', ctypes.c_int),
+    ]
+
+
+_DOUBLE_POINTER = ctypes.POINTER(ctypes.c_double)
+
+
+def load_solver_library(filename):
+    """
+    Load the siss-solver shared library.
+    :return: dict with keys ['library', 'model', 'parameter_count', 'column_count', 'column_info'],
+    column_info describing the output columns as in binary output files.
+    """
+    try:
+        library = ctypes.CDLL(os.path.abspath(filename))
+    except OSError as e:
+        raise SharedLibrarySolverError(f'Could not load the solver library "{filename}": {e}')
+
+    library.sissModelName.restype = ctypes.c_char_p
+    library.sissModelName.argtypes = []
+    library.sissParameterCount.restype = ctypes.c_size_t
+    library.sissParameterCount.argtypes = []
+    library.sissColumnCount.restype = ctypes.c_size_t
+    library.sissColumnCount.argtypes = []
+    library.sissPointCount.restype = ctypes.c_size_t
+    library.sissPointCount.argtypes = [ctypes.POINTER(_SolverSettings)]
+    library.sissColumnInfo.restype = ctypes.c_int
+    library.sissColumnInfo.argtypes = [ctypes.c_size_t] + [ctypes.POINTER(ctypes.c_char_p)] * 4
+    library.sissCreateSolver.restype = ctypes.c_void_p
+    library.sissCreateSolver.argtypes = [ctypes.POINTER(_SolverSettings)]
+    library.sissSolve.restype = ctypes.c_int
+    library.sissSolve.argtypes = [ctypes.c_void_p, _DOUBLE_POINTER, _DOUBLE_POINTER]
+    library.sissDeleteSolver.restype = None
+    library.sissDeleteSolver.argtypes = [ctypes.c_void_p]
+
+    column_info = []
+    for column in range(library.sissColumnCount()):
+        fields = [ctypes.c_char_p() for _ in range(4)]
+        library.sissColumnInfo(column, *[ctypes.byref(field) for field in fields])
+        column_info.append(dict(zip(['component', 'name', 'units', 'type'], [field.value.decode() for field in fields])))
+
+    return {
+        'library': library,
+        'model': library.sissModelName().decode(),
+        'parameter_count': library.sissParameterCount(),
+        'column_count': len(column_info),
+        'column_info': column_info,
+    }
+
+
+def output_point_count(library, settings):
+    """
+    :param settings: dict of the SolverSettings fields, see batch_file.solver_settings.
+    """
+    return library['library'].sissPointCount(ctypes.byref(_SolverSettings(**settings)))
+
+
+def create_solver(library, settings):
+    """
+    Create a solver, free it with delete_solver.
+    :param settings: dict of the SolverSettings fields, see batch_file.solver_settings.
+    """
+    solver = library['library'].sissCreateSolver(ctypes.byref(_SolverSettings(**settings)))
+    if not solver:
+        raise SharedLibrarySolverError(f'Could not create the solver of model "{library["model"]}".')
+
+    return solver
+
+
+def delete_solver(library, solver):
+    library['library'].sissDeleteSolver(solver)
+
+
+def solve_trials(library, solver, samples, outputs):
+    """
+    Solve trials one after the other.
+    :param samples: array of shape (trials, parameters), the parameter values of each trial.
+    :param outputs: C contiguous float64 array of shape (at least trials, points, columns) the outputs are written to.
+    :return: array with the CVODE flag of every trial, 0 for the trials that succeeded.
+    """
+    samples = np.ascontiguousarray(samples, dtype=np.float64).reshape(len(samples), library['parameter_count'])
+    flags = np.zeros(samples.shape[0], dtype=int)
+    for i, parameters in enumerate(samples):
+        flags[i] = library['library'].sissSolve(solver, parameters.ctypes.data_as(_DOUBLE_POINTER), outputs[i].ctypes.data_as(_DOUBLE_POINTER))
+
+    return flags
+
+
+def _worker(library_file, settings, memory_name, shape, tasks, results, number):
+    memory = shared_memory.SharedMemory(name=memory_name)
+    try:
+        library = load_solver_library(library_file)
+        solver = create_solver(library, settings)
+    except SharedLibrarySolverError as e:
+        results.put(('error', number, str(e)))
+        memory.close()
+        return
+
+    outputs = np.ndarray(shape, dtype=np.float64, buffer=memory.buf)
+    try:
+        for block_index, samples in iter(tasks.get, None):
+            start = time.perf_counter()
+            flags = solve_trials(library, solver, samples, outputs)
+            results.put(('done', number, (block_index, flags, time.perf_counter() - start)))
+    finally:
+        delete_solver(library, solver)
+        del outputs
+        memory.close()
+
+
+def open_solver_pool(library_file, settings, workers, trials_per_block, block_bytes=DEFAULT_BLOCK_BYTES):
+    """
+    Start worker processes that load the solver library once and keep their solver for every trial they are given.
+    :param settings: dict of the SolverSettings fields, see batch_file.solver_settings.
+    :param trials_per_block: number of trials given to a worker at a time, lowered to keep the outputs of a block below block_bytes.
+    :return: dict with keys ['run', 'close', 'column_info'], run(samples, indices, on_complete=None, report_interval=10.0, stream=sys.stderr)
+    solving the trials with the given zero based indices as batched_solver.solve_trial_blocks does, and close() stopping the workers.
+    """
+    library = load_solver_library(library_file)
+    point_count = output_point_count(library, settings)
+    trials_per_block = max(1, min(trials_per_block, block_bytes // (8 * point_count * library['column_count'])))
+    shape = (trials_per_block, point_count, library['column_count'])
+    context = multiprocessing.get_context()
+    results = context.Queue()
+    slots = []
+
+    def start_worker(slot):
+        slot['tasks'] = context.Queue()
+        slot['process'] = context.Process(target=_worker, args=(library_file, settings, slot['memory'].name, shape, slot['tasks'], results, slot['number']),
+                                          daemon=True)
+        slot['process'].start()
+
+    def close():
+        for slot in slots:
+            if slot.get('process') is not None and slot['process'].is_alive():
+                slot['tasks'].put(None)
+        for slot in slots:
+            if slot.get('process') is not None:
+                slot['process'].join(5.0)
+                if slot['process'].is_alive():
+                    slot['process'].terminate()
+            slot.pop('outputs', None)
+            slot['memory'].close()
+            slot['memory'].unlink()
+
+    try:
+        for number in range(max(1, workers)):
+            memory = shared_memory.SharedMemory(create=True, size=8 * int(np.prod(shape)))
+            slot = {'number': number, 'memory': memory, 'outputs': np.ndarray(shape, dtype=np.float64, buffer=memory.buf), 'block': None}
+            slots.append(slot)
+            start_worker(slot)
+    except Exception:
+        close()
+        raise
+
+    def run(samples, indices, on_complete=None, report_interval=10.0, stream=sys.stderr):
+        indices = list(indices)
+        blocks = [indices[offset:offset + trials_per_block] for offset in range(0, len(indices), trials_per_block)]
+        summary = {'completed': 0, 'failed': [], 'trial_time': 0.0, 'wall_time': 0.0}
+        start = time.perf_counter()
+        last_report = start
+        queued = {}
+        next_block = 0
+
+        def dispatch(slot):
+            nonlocal next_block
+            slot['block'] = None
+            if next_block < len(blocks):
+                slot['block'] = next_block
+                queued[next_block] = time.perf_counter()
+                slot['tasks'].put((next_block, samples[blocks[next_block]]))
+                next_block += 1
+
+        def finish(slot, block_index, flags, run_time):
+            block = blocks[block_index]
+            started = time.perf_counter() - run_time
+            tracing.record_trial(block_index + 1, started, run_time, max(0.0, started - queued.pop(block_index)), f'library worker {slot["number"]}',
+                                 int(np.any(flags)))
+            summary['completed'] += len(block)
+            summary['trial_time'] += run_time
+            failed = [index + 1 for index, flag in zip(block, flags) if flag != 0]
+            summary['failed'].extend(failed)
+            if failed:
+                print(f'{len(failed)} of trials {block[0] + 1} to {block[-1] + 1} failed.', file=stream)
+            if on_complete is not None:
+                on_complete(block, slot['outputs'][:len(block)], flags)
+
+        for slot in slots:
+            dispatch(slot)
+        while any(slot['block'] is not None for slot in slots):
+            try:
+                kind, number, payload = results.get(timeout=_POLL_INTERVAL)
+            except queue.Empty:
+                for slot in slots:
+                    if slot['block'] is not None and not slot['process'].is_alive():
+                        exit_code = slot['process'].exitcode
+                        print(f'Solver worker {slot["number"]} exited with code {exit_code}, starting another.', file=stream)
+                        finish(slot, slot['block'], np.full(len(blocks[slot['block']]), exit_code or -1), 0.0)
+                        start_worker(slot)
+                        dispatch(slot)
+                continue
+
+            if kind == 'error':
+                raise SharedLibrarySolverError(payload)
+            slot = slots[number]
+            block_index, flags, run_time = payload
+            if block_index == slot['block']:
+                finish(slot, block_index, flags, run_time)
+                dispatch(slot)
+
+            if report_interval and time.perf_counter() - last_report >= report_interval:
+                report_progress(summary, start, stream)
+                last_report = time.perf_counter()
+
+        summary['wall_time'] = time.perf_counter() - start
+        if report_interval:
+            report_progress(summary, start, stream)
+
+        return summary
+
+    return {'run': run, 'close': close, 'column_info': library['column_info']}
+
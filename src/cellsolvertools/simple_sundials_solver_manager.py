@@ -1,47 +1,340 @@
 import argparse
 import json
+import math
 import multiprocessing
 import os
+import secrets
 import subprocess
 import sys
+import uuid
 
-from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 
+from array import array
+
+from cellsolvertools.batch_file import SimulationConfigurationError, batch_task, solver_settings, write_batch_file
+from cellsolvertools.binary_output import OUTPUT_FILE_EXTENSION, trial_output_file_name
+from cellsolvertools.campaign_manifest import MANIFEST_FILE, completed_outputs, completed_trials, create_manifest, incomplete_trials, manifest_samples, open_manifest, record_trials
 from cellsolvertools.common import construct_application_config
-from cellsolvertools.define_parameter_uncertainties import create_model_from_config
-from cellsolvertools.evaluate_sbml_model_initial_values import evaluate_model
+from cellsolvertools.result_cube import consolidate_trial, is_result_cube, open_result_cube, read_trial_output, remove_result_cube
+from cellsolvertools import tracing
+
+# The solver backends and the campaign features import their modules when a campaign uses them, keeping the start up quick.
 
 here = os.path.dirname(os.path.abspath(__file__))
 
 
-def run_simulation(application, solver_config_file, simulation_config_file, output_file_name, initial_values):
-    stringed_initial_values = {}
-    for initial_value in initial_values:
-        stringed_initial_values[initial_value] = str(initial_values[initial_value])
-    env = {
-        **os.environ,
-        **stringed_initial_values
-    }
+PARAMETER_CHANNELS = ['environment', 'file', 'stdin']
+# sundials runs the compiled solver processes, numpy solves the trials in this process, see batched_solver,
+# and library solves them in worker processes loading the compiled solver as a shared library, see shared_library_solver.
+SOLVER_BACKENDS = ['sundials', 'numpy', 'library']
+
+def pack_parameter_values(initial_values):
+    """
+    Pack parameter values, in order, as the native doubles read by the generated external variable code.
+    """
+    return array('d', initial_values.values()).tobytes()
+
+
+def simulation_trial(index, application, solver_config_file, simulation_config_file, output_file_name, initial_values, parameter_channel='environment'):
+    """
+    Describe the solver process for one trial, for use with the trial scheduler.
+    The parameter values reach the solver through the given channel, either one
+    environment variable per parameter (as exact hexadecimal floats), a binary
+    parameter file written next to the output file, or the solver's stdin.
+    The parameter file is listed under 'parameter_file', for removal once the trial has run.
+    """
+    env = {**os.environ}
+    parameter_input = None
+    parameter_file_name = None
+    if parameter_channel == 'environment':
+        for initial_value in initial_values:
+            env[initial_value] = float(initial_values[initial_value]).hex()
+    elif parameter_channel == 'file' and initial_values:
+        parameter_file_name = f'{output_file_name}.parameters'
+        with open(parameter_file_name, 'wb') as f:
+            f.write(pack_parameter_values(initial_values))
+        env['EXTERNAL_VARIABLES_FILE'] = parameter_file_name
+    elif parameter_channel == 'stdin' and initial_values:
+        parameter_input = pack_parameter_values(initial_values)
+        env['EXTERNAL_VARIABLES_FILE'] = '-'
+
+    return {'index': index, 'args': [application, solver_config_file, simulation_config_file, output_file_name], 'env': env, 'input': parameter_input,
+            'parameter_file': parameter_file_name}
+
+
+@tracing.traced('run_simulation')
+def run_simulation(application, solver_config_file, simulation_config_file, output_file_name, initial_values, parameter_channel='environment'):
+    """
+    Run the solver application for one trial.
+    """
+    trial = simulation_trial(0, application, solver_config_file, simulation_config_file, output_file_name, initial_values, parameter_channel)
+    try:
+        return subprocess.run(trial['args'], env=trial['env'], input=trial['input']).returncode
+    finally:
+        if trial['parameter_file'] is not None:
+            os.remove(trial['parameter_file'])
+
+
+def simulation_batch_trial(index, application, batch_file_name, output_file_pattern):
+    """
+    Describe the siss-batch process for a block of trials, for use with the trial scheduler.
+    The output file pattern is a printf pattern taking the trial number.
+    """
+    return {'index': index, 'args': [application, batch_file_name, output_file_pattern], 'capture_output': True}
+
+
+def trial_outcomes(result):
+    """
+    Exit code and output file of every trial of a finished scheduler result.
+    siss-batch reports 'trial flag' on stdout for each trial it solves, trials
+    without a report, because the process never got to them, take the exit
+    code of the process.
+    :return: list of (trial number, exit code, output file name) tuples.
+    """
+    reported = {}
+    for line in (result['stdout'] or b'').decode(errors='replace').splitlines():
+        try:
+            trial_number, flag = (int(field) for field in line.split())
+        except ValueError:
+            continue
+        reported[trial_number] = flag
+
+    trial = result['trial']
+    return [(trial['first_trial'] + offset + 1, reported.get(trial['first_trial'] + offset + 1, result['returncode']), output_file_name)
+            for offset, output_file_name in enumerate(trial.get('outputs', []))]
+
+
+def _complete_partial_outputs(result):
+    # The parameter file goes whatever the outcome, leaving only trial outputs in the output directory.
+    parameter_file_name = result['trial'].get('parameter_file')
+    if parameter_file_name is not None and os.path.isfile(parameter_file_name):
+        os.remove(parameter_file_name)
+    for partial_output_file_name, output_file_name in zip(result['trial'].get('partial_outputs', []), result['trial']['outputs']):
+        if os.path.isfile(partial_output_file_name):
+            if result['returncode'] == 0:
+                os.replace(partial_output_file_name, output_file_name)
+            else:
+                os.remove(partial_output_file_name)
+
+
+def output_file_callback(handlers):
+    """
+    Callback for the trial scheduler reading the output files of each finished trial once
+    and handing them to every handler as handler(trial_index, data, column_info), data
+    being an array of shape (time, variables).  Trials are expected to list their output
+    files under 'outputs', the first of them being for the zero based trial number
+    'first_trial'.  Output files missing because a trial failed are skipped.
+    """
+    def on_complete(result):
+        trial = result['trial']
+        for offset, output_file_name in enumerate(trial.get('outputs', [])):
+            if os.path.isfile(output_file_name):
+                data, column_info = read_trial_output(output_file_name)
+                for handler in handlers:
+                    handler(trial['first_trial'] + offset, data, column_info)
+
+    return on_complete
+
+
+def campaign_callback(manifest, handlers, failed_trials):
+    """
+    Callback for the trial scheduler moving the outputs of finished single trials into
+    place, recording every trial in the campaign manifest, collecting the numbers of the
+    trials that failed in failed_trials and handing the outputs to the handlers.
+    """
+    read_outputs = output_file_callback(handlers) if handlers else None
+
+    def on_complete(result):
+        with tracing.span('trial_outputs', trial=result['index']):
+            _complete_partial_outputs(result)
+            failed_trials.extend(record_trials(manifest, trial_outcomes(result)))
+            if read_outputs is not None:
+                read_outputs(result)
 
-    subprocess.run([application, solver_config_file, simulation_config_file, output_file_name], env=env)
+    return on_complete
 
 
-def build_simulation_code(build_dir, src_dir, sundials_dir, external_variables):
-    subprocess.run(['cmake', f'-DSUNDIALS_DIR={sundials_dir}', '-DSTORE_FILE=TRUE', f'-DEXTERNAL_VARIABLES={"TRUE" if external_variables else "FALSE"}', src_dir],
-                   cwd=build_dir)
-    subprocess.run(['make', '-j'], cwd=build_dir)
+def batched_callback(manifest, handlers, failed_trials, column_info):
+    """
+    Callback for the batched and shared library solvers recording every trial of a finished block in the
+    campaign manifest, collecting the numbers of the trials that failed in failed_trials
+    and handing the outputs of the others to the handlers.
+    """
+    def on_complete(indices, outputs, flags):
+        with tracing.span('trial_outputs', trials=len(indices)):
+            failed_trials.extend(record_trials(manifest, [(index + 1, int(flag), None) for index, flag in zip(indices, flags)]))
+            for index, data, flag in zip(indices, outputs, flags):
+                if flag == 0:
+                    for handler in handlers:
+                        handler(index, data, column_info)
+
+    return on_complete
+
+
+def result_cube_handler(result_dir, num_trials, dtype='float64', resume=False):
+    """
+    Trial output handler appending each trial to the result cube in result_dir.  A resumed
+    campaign appends to its existing cube, a new campaign removes it.
+    """
+    if not resume:
+        remove_result_cube(result_dir)
+    state = {'cube': None}
+
+    def handler(trial_index, data, column_info):
+        state['cube'] = consolidate_trial(result_dir, num_trials, trial_index, data, column_info, dtype, state['cube'])
+
+    return handler
+
+
+def statistics_handler(statistics_file, checkpoint_interval=100, quantiles=None, resume=False):
+    """
+    Trial output handler adding each trial to the ensemble statistics, checkpointed to
+    statistics_file every checkpoint_interval trials with the indices of the trials
+    included.  A resumed campaign carries on from an existing checkpoint, a new campaign
+    removes it.  Trials already in the statistics are not added again.
+    :return: tuple of the handler, a function writing the final checkpoint and the set of
+    the indices of the trials in the statistics.
+    """
+    from cellsolvertools.ensemble_statistics import create_statistics, load_statistics, save_statistics, update_statistics
+
+    if not resume and os.path.isfile(statistics_file):
+        os.remove(statistics_file)
+    state = {'statistics': None, 'trials': set(), 'column_info': None, 'pending': 0}
+    if os.path.isfile(statistics_file):
+        state['statistics'] = load_statistics(statistics_file)
+        state['trials'].update(state['statistics'].pop('trials', np.empty(0, dtype=np.int64)).tolist())
+
+    def checkpoint():
+        if state['pending']:
+            save_statistics(state['statistics'], statistics_file, state['column_info'], state['trials'])
+            state['pending'] = 0
+
+    def handler(trial_index, data, column_info):
+        if trial_index in state['trials']:
+            return
+        if state['statistics'] is None:
+            state['statistics'] = create_statistics(data.shape[0], data.shape[1], quantiles)
+        state['column_info'] = column_info
+        update_statistics(state['statistics'], data)
+        state['trials'].add(trial_index)
+        state['pending'] += 1
+        if state['pending'] >= checkpoint_interval:
+            checkpoint()
+
+    return handler, checkpoint, state['trials']
+
+
+def _completed_trial_outputs(manifest, result_dir, skip=()):
+    """
+    The outputs of the completed trials of a campaign being resumed, read from their output files
+    or, for the solver backends writing none, from the result cube in result_dir.  Trials whose
+    index is in skip are not read.
+    :return: generator of (trial index, data, column_info) tuples.
+    """
+    outputs = dict(completed_outputs(manifest))
+    cube = open_result_cube(result_dir) if is_result_cube(result_dir) else None
+    for trial in completed_trials(manifest):
+        if trial - 1 in skip:
+            continue
+        if trial in outputs:
+            yield (trial - 1, *read_trial_output(outputs[trial]))
+        elif cube is not None and cube['completed'][trial - 1]:
+            yield trial - 1, cube['data'][trial - 1], cube['column_info']
+
+
+def default_chunk_size(num_trials, workers):
+    """
+    Chunk size giving each worker about four chunks, enough to balance uneven trial run times.
+    """
+    return max(1, math.ceil(num_trials / (4 * workers)))
+
+
+@tracing.traced('build_simulation_code')
+def build_simulation_code(build_dir, src_dir, sundials_dir, external_variables, shared_library=False):
+    """
+    Configure and compile the solver, returns True if both steps succeeded.
+    :param shared_library: also build the solver as the siss-solver shared library, see shared_library_solver.
+    """
+    configured = subprocess.run(['cmake', f'-DSUNDIALS_DIR={sundials_dir}', '-DSTORE_FILE=TRUE', f'-DEXTERNAL_VARIABLES={"TRUE" if external_variables else "FALSE"}',
+                                 f'-DBUILD_SOLVER_LIBRARY={"TRUE" if shared_library else "FALSE"}', src_dir],
+                                cwd=build_dir)
+    return configured.returncode == 0 and subprocess.run(['make', '-j'], cwd=build_dir).returncode == 0
+
+
+def sample_uncertainties(config):
+    """
+    Sample the uncertain parameters for every trial.
+    The 'sampling' entry of the config selects the design, by default parameters are
+    sampled directly with NumPy, the 'sbml-distrib' method samples through libroadrunner.
+    With a 'sensitivity' config the trials are the Saltelli design of its base samples.
+    """
+    sampling_config = config.get('sampling', {})
+    method = sampling_config.get('method', 'random')
+    if 'sensitivity' in config:
+        from cellsolvertools.sensitivity_analysis import saltelli_samples
+
+        return saltelli_samples(config['uncertainties'], config['sensitivity']['base_samples'], method, sampling_config.get('seed'))
+    if method == 'sbml-distrib':
+        # sbmlutils and libroadrunner take long to import, only this sampling method needs them.
+        from cellsolvertools.define_parameter_uncertainties import create_model_from_config
+        from cellsolvertools.evaluate_sbml_model_initial_values import evaluate_model_samples
+
+        sbml = create_model_from_config(config['uncertainties'])
+        return evaluate_model_samples(sbml, config['num_trials'])
 
+    from cellsolvertools.sample_parameter_uncertainties import sample_parameter_uncertainties
 
+    return sample_parameter_uncertainties(config['uncertainties'], config['num_trials'], method=method,
+                                          seed=sampling_config.get('seed'), correlation=sampling_config.get('correlation'))
+
+
+@tracing.traced('entry_point')
 def entry_point(config):
+    """
+    Run a campaign, or with the config's 'resume' set carry on with the campaign
+    recorded in the simulation directory's manifest, running only the trials that
+    are not completed.  Trials that fail are run again up to 'max_retries' times.
+    With an 'adaptive' config, see adaptive_stopping, the trials run in waves until
+    the targets converge or the trials run out.  With the 'solver_backend' set to
+    'numpy' the trials of the config's 'model_file' are solved in this process by
+    the batched solver, and with it set to 'library' they are solved by worker
+    processes loading the solver as a shared library.  Neither writes output files,
+    so the results need to be consolidated, kept as statistics or used for adaptive stopping,
+    and resuming their statistics or adaptive stopping takes the trials already run from the result cube.
+    With a 'sensitivity' config the trials are a Saltelli design, see sensitivity_analysis,
+    consolidated and analysed once they have run, the indices being saved to sensitivity.npz.
+    :return: the run_trials summary, with 'failed_trials' listing the numbers of the trials still failing,
+    for adaptive campaigns 'convergence' as given by adaptive_stopping.convergence and for
+    sensitivity analyses 'sensitivity' as given by sensitivity_analysis.sobol_indices.
+    """
     have_external_variables = 'uncertainties' in config
     application_config = config['application']
+    solver_backend = config.get('solver_backend', 'sundials')
+    if solver_backend not in SOLVER_BACKENDS:
+        raise SimulationConfigurationError(f'Unknown solver backend {solver_backend}.')
+    if 'sensitivity' in config:
+        _prepare_sensitivity_analysis(config)
+    batched_model = None
+    if solver_backend == 'numpy':
+        if config.get('work_queue'):
+            raise SimulationConfigurationError('The numpy solver backend solves trials in this process, it cannot use a work queue.')
+        if 'model_file' not in config:
+            raise SimulationConfigurationError('The numpy solver backend needs the model_file to solve.')
+        from cellsolvertools.batched_solver import load_batched_model, solve_trial_blocks
 
-    build_simulation_code(application_config['build_dir'], application_config['src_dir'], application_config['sundials_dir'], have_external_variables)
+        batched_model = load_batched_model(config['model_file'], list(config['uncertainties']) if have_external_variables else None)
+    elif not application_config.get('prebuilt', False):
+        build_simulation_code(application_config['build_dir'], application_config['src_dir'], application_config['sundials_dir'], have_external_variables,
+                              solver_backend == 'library')
+    if solver_backend == 'library':
+        if config.get('work_queue'):
+            raise SimulationConfigurationError('The library solver backend solves trials in local worker processes, it cannot use a work queue.')
+        if not os.path.isfile(application_config.get('solver_library', '')):
+            raise SimulationConfigurationError('The solver has not been built as a shared library.')
     simulation_dir = application_config['simulation_dir']
-    output_file_names = [os.path.join(simulation_dir, 'output', f'simulation_output_{i + 1:05d}.csv') for i in range(config['num_trials'])]
-    sbml = None
-    if have_external_variables:
-        sbml = create_model_from_config(config['uncertainties'])
+    output_dir = os.path.join(simulation_dir, 'output')
+    os.makedirs(output_dir, exist_ok=True)
 
     if 'solver' not in config:
         config['solver'] = {
@@ -68,13 +361,281 @@ def entry_point(config):
     with open(simulation_config_file, 'w') as f:
         f.write(json.dumps(config['simulation']))
 
+    adaptive_config = config.get('adaptive')
+    chunk_size = config.get('chunk_size', default_chunk_size(adaptive_config.get('wave_size', config['num_trials']) if adaptive_config else config['num_trials'],
+                                                              config['workers']))
+    writes_outputs = solver_backend == 'sundials'
+    if writes_outputs and chunk_size < 1 and config.get('output_format', 'csv') != 'csv':
+        raise SimulationConfigurationError('Binary output requires the batch solver, set a chunk size of at least 1.')
+    if writes_outputs and config.get('compress_output', False) and config.get('output_format', 'csv') != 'binary':
+        raise SimulationConfigurationError('Only binary output can be compressed.')
+    if writes_outputs and chunk_size < 1 and config.get('work_queue'):
+        raise SimulationConfigurationError('Distributing trials through a work queue requires the batch solver, set a chunk size of at least 1.')
+
+    manifest_file = os.path.join(simulation_dir, MANIFEST_FILE)
+    resume = config.get('resume', False) and os.path.isfile(manifest_file)
+    if resume and not writes_outputs and (config.get('statistics', False) or adaptive_config) and not config.get('consolidate', False):
+        raise SimulationConfigurationError(f'The {solver_backend} solver backend writes no output files, consolidate the trials to resume their statistics '
+                                           'or adaptive stopping.')
+    if resume:
+        manifest = open_manifest(manifest_file)
+        parameter_ids, samples = manifest_samples(manifest)
+        if samples.shape[0] != config['num_trials']:
+            manifest.close()
+            raise SimulationConfigurationError(f'The campaign being resumed has {samples.shape[0]} trials, not {config["num_trials"]}.')
+        pending = [trial - 1 for trial in incomplete_trials(manifest)]
+    else:
+        parameter_ids, samples, seed = [], np.empty((config['num_trials'], 0)), None
+        if have_external_variables:
+            seed = _sampling_seed(config)
+            with tracing.span('sampling'):
+                parameter_ids, samples = sample_uncertainties(config)
+        binary_output = config.get('output_format', 'csv') == 'binary'
+        outputs = None
+        if writes_outputs:
+            outputs = [trial_output_file_name(output_dir, index + 1, binary_output) for index in range(config['num_trials'])]
+        manifest = create_manifest(manifest_file, parameter_ids, samples, seed, outputs)
+        pending = list(range(config['num_trials']))
+
+    work_queue = None
+    build_key = None
+    reply_to = None
+    if config.get('work_queue'):
+        from cellsolvertools.work_queue import open_work_queue
+
+        work_queue = open_work_queue(config['work_queue'])
+        build_key = _shared_build_key(application_config)
+        reply_to = f'results-{uuid.uuid4().hex}'
+
+    handlers = []
+    finalisers = []
+    result_dir = os.path.join(simulation_dir, 'results')
+    if config.get('consolidate', False):
+        handlers.append(result_cube_handler(result_dir, config['num_trials'], config.get('output_dtype', 'float64'), resume))
+    if config.get('statistics', False):
+        handler, checkpoint, included = statistics_handler(os.path.join(simulation_dir, 'statistics.npz'), config.get('statistics_checkpoint_interval', 100),
+                                                           config.get('statistics_quantiles'), resume)
+        handlers.append(handler)
+        finalisers.append(checkpoint)
+        if resume:
+            # Trials completed after the last checkpoint.
+            for trial_index, data, column_info in _completed_trial_outputs(manifest, result_dir, included):
+                handler(trial_index, data, column_info)
+
+    check_convergence = None
+    wave_size = len(pending)
+    if adaptive_config:
+        from cellsolvertools.adaptive_stopping import convergence_handler
+
+        handler, check_convergence = convergence_handler(adaptive_config)
+        handlers.append(handler)
+        wave_size = adaptive_config.get('wave_size', max(config['workers'], math.ceil(config['num_trials'] / 10)))
+        if resume:
+            for trial_index, data, column_info in _completed_trial_outputs(manifest, result_dir):
+                handler(trial_index, data, column_info)
+    if not writes_outputs and not handlers:
+        manifest.close()
+        raise SimulationConfigurationError(f'The {solver_backend} solver backend writes no output files, consolidate the trials or keep their statistics.')
+
+    solver_pool = None
+    if solver_backend == 'library':
+        from cellsolvertools.shared_library_solver import open_solver_pool
+
+        solver_pool = open_solver_pool(application_config['solver_library'], solver_settings(config['solver'], config['simulation']), config['workers'],
+                                       max(1, chunk_size))
+
+    if writes_outputs:
+        from cellsolvertools.trial_scheduler import TASK_LEASE, run_trials
+
+    summary = {'completed': 0, 'failed': [], 'trial_time': 0.0, 'wall_time': 0.0}
+    failed_trials = []
+    try:
+        while pending:
+            if check_convergence is not None and _report_convergence(check_convergence()):
+                break
+            wave, pending = pending[:wave_size], pending[wave_size:]
+            retries = config.get('max_retries', 0)
+            while True:
+                wave_failed = []
+                if batched_model is not None:
+                    with tracing.span('run_trials', trials=len(wave)):
+                        attempt_summary = solve_trial_blocks(batched_model, samples, wave, config['simulation'], config['solver'], config.get('chunk_size') or None,
+                                                             batched_callback(manifest, handlers, wave_failed, batched_model['column_info']),
+                                                             config.get('report_interval', 10.0))
+                elif solver_pool is not None:
+                    with tracing.span('run_trials', trials=len(wave)):
+                        attempt_summary = solver_pool['run'](samples, wave, batched_callback(manifest, handlers, wave_failed, solver_pool['column_info']),
+                                                             config.get('report_interval', 10.0))
+                else:
+                    if chunk_size < 1:
+                        trials = _simulation_trials(config, parameter_ids, samples, solver_config_file, simulation_config_file, wave)
+                    else:
+                        trials = _simulation_batch_trials(config, chunk_size, samples, wave, build_key, reply_to)
+                    with tracing.span('run_trials', trials=len(wave)):
+                        attempt_summary = run_trials(trials, config['workers'], on_complete=campaign_callback(manifest, handlers, wave_failed),
+                                                     report_interval=config.get('report_interval', 10.0), work_queue=work_queue,
+                                                     task_timeout=config.get('task_timeout', TASK_LEASE))
+                for key in ['completed', 'trial_time', 'wall_time']:
+                    summary[key] += attempt_summary[key]
+                wave = sorted(trial - 1 for trial in wave_failed)
+                if not wave or retries < 1:
+                    summary['failed'].extend(attempt_summary['failed'])
+                    break
+                retries -= 1
+                print(f'Retrying {len(wave)} failed trials.', file=sys.stderr)
+            failed_trials.extend(index + 1 for index in wave)
+    finally:
+        if work_queue is not None:
+            work_queue['close']()
+        if solver_pool is not None:
+            solver_pool['close']()
+        manifest.close()
+    for finaliser in finalisers:
+        finaliser()
+
+    summary['failed_trials'] = failed_trials
+    if check_convergence is not None:
+        summary['convergence'] = check_convergence()
+    if 'sensitivity' in config:
+        with tracing.span('sensitivity_analysis'):
+            summary['sensitivity'] = _analyse_sensitivity(config, simulation_dir)
+    return summary
+
+
+def _prepare_sensitivity_analysis(config):
+    """
+    Check a sensitivity analysis can run, setting the number of trials of its design and consolidating them.
+    """
+    if not config.get('uncertainties'):
+        raise SimulationConfigurationError('A sensitivity analysis needs uncertain parameters.')
+    if config['sensitivity'].get('base_samples', 0) < 1:
+        raise SimulationConfigurationError('A sensitivity analysis needs at least one base sample.')
+    if config.get('adaptive'):
+        raise SimulationConfigurationError('A sensitivity analysis needs every trial of its design, it cannot stop adaptively.')
+    if config.get('sampling', {}).get('method') == 'sbml-distrib':
+        raise SimulationConfigurationError('A sensitivity analysis draws its design with NumPy, it cannot sample through SBML-distrib.')
+    if config.get('sampling', {}).get('correlation') is not None:
+        raise SimulationConfigurationError('The Sobol\' indices of a sensitivity analysis assume independent parameters, they cannot be correlated.')
+    if config.get('consolidate') is False:
+        raise SimulationConfigurationError('A sensitivity analysis reads its trials from the result cube, they need to be consolidated.')
+    from cellsolvertools.sensitivity_analysis import saltelli_trial_count
+
+    config['num_trials'] = saltelli_trial_count(config['sensitivity']['base_samples'], len(config['uncertainties']))
+    config['consolidate'] = True
+
+
+def _analyse_sensitivity(config, simulation_dir):
+    from cellsolvertools.sample_parameter_uncertainties import parameter_names
+    from cellsolvertools.sensitivity_analysis import DEFAULT_BOOTSTRAP, DEFAULT_CONFIDENCE, SENSITIVITY_FILE, save_sensitivity, sobol_indices
+
+    sensitivity_config = config['sensitivity']
+    indices = sobol_indices(open_result_cube(os.path.join(simulation_dir, 'results')), sensitivity_config['base_samples'], len(config['uncertainties']),
+                            sensitivity_config.get('outputs'), sensitivity_config.get('reduction', 'none'), sensitivity_config.get('bootstrap', DEFAULT_BOOTSTRAP),
+                            sensitivity_config.get('confidence', DEFAULT_CONFIDENCE), _sampling_seed(config))
+    save_sensitivity(indices, os.path.join(simulation_dir, SENSITIVITY_FILE), parameter_names(config['uncertainties']))
+    return indices
+
+
+def _report_convergence(convergence):
+    if convergence['count']:
+        state = 'converged' if convergence['converged'] else 'not converged'
+        print(f"{convergence['count']} trials, widest confidence interval {convergence['worst']:.3g} times its tolerance, {state}.", file=sys.stderr)
+
+    return convergence['converged']
+
+
+def _sampling_seed(config):
+    """
+    Seed of the campaign's samples, drawn and kept in the config when none is given so the samples can be reproduced.
+    """
+    sampling_config = config.setdefault('sampling', {})
+    if sampling_config.get('method', 'random') == 'sbml-distrib':
+        return None
+    if sampling_config.get('seed') is None:
+        sampling_config['seed'] = secrets.randbits(63)
+
+    return sampling_config['seed']
+
+
+def _shared_build_key(application_config):
+    """
+    Key of the build in the build cache, where worker agents find the executables, storing the build there if needed.
+    """
+    key = application_config.get('build_key')
+    if key is None:
+        from cellsolvertools.build_code import executables_build_key, store_executables
+
+        key = executables_build_key(application_config)
+        cache_dir = application_config.get('build_cache_dir', os.path.join(application_config['simulation_dir'], 'build-cache'))
+        if store_executables(cache_dir, key, application_config) is None:
+            raise SimulationConfigurationError('The solver has not been built, worker agents have nothing to run.')
+
+    return key
+
+
+def _simulation_trials(config, parameter_ids, samples, solver_config_file, simulation_config_file, indices):
+    application_config = config['application']
+    output_dir = os.path.join(application_config['simulation_dir'], 'output')
+    parameter_channel = config.get('parameter_channel', 'environment')
     initial_values = {}
-    with ProcessPoolExecutor(max_workers=config['workers']) as executor:
+    for index in indices:
+        output_file_name = trial_output_file_name(output_dir, index + 1)
+        # Written aside and moved into place once the trial succeeds.
+        partial_output_file_name = f'{output_file_name}.part'
+        if samples is not None:
+            initial_values = dict(zip(parameter_ids, samples[index].tolist()))
+        trial = simulation_trial(index + 1, application_config['executable'], solver_config_file, simulation_config_file, partial_output_file_name,
+                                 initial_values, parameter_channel)
+        trial.update({'first_trial': index, 'outputs': [output_file_name], 'partial_outputs': [partial_output_file_name]})
+        yield trial
+
+
+def _trial_blocks(indices, chunk_size):
+    """
+    Split sorted trial indices into runs of consecutive trials at most chunk_size long.
+    :return: generator of (first trial index, trial count) tuples.
+    """
+    first = None
+    count = 0
+    for index in indices:
+        if count and index == first + count and count < chunk_size:
+            count += 1
+        else:
+            if count:
+                yield first, count
+            first, count = index, 1
+    if count:
+        yield first, count
+
 
-        for output_file_name in output_file_names:
-            if have_external_variables:
-                initial_values = evaluate_model(sbml)
-            executor.submit(run_simulation, application_config['executable'], solver_config_file, simulation_config_file, output_file_name, initial_values)
+def _simulation_batch_trials(config, chunk_size, samples, indices, build_key=None, reply_to=None):
+    application_config = config['application']
+    simulation_dir = application_config['simulation_dir']
+    batch_dir = os.path.join(simulation_dir, 'batches')
+    if reply_to is None:
+        os.makedirs(batch_dir, exist_ok=True)
+    output_format = config.get('output_format', 'csv')
+    output_extension = OUTPUT_FILE_EXTENSION if output_format == 'binary' else '.csv'
+    output_dir = os.path.join(simulation_dir, 'output')
+    output_file_pattern = os.path.join(simulation_dir.replace('%', '%%'), 'output', f'simulation_output_%05llu{output_extension}')
+    if samples is None:
+        samples = np.empty((config['num_trials'], 0))
+
+    for batch_index, (first_trial, trial_count) in enumerate(_trial_blocks(indices, chunk_size), start=1):
+        block_samples = samples[first_trial:first_trial + trial_count]
+        if reply_to is None:
+            batch_file_name = os.path.join(batch_dir, f'batch_{batch_index:05d}.batch')
+            write_batch_file(batch_file_name, first_trial, block_samples, config['solver'], config['simulation'], output_format, config.get('output_dtype', 'float64'),
+                             config.get('compress_output', False))
+            trial = simulation_batch_trial(batch_index, application_config['batch_executable'], batch_file_name, output_file_pattern)
+        else:
+            trial = {'index': batch_index, 'task': batch_task(batch_index, first_trial, block_samples, build_key, config['solver'], config['simulation'],
+                                                              output_file_pattern, output_format, config.get('output_dtype', 'float64'),
+                                                              config.get('compress_output', False), reply_to)}
+        trial.update({'first_trial': first_trial,
+                      'outputs': [trial_output_file_name(output_dir, index + 1, output_format == 'binary')
+                                  for index in range(first_trial, first_trial + trial_count)]})
+        yield trial
 
 
 def _do_not_have(arg):
@@ -89,6 +650,29 @@ def process_arguments():
                         help='number of trials to run (default: 10)')
     parser.add_argument('--workers', default=multiprocessing.cpu_count(), type=int,
                         help='number of workers to use (default: CPU count)')
+    parser.add_argument('--chunk-size', default=None, type=int,
+                        help='number of trials solved by each solver process, or together by the numpy solver, 0 runs one siss process per trial (default: automatic)')
+    parser.add_argument('--solver-backend', default=None, choices=SOLVER_BACKENDS,
+                        help='solve with the compiled SUNDIALS solver processes, all trials at once in this process with NumPy, '
+                             'or in worker processes loading the compiled solver as a shared library (default: sundials)')
+    parser.add_argument('--model', default=None,
+                        help='the CellML model to solve, needed by the numpy solver backend')
+    parser.add_argument('--output-format', default=None, choices=['csv', 'binary'],
+                        help='format of the trial output files (default: csv)')
+    parser.add_argument('--compress-output', action='store_true', default=None,
+                        help='compress binary trial output files in chunks with zlib, siss-batch needs building with zlib')
+    parser.add_argument('--consolidate', action='store_true', default=None,
+                        help='append every finished trial to a single result cube in the results directory')
+    parser.add_argument('--statistics', action='store_true', default=None,
+                        help='keep ensemble statistics of the finished trials in statistics.npz')
+    parser.add_argument('--work-queue', default=None,
+                        help='hand the trials to worker agents through this work queue, e.g. tcp://host:port or spool:///shared/directory')
+    parser.add_argument('--resume', action='store_true', default=None,
+                        help='carry on with the campaign recorded in the simulation directory, running only the trials not completed')
+    parser.add_argument('--retries', default=None, type=int,
+                        help='number of times failed trials are run again (default: 0)')
+    parser.add_argument('--trace', default=None,
+                        help='write a Chrome trace of the run to this file and print a timing summary')
     parser.add_argument('--solver-config', required=_do_not_have('--simulation-config'),
                         help='configuration for the solver')
     parser.add_argument('--simulation-config', required=_do_not_have('--solver-config'),
@@ -115,11 +699,40 @@ def main():
         config = _load_config(args.solver_config)
         config['application'] = construct_application_config(os.environ['SIMULATION_DIR'], os.environ['SIMULATION_SUNDIALS_DIR'])
         config['num_trials'] = args.trials
-        config['worker'] = args.workers
+        config['workers'] = args.workers
     else:
         config = _load_config(args.simulation_config)
 
-    entry_point(config)
+    if args.chunk_size is not None:
+        config['chunk_size'] = args.chunk_size
+    if args.solver_backend is not None:
+        config['solver_backend'] = args.solver_backend
+    if args.model is not None:
+        config['model_file'] = args.model
+    if args.output_format is not None:
+        config['output_format'] = args.output_format
+    if args.compress_output is not None:
+        config['compress_output'] = args.compress_output
+    if args.consolidate is not None:
+        config['consolidate'] = args.consolidate
+    if args.statistics is not None:
+        config['statistics'] = args.statistics
+    if args.work_queue is not None:
+        config['work_queue'] = args.work_queue
+    if args.resume is not None:
+        config['resume'] = args.resume
+    if args.retries is not None:
+        config['max_retries'] = args.retries
+
+    if args.trace:
+        tracing.enable()
+    try:
+        summary = entry_point(config)
+    finally:
+        if args.trace:
+            tracing.write_report(args.trace)
+    if summary['failed']:
+        sys.exit(3)
 
 
 if __name__ == '__main__':
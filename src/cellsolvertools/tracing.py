@@ -0,0 +1,219 @@
+"""
+Timing of the pipeline stages and of every trial, exportable as Chrome trace events.
+
+Tracing is off until enable() is called, spans and trial records cost
+nothing until then.  A span records the wall time, the CPU time of this
+process and of its finished child processes, and the resident set size
+of this process as the span starts and ends, for a stage such as code
+generation or the build.  The peak resident set sizes of this process
+and of its largest child are kept too, they are peaks over the lifetime
+of the processes and not of the span.  A trial
+record keeps the time the trial waited in the queue, the time it ran and
+the worker that ran it, so gaps in a worker's lane show idle workers and
+uneven lanes show load imbalance.
+
+write_chrome_trace() writes everything in the Chrome trace event format,
+open it with chrome://tracing or https://ui.perfetto.dev, and
+format_summary() tabulates the same records.
+"""
+import contextlib
+import functools
+import json
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+MAIN_LANE = 'main'
+
+_state = {'enabled': False, 'origin': 0.0, 'spans': [], 'trials': []}
+
+
+def enable():
+    """
+    Start tracing, discarding anything recorded before.
+    """
+    _state.update({'enabled': True, 'origin': time.perf_counter(), 'spans': [], 'trials': []})
+
+
+def disable():
+    _state['enabled'] = False
+
+
+def is_enabled():
+    return _state['enabled']
+
+
+def _current_rss():
+    """
+    :return: the resident set size of this process now, in bytes, 0 where /proc is not available.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return 0
+
+
+def _usage():
+    """
+    :return: tuple of the CPU time of this process and its finished children, and the lifetime peak RSS of this process and
+    of its largest child, in bytes.
+    """
+    if resource is None:
+        return time.process_time(), 0, 0
+
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    # ru_maxrss is in kilobytes, except on macOS.
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime, own.ru_maxrss * scale, children.ru_maxrss * scale
+
+
+@contextlib.contextmanager
+def span(name, **args):
+    """
+    Record the enclosed block as a span named name, args are kept with the span.
+    """
+    if not _state['enabled']:
+        yield
+        return
+
+    start = time.perf_counter()
+    cpu_start = _usage()[0]
+    rss_start = _current_rss()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        cpu_end, lifetime_max_rss, children_lifetime_max_rss = _usage()
+        _state['spans'].append({'name': name, 'start': start - _state['origin'], 'duration': end - start, 'cpu': cpu_end - cpu_start,
+                                'rss_start': rss_start, 'rss_end': _current_rss(), 'lifetime_max_rss': lifetime_max_rss,
+                                'children_lifetime_max_rss': children_lifetime_max_rss, 'args': args})
+
+
+def traced(name):
+    """
+    Decorator recording every call of a function as a span.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def record_trial(index, started, run_time, queue_wait, worker, returncode):
+    """
+    Record a finished trial.
+    :param started: time.perf_counter() when the trial started running.
+    :param worker: name of the worker, or solver slot, that ran the trial.
+    """
+    if _state['enabled']:
+        _state['trials'].append({'index': index, 'start': started - _state['origin'], 'duration': run_time, 'queue_wait': queue_wait,
+                                 'worker': str(worker), 'returncode': returncode})
+
+
+def chrome_trace():
+    """
+    :return: the recorded spans and trials as a Chrome trace event dict.
+    """
+    pid = os.getpid()
+    lanes = [MAIN_LANE] + sorted({trial['worker'] for trial in _state['trials']})
+    events = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': lane}} for tid, lane in enumerate(lanes)]
+    for s in _state['spans']:
+        events.append({'name': s['name'], 'cat': 'stage', 'ph': 'X', 'pid': pid, 'tid': 0, 'ts': s['start'] * 1e6, 'dur': s['duration'] * 1e6,
+                       'args': {'cpu_s': s['cpu'], 'rss_start_bytes': s['rss_start'], 'rss_end_bytes': s['rss_end'],
+                                'lifetime_max_rss_bytes': s['lifetime_max_rss'], 'children_lifetime_max_rss_bytes': s['children_lifetime_max_rss'],
+                                **s['args']}})
+    for trial in _state['trials']:
+        events.append({'name': f"trial {trial['index']}", 'cat': 'trial', 'ph': 'X', 'pid': pid, 'tid': lanes.index(trial['worker']),
+                       'ts': trial['start'] * 1e6, 'dur': trial['duration'] * 1e6,
+                       'args': {'queue_wait_s': trial['queue_wait'], 'returncode': trial['returncode']}})
+
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def write_chrome_trace(filename):
+    with open(filename, 'w') as f:
+        json.dump(chrome_trace(), f)
+
+
+def write_report(filename, stream=sys.stderr):
+    """
+    Write the Chrome trace to filename and the summary table to stream.
+    """
+    write_chrome_trace(filename)
+    print(format_summary(), file=stream)
+    print(f'Trace written to {filename}.', file=stream)
+
+
+def summary():
+    """
+    :return: dict with keys ['stages', 'trials', 'workers'], stages mapping each span name to its
+    count, total wall and CPU times, the largest RSS at the end of a span and the largest change of
+    RSS over one, and the lifetime peak RSS of this process and its children when the last span
+    ended, trials giving the count with the mean and largest
+    run times and queue waits, and workers mapping each worker to its trial count and busy time.
+    """
+    stages = {}
+    for s in _state['spans']:
+        stage = stages.setdefault(s['name'], {'count': 0, 'wall': 0.0, 'cpu': 0.0, 'rss_end': 0, 'rss_change': None})
+        stage['count'] += 1
+        stage['wall'] += s['duration']
+        stage['cpu'] += s['cpu']
+        stage['rss_end'] = max(stage['rss_end'], s['rss_end'])
+        rss_change = s['rss_end'] - s['rss_start']
+        stage['rss_change'] = rss_change if stage['rss_change'] is None else max(stage['rss_change'], rss_change)
+        stage['lifetime_max_rss'] = s['lifetime_max_rss']
+        stage['children_lifetime_max_rss'] = s['children_lifetime_max_rss']
+
+    trials = _state['trials']
+    workers = {}
+    for trial in trials:
+        worker = workers.setdefault(trial['worker'], {'trials': 0, 'busy': 0.0})
+        worker['trials'] += 1
+        worker['busy'] += trial['duration']
+
+    trial_summary = {'count': len(trials)}
+    if trials:
+        run_times = [trial['duration'] for trial in trials]
+        queue_waits = [trial['queue_wait'] for trial in trials]
+        trial_summary.update({'mean_run': sum(run_times) / len(trials), 'max_run': max(run_times),
+                              'mean_queue_wait': sum(queue_waits) / len(trials), 'max_queue_wait': max(queue_waits),
+                              'span': max(t['start'] + t['duration'] for t in trials) - min(t['start'] for t in trials)})
+
+    return {'stages': stages, 'trials': trial_summary, 'workers': workers}
+
+
+def format_summary():
+    """
+    :return: the summary as a text table.
+    """
+    result = summary()
+    lines = [f"{'stage':<28}{'count':>7}{'wall (s)':>12}{'cpu (s)':>12}{'RSS (MB)':>10}{'RSS +/- (MB)':>14}"
+             f"{'lifetime peak RSS (MB)':>24}{'child peak (MB)':>17}"]
+    for name, stage in result['stages'].items():
+        lines.append(f"{name:<28}{stage['count']:>7}{stage['wall']:>12.3f}{stage['cpu']:>12.3f}"
+                     f"{stage['rss_end'] / 2 ** 20:>10.1f}{stage['rss_change'] / 2 ** 20:>+14.1f}"
+                     f"{stage['lifetime_max_rss'] / 2 ** 20:>24.1f}{stage['children_lifetime_max_rss'] / 2 ** 20:>17.1f}")
+
+    trials = result['trials']
+    if trials['count']:
+        lines.append('')
+        lines.append(f"{trials['count']} trials, run time mean {trials['mean_run']:.3f} s max {trials['max_run']:.3f} s, "
+                     f"queue wait mean {trials['mean_queue_wait']:.3f} s max {trials['max_queue_wait']:.3f} s.")
+        lines.append(f"{'worker':<28}{'trials':>7}{'busy (s)':>12}{'busy (%)':>12}")
+        for name, worker in sorted(result['workers'].items()):
+            busy_fraction = worker['busy'] / trials['span'] if trials['span'] > 0 else 0.0
+            lines.append(f"{name:<28}{worker['trials']:>7}{worker['busy']:>12.3f}{100.0 * busy_fraction:>12.1f}")
+
+    return '\n'.join(lines)
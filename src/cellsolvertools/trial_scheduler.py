@@ -0,0 +1,365 @@
+"""
+Run solver processes directly with bounded concurrency.
+
+Trials are described by dicts with the keys:
+
+  index           the trial number, used in reports
+  args            the command line of the solver process
+  env             (optional) the environment for the solver process
+  input           (optional) bytes written to the solver process's stdin
+  capture_output  (optional) keep the solver process's stdout in the result
+
+Trials are pulled from the given iterable only when a slot becomes free,
+so memory use does not grow with the number of trials.
+
+Trials can instead be handed to worker agents through a work queue (see
+work_queue), in which case each trial needs a 'task' entry, the JSON
+serialisable description of the work sent to the agents.  The agents
+answer on the queue named by the task's 'reply_to' with a result dict
+carrying the same keys, stdout and stderr as text, and while they solve
+it with {'index': ..., 'heartbeat': True} at least every few seconds.
+Tasks are handed out as answers come in, twice as many as there are
+workers at a time.  A task not heard of for task_timeout seconds is
+handed out again, its agent having died or its answer having been lost,
+and fails once MAX_TASK_ATTEMPTS agents have had it.  Every trial
+produces a result dict with the keys ['index', 'returncode', 'wall_time',
+'queue_wait', 'started', 'worker', 'stdout', 'stderr', 'trial'] which is
+handed to an optional callback as soon as the trial finishes, 'trial'
+being the trial dict itself.  queue_wait is the time from the start of
+run_trials, or from handing the trial to the work queue, until the trial
+started running, started is the time.perf_counter() it started at, and
+worker names the solver slot or worker agent that ran it.  Finished trials
+are also recorded with tracing.record_trial.  When the trials run as solver
+processes the callback runs on a thread of its own, one result at a time,
+so reading a trial's outputs does not hold up launching the next trials.
+
+Trials can also be run without starting a process for each of them: given
+an entry point, a 'module:function' console script entry point, run_trials
+starts worker processes that import the module once and then call the
+function for every trial with sys.argv set to the trial's args.  The exit
+code is taken from SystemExit, 0 when the function returns and 1 when it
+raises.  'env' and 'input' are not supported for these trials.
+"""
+import asyncio
+import collections
+import contextlib
+import importlib
+import io
+import os
+import sys
+import time
+import traceback
+
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from cellsolvertools import tracing
+
+# Seconds a task on a work queue may go without word from an agent, and the number of times it is handed out.
+TASK_LEASE = 60.0
+MAX_TASK_ATTEMPTS = 3
+
+
+def _format_failure(result):
+    message = f"Trial {result['index']} failed with exit code {result['returncode']}."
+    stderr = result['stderr'].decode(errors='replace').strip() if result['stderr'] else ''
+    if stderr:
+        message += f" {stderr.splitlines()[-1]}"
+    return message
+
+
+def _record_result(summary, result, on_complete, stream):
+    tracing.record_trial(result['index'], result['started'], result['wall_time'], result['queue_wait'], result['worker'], result['returncode'])
+    summary['completed'] += 1
+    summary['trial_time'] += result['wall_time']
+    if result['returncode'] != 0:
+        summary['failed'].append(result['index'])
+        print(_format_failure(result), file=stream)
+    if on_complete is not None:
+        on_complete(result)
+
+
+async def _run_trial(trial, queued, worker):
+    start = time.perf_counter()
+    trial_input = trial.get('input')
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *trial['args'],
+            env=trial.get('env'),
+            stdin=asyncio.subprocess.DEVNULL if trial_input is None else asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE if trial.get('capture_output', False) else asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE)
+        stdout, stderr = await process.communicate(trial_input)
+        returncode = process.returncode
+    except OSError as e:
+        stdout, stderr, returncode = None, str(e).encode(), -1
+
+    return {
+        'index': trial['index'],
+        'returncode': returncode,
+        'wall_time': time.perf_counter() - start,
+        'queue_wait': start - queued,
+        'started': start,
+        'worker': worker,
+        'stdout': stdout,
+        'stderr': stderr,
+        'trial': trial,
+    }
+
+
+async def _worker(trials, summary, on_complete, stream, queued, slot, callbacks, max_callbacks):
+    loop = asyncio.get_running_loop()
+    for trial in trials:
+        result = await _run_trial(trial, queued, f'slot {slot}')
+        _record_result(summary, result, None, stream)
+        if on_complete is not None:
+            callbacks['pending'].append(loop.run_in_executor(callbacks['executor'], on_complete, result))
+            # Results waiting on a slow callback hold on to their output, keep their number bounded.
+            while len(callbacks['pending']) > max_callbacks:
+                await callbacks['pending'].popleft()
+
+
+async def _reporter(summary, start, report_interval, stream):
+    while True:
+        await asyncio.sleep(report_interval)
+        report_progress(summary, start, stream)
+
+
+def report_progress(summary, start, stream):
+    """
+    Print the number of finished trials and the throughput since start.
+    """
+    elapsed = time.perf_counter() - start
+    throughput = summary['completed'] / elapsed if elapsed > 0 else 0.0
+    print(f"{summary['completed']} trials completed ({len(summary['failed'])} failed), {throughput:.2f} trials/s.", file=stream)
+
+
+async def _run_trials(trials, max_workers, on_complete, report_interval, stream):
+    summary = {'completed': 0, 'failed': [], 'trial_time': 0.0, 'wall_time': 0.0}
+    start = time.perf_counter()
+    trial_iterator = iter(trials)
+    reporter = None
+    if report_interval:
+        reporter = asyncio.ensure_future(_reporter(summary, start, report_interval, stream))
+
+    # The callback runs on one thread, results are handed to it in the order the trials finish.
+    callbacks = {'executor': ThreadPoolExecutor(1, thread_name_prefix='on_complete'), 'pending': collections.deque()}
+    max_workers = max(1, max_workers)
+    try:
+        await asyncio.gather(*[_worker(trial_iterator, summary, on_complete, stream, start, slot, callbacks, 2 * max_workers) for slot in range(max_workers)])
+        while callbacks['pending']:
+            await callbacks['pending'].popleft()
+    finally:
+        if reporter is not None:
+            reporter.cancel()
+        callbacks['executor'].shutdown()
+
+    summary['wall_time'] = time.perf_counter() - start
+    if report_interval:
+        report_progress(summary, start, stream)
+
+    return summary
+
+
+def _run_queued_trials(trials, max_workers, work_queue, on_complete, report_interval, stream, task_timeout):
+    summary = {'completed': 0, 'failed': [], 'trial_time': 0.0, 'wall_time': 0.0}
+    start = time.perf_counter()
+    trial_iterator = iter(trials)
+    # Trial index to dict with keys ['trial', 'queued', 'deadline', 'attempts'] of the tasks handed out and not yet answered.
+    pending = {}
+    reply_to = None
+
+    def hand_out(entry):
+        work_queue['put']('tasks', entry['trial']['task'])
+        entry['attempts'] += 1
+        entry['deadline'] = time.perf_counter() + task_timeout
+
+    def fill():
+        # Twice as many tasks as workers are handed out at a time, the rest are pulled as answers come in.
+        nonlocal reply_to
+        while len(pending) < 2 * max(1, max_workers):
+            trial = next(trial_iterator, None)
+            if trial is None:
+                return
+            reply_to = trial['task']['reply_to']
+            entry = {'trial': trial, 'queued': time.perf_counter(), 'attempts': 0}
+            pending[trial['index']] = entry
+            hand_out(entry)
+
+    def record(entry, answer):
+        # The agents' clocks are not ours, place the run just before the answer arrived.
+        started = time.perf_counter() - answer['wall_time']
+        result = {
+            'index': answer['index'],
+            'returncode': answer['returncode'],
+            'wall_time': answer['wall_time'],
+            'queue_wait': max(0.0, started - entry['queued']),
+            'started': started,
+            'worker': answer.get('worker', 'agent'),
+            'stdout': None if answer.get('stdout') is None else answer['stdout'].encode(),
+            'stderr': None if answer.get('stderr') is None else answer['stderr'].encode(),
+            'trial': entry['trial'],
+        }
+        _record_result(summary, result, on_complete, stream)
+
+    fill()
+    last_report = start
+    while pending:
+        now = time.perf_counter()
+        timeout = min(entry['deadline'] for entry in pending.values()) - now
+        if report_interval:
+            timeout = min(timeout, last_report + report_interval - now)
+        answer = work_queue['get'](reply_to, max(0.0, timeout))
+        if answer is not None and answer['index'] in pending:
+            if answer.get('heartbeat', False):
+                pending[answer['index']]['deadline'] = time.perf_counter() + task_timeout
+            else:
+                record(pending.pop(answer['index']), answer)
+                fill()
+
+        # A task not heard of within its lease went to an agent that died or whose answer was lost.
+        for index, entry in list(pending.items()):
+            if entry['deadline'] > time.perf_counter():
+                continue
+            if entry['attempts'] < MAX_TASK_ATTEMPTS:
+                print(f'No word on task {index} for {task_timeout} s, handing it out again.', file=stream)
+                hand_out(entry)
+            else:
+                del pending[index]
+                record(entry, {'index': index, 'returncode': -1, 'wall_time': 0.0, 'worker': 'work queue',
+                               'stderr': f'No worker agent answered the task in {MAX_TASK_ATTEMPTS} attempts.'})
+                fill()
+        if report_interval and time.perf_counter() - last_report >= report_interval:
+            report_progress(summary, start, stream)
+            last_report = time.perf_counter()
+
+    summary['wall_time'] = time.perf_counter() - start
+    if report_interval:
+        report_progress(summary, start, stream)
+
+    return summary
+
+
+_entry_point = {}
+
+
+def _load_entry_point(entry_point):
+    module_name, function_name = entry_point.split(':')
+    _entry_point['function'] = getattr(importlib.import_module(module_name), function_name)
+
+
+def _call_entry_point(trial):
+    start = time.perf_counter()
+    stdout = io.StringIO()
+    stderr = io.StringIO()
+    argv = sys.argv
+    sys.argv = list(trial['args'])
+    try:
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            _entry_point['function']()
+        returncode = 0
+    except SystemExit as e:
+        # As the interpreter does, anything but an exit code is printed and exits with 1.
+        returncode = 0 if e.code is None else e.code if isinstance(e.code, int) else 1
+        if not isinstance(e.code, (int, type(None))):
+            print(e.code, file=stderr)
+    except Exception:
+        traceback.print_exc(file=stderr)
+        returncode = 1
+    finally:
+        sys.argv = argv
+
+    return {
+        'index': trial['index'],
+        'returncode': returncode,
+        'wall_time': time.perf_counter() - start,
+        'started': start,
+        'worker': f'process {os.getpid()}',
+        'stdout': stdout.getvalue().encode() if trial.get('capture_output', False) else None,
+        'stderr': stderr.getvalue().encode(),
+    }
+
+
+def _run_in_process_trials(trials, max_workers, entry_point, on_complete, report_interval, stream):
+    summary = {'completed': 0, 'failed': [], 'trial_time': 0.0, 'wall_time': 0.0}
+    start = time.perf_counter()
+    last_report = start
+    max_workers = max(1, max_workers)
+    executor = ProcessPoolExecutor(max_workers, initializer=_load_entry_point, initargs=(entry_point,))
+    # Twice as many trials in flight as workers keeps them busy while the trials are still pulled lazily.
+    pending = collections.deque()
+
+    def restart():
+        nonlocal executor
+        executor.shutdown(wait=False)
+        executor = ProcessPoolExecutor(max_workers, initializer=_load_entry_point, initargs=(entry_point,))
+
+    def submit(trial):
+        try:
+            return executor.submit(_call_entry_point, trial)
+        except BrokenProcessPool as e:
+            future = Future()
+            future.set_exception(e)
+            return future
+
+    def record(trial, future):
+        nonlocal last_report
+        try:
+            result = future.result()
+        except BrokenProcessPool:
+            # A worker died and took the pool, and every trial in flight, with it.  Run this trial again on its own to
+            # tell whether it is the one that killed the worker, then resubmit the others.
+            restart()
+            try:
+                result = executor.submit(_call_entry_point, trial).result()
+            except BrokenProcessPool:
+                result = {'index': trial['index'], 'returncode': -1, 'wall_time': 0.0, 'started': time.perf_counter(), 'worker': 'in-process pool',
+                          'stdout': None, 'stderr': b'The worker process terminated abruptly.'}
+                restart()
+            for index, (queued_trial, queued_future) in enumerate(pending):
+                if isinstance(queued_future.exception(), BrokenProcessPool):
+                    pending[index] = (queued_trial, submit(queued_trial))
+        result['queue_wait'] = max(0.0, result['started'] - start)
+        result['trial'] = trial
+        _record_result(summary, result, on_complete, stream)
+        if report_interval and time.perf_counter() - last_report >= report_interval:
+            report_progress(summary, start, stream)
+            last_report = time.perf_counter()
+
+    try:
+        for trial in trials:
+            pending.append((trial, submit(trial)))
+            while len(pending) >= 2 * max_workers:
+                record(*pending.popleft())
+        while pending:
+            record(*pending.popleft())
+    finally:
+        executor.shutdown()
+
+    summary['wall_time'] = time.perf_counter() - start
+    if report_interval:
+        report_progress(summary, start, stream)
+
+    return summary
+
+
+def run_trials(trials, max_workers, on_complete=None, report_interval=10.0, stream=sys.stderr, work_queue=None, entry_point=None, task_timeout=TASK_LEASE):
+    """
+    Run the trials with at most max_workers solver processes at a time, or hand them to worker agents through a work queue.
+    :param trials: iterable of trial dicts, consumed lazily.
+    :param max_workers: maximum number of concurrent solver processes, with a work queue half the number of tasks handed out at a time.
+    :param on_complete: optional callable given each trial's result when it finishes, called from one thread at a time.
+    :param report_interval: seconds between throughput reports, None or 0 to stay quiet.
+    :param stream: where reports and failures are written.
+    :param work_queue: optional work queue, see work_queue.open_work_queue.
+    :param entry_point: optional 'module:function' called in max_workers warm worker processes instead of starting a process per trial.
+    :param task_timeout: seconds a task handed to the work queue may go without word from an agent before it is handed out again.
+    :return: summary dict with keys ['completed', 'failed', 'trial_time', 'wall_time'],
+    failed being the list of indices of the trials that did not exit cleanly.
+    """
+    if work_queue is not None:
+        return _run_queued_trials(trials, max_workers, work_queue, on_complete, report_interval, stream, task_timeout)
+    if entry_point is not None:
+        return _run_in_process_trials(trials, max_workers, entry_point, on_complete, report_interval, stream)
+
+    return asyncio.run(_run_trials(trials, max_workers, on_complete, report_interval, stream))
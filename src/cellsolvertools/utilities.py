@@ -1,35 +1,41 @@
+import contextlib
 import types
 
 from xml.etree import ElementTree
 from zipfile import ZipFile, BadZipfile
 
-from cellsolvertools.generate_code import ModelGenerationError, return_generated_python_code
+from cellsolvertools.omex_archive import OMEX_MANIFEST
+
+CELLML_2_0_NAMESPACE = 'http://www.cellml.org/cellml/2.0#'
 
 
 def is_omex_file(filename):
+    """
+    True for a zip archive with an OMEX manifest, only the archive's directory is read.
+    """
     try:
         with ZipFile(filename) as omex_zip:
-            info_list = omex_zip.infolist()
-            for info in info_list:
-                print(info)
-    except FileNotFoundError:
-        return False
-    except IsADirectoryError:
-        return False
-    except BadZipfile:
+            omex_zip.getinfo(OMEX_MANIFEST)
+    except (OSError, BadZipfile, KeyError):
         return False
 
-    return False
+    return True
 
 
 def is_cellml_file(filename):
+    """
+    True for a CellML 2.0 model, parsing stops at the root element.
+    :param filename: file name, or binary file object such as an entry opened in an OMEX archive.
+    """
     try:
-        my_namespaces = dict([node for _, node in ElementTree.iterparse(filename, events=['start-ns'])])
-
-        for ns in my_namespaces:
-            if my_namespaces[ns] == 'http://www.cellml.org/cellml/2.0#':
-                return True
-    except IsADirectoryError:
+        with contextlib.ExitStack() as stack:
+            source = filename if hasattr(filename, 'read') else stack.enter_context(open(filename, 'rb'))
+            for event, node in ElementTree.iterparse(source, events=['start-ns', 'start']):
+                if event == 'start':
+                    return node.tag.startswith(f'{{{CELLML_2_0_NAMESPACE}}}')
+                if node[1] == CELLML_2_0_NAMESPACE:
+                    return True
+    except OSError:
         return False
     except ElementTree.ParseError:
         return False
@@ -46,26 +52,19 @@ def import_code(code_string, name):
 
 
 def get_parameters_from_model(model_file):
+    from cellsolvertools.generate_code import ModelGenerationError
+    from cellsolvertools.model_cache import model_metadata
+
     try:
-        python_code = return_generated_python_code(model_file)
+        metadata = model_metadata(model_file)
     except ModelGenerationError:
         return {}
 
-    m = import_code(python_code, 'generated_model_python_code')
-
     parameter_info = {}
-    state_info = m.STATE_INFO
-    for s in state_info:
-        if s['component'] in parameter_info:
-            parameter_info[s['component']][s['name']] = 'STATE'
-        else:
-            parameter_info[s['component']] = {s['name']: 'STATE'}
-
-    variable_info = m.VARIABLE_INFO
-    for v in variable_info:
+    for v in [*metadata['state_info'], *metadata['variable_info']]:
         if v['component'] in parameter_info:
-            parameter_info[v['component']][v['name']] = v['type'].name
+            parameter_info[v['component']][v['name']] = v['type']
         else:
-            parameter_info[v['component']] = {v['name']: v['type'].name}
+            parameter_info[v['component']] = {v['name']: v['type']}
 
     return parameter_info
@@ -0,0 +1,270 @@
+"""
+Work queues for distributing trials to worker agents on other nodes.
+
+A work queue is a dict of functions over named queues of JSON serialisable
+items:
+
+  put(name, item)       append item to the named queue
+  get(name, timeout)    remove and return the first item of the named
+                        queue, waiting up to timeout seconds (None waits
+                        forever), None if nothing arrived in time
+  close()               release the queue's resources
+
+Queues are opened from a URL:
+
+  memory://                     in process, for tests and local runs
+  spool:///shared/directory     a directory on a shared filesystem
+  tcp://host:port               a broker started with cellsolver-work-broker
+  unix:///path/to/socket        the same broker on a Unix socket
+  redis://host:port/db          any Redis compatible server, needs the redis package
+
+The broker is a plain JSON lines server holding its queues in memory, it
+stands in for Redis where no Redis server is available.
+"""
+import argparse
+import asyncio
+import json
+import os
+import queue
+import socket
+import threading
+import time
+import uuid
+
+from urllib.parse import urlparse
+
+SPOOL_POLL_INTERVAL = 0.1
+# Items carry blocks of parameter vectors, allow for large ones.
+BROKER_LINE_LIMIT = 1 << 28
+
+
+class WorkQueueError(Exception):
+    pass
+
+
+def memory_queue():
+    queues = {}
+    lock = threading.Lock()
+
+    def _queue(name):
+        with lock:
+            return queues.setdefault(name, queue.Queue())
+
+    def put(name, item):
+        _queue(name).put(json.loads(json.dumps(item)))
+
+    def get(name, timeout=None):
+        try:
+            return _queue(name).get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    return {'put': put, 'get': get, 'close': lambda: None}
+
+
+def spool_queue(directory):
+    """
+    Queue of JSON files in directory/name, claimed by renaming them, which is atomic
+    on a POSIX filesystem, so any number of agents can share the directory.
+    """
+    def _directory(name):
+        queue_directory = os.path.join(directory, name)
+        os.makedirs(queue_directory, exist_ok=True)
+        return queue_directory
+
+    def put(name, item):
+        queue_directory = _directory(name)
+        temporary_name = os.path.join(queue_directory, f'.tmp-{uuid.uuid4().hex}')
+        with open(temporary_name, 'w') as f:
+            json.dump(item, f)
+        os.rename(temporary_name, os.path.join(queue_directory, f'{time.time_ns():020d}-{uuid.uuid4().hex}.json'))
+
+    def get(name, timeout=None):
+        queue_directory = _directory(name)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            for entry in sorted(f for f in os.listdir(queue_directory) if f.endswith('.json')):
+                claimed_name = os.path.join(queue_directory, f'.claimed-{uuid.uuid4().hex}')
+                try:
+                    os.rename(os.path.join(queue_directory, entry), claimed_name)
+                except FileNotFoundError:
+                    # Claimed by another agent.
+                    continue
+                with open(claimed_name) as f:
+                    item = json.load(f)
+                os.remove(claimed_name)
+                return item
+
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(SPOOL_POLL_INTERVAL if deadline is None else max(0.0, min(SPOOL_POLL_INTERVAL, deadline - time.monotonic())))
+
+    return {'put': put, 'get': get, 'close': lambda: None}
+
+
+def broker_queue(address):
+    """
+    Client of a broker at address, a (host, port) tuple or a Unix socket path.
+    Each thread has its own connection, so a thread waiting for an item does not hold up the others.
+    """
+    local = threading.local()
+    connections = []
+    lock = threading.Lock()
+
+    def _stream():
+        if getattr(local, 'stream', None) is None:
+            if isinstance(address, tuple):
+                connection = socket.create_connection(address)
+            else:
+                connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                connection.connect(address)
+            local.stream = connection.makefile('rwb')
+            with lock:
+                connections.append((connection, local.stream))
+        return local.stream
+
+    def _request(message):
+        stream = _stream()
+        stream.write(json.dumps(message).encode() + b'\n')
+        stream.flush()
+        reply = stream.readline()
+        if not reply:
+            raise WorkQueueError(f'Broker at {address} closed the connection.')
+        return json.loads(reply)
+
+    def put(name, item):
+        _request({'op': 'put', 'queue': name, 'item': item})
+
+    def get(name, timeout=None):
+        return _request({'op': 'get', 'queue': name, 'timeout': timeout})['item']
+
+    def close():
+        with lock:
+            for connection, stream in connections:
+                stream.close()
+                connection.close()
+            connections.clear()
+
+    return {'put': put, 'get': get, 'close': close}
+
+
+def redis_queue(url, prefix='cellsolvertools'):
+    try:
+        import redis
+    except ImportError:
+        raise WorkQueueError('The redis package is required for redis:// work queues.')
+
+    client = redis.Redis.from_url(url)
+
+    def put(name, item):
+        client.rpush(f'{prefix}:{name}', json.dumps(item))
+
+    def get(name, timeout=None):
+        # BLPOP waits forever for a timeout of 0 and only takes whole seconds on older servers.
+        reply = client.blpop([f'{prefix}:{name}'], timeout=0 if timeout is None else max(1, round(timeout)))
+        return None if reply is None else json.loads(reply[1])
+
+    return {'put': put, 'get': get, 'close': client.close}
+
+
+def parse_broker_address(url):
+    parsed = urlparse(url)
+    if parsed.scheme == 'tcp':
+        return parsed.hostname or 'localhost', parsed.port
+    if parsed.scheme == 'unix':
+        return parsed.path
+
+    raise WorkQueueError(f'Unsupported broker address "{url}", use tcp://host:port or unix:///path.')
+
+
+def open_work_queue(url):
+    """
+    Open the work queue at url, see the module documentation for the supported URLs.
+    """
+    scheme = urlparse(url).scheme
+    if scheme == 'memory':
+        return memory_queue()
+    if scheme == 'spool':
+        return spool_queue(urlparse(url).path)
+    if scheme in ['tcp', 'unix']:
+        return broker_queue(parse_broker_address(url))
+    if scheme in ['redis', 'rediss']:
+        return redis_queue(url)
+
+    raise WorkQueueError(f'Unsupported work queue "{url}".')
+
+
+async def _serve_client(queues, reader, writer):
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            message = json.loads(line)
+            named_queue = queues.setdefault(message['queue'], asyncio.Queue())
+            if message['op'] == 'put':
+                named_queue.put_nowait(message['item'])
+                reply = {'ok': True}
+            else:
+                try:
+                    item = await asyncio.wait_for(named_queue.get(), message.get('timeout'))
+                except asyncio.TimeoutError:
+                    item = None
+                reply = {'item': item}
+            try:
+                if reader.at_eof():
+                    raise ConnectionResetError('The client went away while waiting.')
+                writer.write(json.dumps(reply).encode() + b'\n')
+                await writer.drain()
+            except ConnectionError:
+                # Whoever asked for the item never gets it, keep it for the next client.
+                if reply.get('item') is not None:
+                    named_queue.put_nowait(reply['item'])
+                raise
+    except (ConnectionError, json.JSONDecodeError, KeyError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve_broker(address, started=None):
+    """
+    Serve work queues on address, a (host, port) tuple or a Unix socket path, until cancelled.
+    :param started: optional threading.Event set once the broker is listening.
+    """
+    queues = {}
+
+    async def handle(reader, writer):
+        await _serve_client(queues, reader, writer)
+
+    if isinstance(address, tuple):
+        server = await asyncio.start_server(handle, address[0], address[1], limit=BROKER_LINE_LIMIT)
+    else:
+        server = await asyncio.start_unix_server(handle, address, limit=BROKER_LINE_LIMIT)
+
+    if started is not None:
+        started.set()
+    async with server:
+        await server.serve_forever()
+
+
+def process_arguments():
+    parser = argparse.ArgumentParser(description="Broker work queues between simulation campaigns and worker agents.")
+    parser.add_argument('address',
+                        help='address to serve on, tcp://host:port or unix:///path/to/socket')
+
+    return parser
+
+
+def main():
+    parser = process_arguments()
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve_broker(parse_broker_address(args.address)))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
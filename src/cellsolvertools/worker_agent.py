@@ -0,0 +1,142 @@
+"""
+Worker agent solving blocks of trials taken from a work queue.
+
+An agent runs on any node that can see the build cache and the campaign's
+output directory, typically through a shared filesystem.  It takes batch
+tasks from the 'tasks' queue, runs the siss-batch executable built under
+the task's build key, and answers on the task's reply queue, sending a
+heartbeat there every HEARTBEAT_INTERVAL seconds while it solves the task
+so the campaign knows the task is still in hand.
+"""
+import argparse
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from cellsolvertools.build_code import cached_executables
+from cellsolvertools.batch_file import write_batch_file
+from cellsolvertools.work_queue import open_work_queue
+
+# Well within the campaign's task lease, see trial_scheduler.TASK_LEASE.
+HEARTBEAT_INTERVAL = 10.0
+
+
+def run_task(task, build_cache_dir, work_dir, worker=None, heartbeat=None):
+    """
+    Solve the block of trials of a batch task.
+    :param worker: name of the worker reported with the result, by default the host name.
+    :param heartbeat: optional callable called every HEARTBEAT_INTERVAL seconds while the solver runs.
+    :return: result dict with keys ['index', 'returncode', 'wall_time', 'stdout', 'stderr', 'worker'].
+    """
+    start = time.perf_counter()
+    result = {'index': task['index'], 'worker': worker or socket.gethostname(), 'stdout': None}
+    executables = cached_executables(build_cache_dir, task['build'])
+    if executables is None:
+        result.update({'returncode': -1, 'wall_time': time.perf_counter() - start,
+                       'stderr': f'Build {task["build"]} is not in the build cache {build_cache_dir}.'})
+        return result
+
+    samples = np.array(task['samples'], dtype=np.float64).reshape(task['trial_count'], -1)
+    # Tasks of any number of campaigns share the work directory.
+    handle, batch_file_name = tempfile.mkstemp(suffix='.batch', prefix=f'batch_{task["index"]:05d}-', dir=work_dir)
+    os.close(handle)
+    write_batch_file(batch_file_name, task['first_trial'], samples, task['solver'], task['simulation'], task['output_format'], task['output_dtype'],
+                     task.get('compress_output', False))
+    os.makedirs(os.path.dirname(task['output_file_pattern'].replace('%%', '%')), exist_ok=True)
+    try:
+        process = subprocess.Popen([executables['batch_executable'], batch_file_name, task['output_file_pattern']],
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        while True:
+            try:
+                stdout, stderr = process.communicate(timeout=HEARTBEAT_INTERVAL)
+                break
+            except subprocess.TimeoutExpired:
+                if heartbeat is not None:
+                    heartbeat()
+        result.update({'returncode': process.returncode, 'stdout': stdout.decode(errors='replace'), 'stderr': stderr.decode(errors='replace')})
+    except OSError as e:
+        result.update({'returncode': -1, 'stderr': str(e)})
+    finally:
+        os.remove(batch_file_name)
+
+    result['wall_time'] = time.perf_counter() - start
+    return result
+
+
+def serve(work_queue, build_cache_dir, workers=1, idle_timeout=None, stream=sys.stderr):
+    """
+    Take tasks from the work queue and solve them, workers at a time.
+    :param idle_timeout: stop once no task has arrived for this many seconds, None to run until interrupted.
+    :return: number of tasks solved.
+    """
+    solved = [0]
+    lock = threading.Lock()
+
+    def work(work_dir, worker):
+        while True:
+            task = work_queue['get']('tasks', idle_timeout)
+            if task is None:
+                return
+            def heartbeat():
+                work_queue['put'](task['reply_to'], {'index': task['index'], 'heartbeat': True})
+
+            heartbeat()
+            result = run_task(task, build_cache_dir, work_dir, worker, heartbeat)
+            if result['returncode'] != 0:
+                print(f"Task {task['index']} failed with exit code {result['returncode']}.", file=stream)
+            work_queue['put'](task['reply_to'], result)
+            with lock:
+                solved[0] += 1
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        threads = [threading.Thread(target=work, args=(work_dir, f'{socket.gethostname()}:{os.getpid()}/{i}'), daemon=True) for i in range(max(1, workers))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    return solved[0]
+
+
+def process_arguments():
+    parser = argparse.ArgumentParser(description="Solve blocks of trials handed out through a work queue.")
+    parser.add_argument('work_queue',
+                        help='the work queue to take tasks from, e.g. tcp://host:port or spool:///shared/directory')
+    parser.add_argument('--build-cache', default=None,
+                        help='the build cache holding the solvers (default: $SIMULATION_DIR/build-cache)')
+    parser.add_argument('--workers', default=multiprocessing.cpu_count(), type=int,
+                        help='number of tasks solved at a time (default: CPU count)')
+    parser.add_argument('--idle-timeout', default=None, type=float,
+                        help='stop after this many seconds without a task (default: run until interrupted)')
+
+    return parser
+
+
+def main():
+    parser = process_arguments()
+    args = parser.parse_args()
+
+    build_cache_dir = args.build_cache
+    if build_cache_dir is None:
+        if 'SIMULATION_DIR' not in os.environ:
+            sys.exit(1)
+        build_cache_dir = os.path.join(os.environ['SIMULATION_DIR'], 'build-cache')
+
+    work_queue = open_work_queue(args.work_queue)
+    try:
+        serve(work_queue, build_cache_dir, args.workers, args.idle_timeout)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        work_queue['close']()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+#include <stdlib.h>
+
+#include "batch_solver.h"
+#include "decay.h"
+
+struct Solver {
+  SolverSettings settings;
+};
+
+size_t solverOutputColumnCount(void)
+{
+  return 1 + STATE_COUNT + VARIABLE_COUNT;
+}
+
+size_t solverOutputPointCount(const SolverSettings *settings)
+{
+  return (size_t) ((settings->endingPoint - settings->startingPoint) / settings->pointInterval + 1.0e-9) + 1;
+}
+
+Solver *createSolver(const SolverSettings *settings)
+{
+  Solver *solver = (Solver *) malloc(sizeof(Solver));
+  solver->settings = *settings;
+  return solver;
+}
+
+int solveTrial(Solver *solver, const double *parameters, double *output)
+{
+  if (parameters[0] == 0.0) {
+    _Exit(3);
+  }
+  for (size_t i = 0; i < solverOutputPointCount(&solver->settings); ++i) {
+    for (size_t j = 0; j < solverOutputColumnCount(); ++j) {
+      output[i * solverOutputColumnCount() + j] = parameters[0] * (solver->settings.startingPoint + (double) i * solver->settings.pointInterval);
+    }
+  }
+  return (parameters[0] < 0.0) ? -3 : 0;
+}
+
+void deleteSolver(Solver *solver)
+{
+  free(solver);
+}
@@ -0,0 +1,90 @@
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+from cellsolvertools.adaptive_stopping import AdaptiveStoppingError, convergence, convergence_handler, target_selection, target_values
+from cellsolvertools.ensemble_statistics import confidence_half_widths, create_statistics, update_statistics
+from cellsolvertools.simple_sundials_solver_manager import entry_point
+
+column_info = [{'component': 'main', 'name': 't'}, {'component': 'membrane', 'name': 'v'}]
+
+# Stands in for siss-batch, the output of each trial is 1 + (trial % 2) / 100 at every point.
+batch_script = f"""#!{sys.executable}
+import struct, sys
+with open(sys.argv[1], 'rb') as f:
+    header = struct.unpack('=8sQQQddddddqiiii', f.read(struct.calcsize('=8sQQQddddddqiiii')))
+for trial in range(header[1] + 1, header[1] + header[2] + 1):
+    with open(sys.argv[2].replace('%05llu', '%05d') % trial, 'w') as f:
+        f.write('main.t,membrane.v\\n')
+        f.write(''.join(f'{{t}},{{1 + (trial % 2) / 100}}\\n' for t in range(3)))
+    print(trial, 0)
+"""
+
+
+class AdaptiveStoppingTestCase(unittest.TestCase):
+
+    def test_targets(self):
+        time = np.linspace(0.0, 10.0, 11)
+        data = np.column_stack([time, time ** 2])
+        selection = target_selection([{'variable': 'membrane.v', 'times': [2.1, 7.0]}, {'variable': 'membrane.v', 'reduce': 'max'}], time, column_info)
+        np.testing.assert_array_equal([4.0, 49.0, 100.0], target_values(selection, data))
+
+        self.assertRaises(AdaptiveStoppingError, target_selection, [{'variable': 'membrane.i', 'reduce': 'max'}], time, column_info)
+        self.assertRaises(AdaptiveStoppingError, target_selection, [{'variable': 'membrane.v', 'reduce': 'median'}], time, column_info)
+        self.assertRaises(AdaptiveStoppingError, target_selection, [{'variable': 'membrane.v'}], time, column_info)
+
+    def test_half_widths(self):
+        rng = np.random.default_rng(5)
+        values = rng.normal(2.0, 0.5, (10000, 1, 1))
+        statistics = create_statistics(1, 1, quantiles=[])
+        self.assertTrue(np.isinf(confidence_half_widths(statistics)['mean']).all())
+        for value in values:
+            update_statistics(statistics, value)
+
+        half_widths = confidence_half_widths(statistics)
+        self.assertAlmostEqual(1.96 * 0.5 / 100.0, half_widths['mean'][0, 0], delta=1e-3)
+        self.assertAlmostEqual(1.96 * 0.5 / np.sqrt(2.0 * 9999.0), half_widths['std'][0, 0], delta=1e-3)
+
+    def test_convergence(self):
+        adaptive_config = {'targets': [{'variable': 'membrane.v', 'reduce': 'final'}], 'tolerance': 0.01, 'min_trials': 10}
+        handler, current = convergence_handler(adaptive_config)
+        self.assertFalse(current()['converged'])
+        rng = np.random.default_rng(3)
+        for trial_index, value in enumerate(rng.normal(1.0, 0.1, 400)):
+            handler(trial_index, np.array([[0.0, 0.0], [1.0, value]]), column_info)
+        self.assertFalse(current()['converged'])
+        for trial_index, value in enumerate(rng.normal(1.0, 0.1, 40000)):
+            handler(trial_index, np.array([[0.0, 0.0], [1.0, value]]), column_info)
+        self.assertTrue(current()['converged'])
+
+        statistics = create_statistics(1, 1, quantiles=[])
+        for value in [np.nan, 1.0, 2.0]:
+            update_statistics(statistics, np.array([[value]]))
+        self.assertFalse(convergence(statistics, {'min_trials': 0})['converged'])
+
+    def test_campaign(self):
+        directory = tempfile.mkdtemp()
+        try:
+            executable = os.path.join(directory, 'siss-batch')
+            with open(executable, 'w') as f:
+                f.write(batch_script)
+            os.chmod(executable, stat.S_IRWXU)
+            config = {'num_trials': 1000, 'workers': 2, 'report_interval': None,
+                      'application': {'simulation_dir': directory, 'executable': executable, 'batch_executable': executable, 'prebuilt': True},
+                      'simulation': {'StartingPoint': 0.0, 'EndingPoint': 2.0, 'PointInterval': 1.0},
+                      'adaptive': {'targets': [{'variable': 'membrane.v', 'times': [1.0]}], 'quantities': ['mean'], 'tolerance': 0.001, 'wave_size': 50}}
+            summary = entry_point(config)
+            self.assertTrue(summary['convergence']['converged'])
+            self.assertEqual(100, summary['convergence']['count'])
+            self.assertEqual(100, len(os.listdir(os.path.join(directory, 'output'))))
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
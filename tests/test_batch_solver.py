@@ -0,0 +1,109 @@
+import ctypes.util
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+import numpy as np
+
+from cellsolvertools.batch_file import BATCH_FILE_HEADER, SimulationConfigurationError, write_batch_file
+from cellsolvertools.binary_output import COMPRESSION_CHUNK_ROWS, load_output
+from cellsolvertools.generate_code import analyse_model, write_c_code
+from cellsolvertools.simple_sundials_solver_manager import default_chunk_size
+
+resources_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resources')
+
+solver_config = {
+    "MaximumNumberOfSteps": 500,
+    "RelativeTolerance": 1e-07,
+    "AbsoluteTolerance": 1e-07,
+    "IntegrationMethod": "Adams",
+    "IterationType": "Newton",
+    "InterpolateSolution": True,
+    "LinearSolver": "Dense",
+    "MaximumStep": 0.1
+}
+
+simulation_config = {
+    "StartingPoint": 0.0,
+    "EndingPoint": 100.0,
+    "PointInterval": 0.5,
+}
+
+
+class BatchFileTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self._batch_file_name = os.path.join(tempfile.mkdtemp(), 'batch.bin')
+
+    def tearDown(self):
+        if os.path.isfile(self._batch_file_name):
+            os.remove(self._batch_file_name)
+        os.rmdir(os.path.dirname(self._batch_file_name))
+
+    def test_layout(self):
+        samples = np.arange(12, dtype=float).reshape(4, 3)
+        write_batch_file(self._batch_file_name, 8, samples, solver_config, simulation_config)
+
+        with open(self._batch_file_name, 'rb') as f:
+            header = BATCH_FILE_HEADER.unpack(f.read(BATCH_FILE_HEADER.size))
+            values = np.frombuffer(f.read(), dtype=np.float64)
+
+        self.assertEqual((b'SISSBAT1', 8, 4, 3, 0.0, 100.0, 0.5, 1e-07, 1e-07, 0.1, 500, 1, 0, 1, 0), header)
+        np.testing.assert_array_equal(samples.ravel(), values)
+
+    def test_unsupported_settings(self):
+        self.assertRaises(SimulationConfigurationError, write_batch_file, self._batch_file_name, 0, np.empty((1, 0)), {**solver_config, 'LinearSolver': 'GMRES'}, simulation_config)
+        self.assertRaises(SimulationConfigurationError, write_batch_file, self._batch_file_name, 0, np.empty((1, 0)), {**solver_config, 'IntegrationMethod': 'RK4'}, simulation_config)
+        self.assertRaises(SimulationConfigurationError, write_batch_file, self._batch_file_name, 0, np.empty((1, 0)), solver_config, simulation_config, 'csv',
+                          compress_output=True)
+
+    def test_chunk_size(self):
+        self.assertEqual(1, default_chunk_size(3, 8))
+        self.assertEqual(32, default_chunk_size(1000, 8))
+
+
+@unittest.skipUnless(shutil.which('cc') and ctypes.util.find_library('z'), 'requires a C compiler and zlib')
+class BatchDriverTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+        write_c_code(analyse_model(os.path.join(resources_dir, 'decay.cellml'), ['main.k']), self._directory)
+        shutil.copy(os.path.join(resources_dir, 'stand_in_solver.c'), self._directory)
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    def _build(self, zlib):
+        executable = os.path.join(self._directory, 'siss-batch')
+        subprocess.run(['cc', '-std=c99', '-DEXTERNAL_VARIABLES', *(['-DHAVE_ZLIB'] if zlib else []), 'batch_driver.c', 'stand_in_solver.c', 'decay.c',
+                        'external_variables.c', *(['-lz'] if zlib else []), '-lm', '-o', executable], cwd=self._directory, check=True)
+        return executable
+
+    def test_compressed_output(self):
+        executable = self._build(zlib=True)
+        batch_file_name = os.path.join(self._directory, 'batch.bin')
+        # Long enough for each column to take two chunks.
+        write_batch_file(batch_file_name, 0, np.array([[2.0], [3.0]]), {}, {'StartingPoint': 0.0, 'EndingPoint': 100000.0, 'PointInterval': 1.0},
+                         'binary', 'float32', compress_output=True)
+        process = subprocess.run([executable, batch_file_name, os.path.join(self._directory, 'output_%05llu.bin')], capture_output=True, check=True)
+        self.assertEqual(['1 0', '2 0'], process.stdout.decode().splitlines())
+
+        header, data = load_output(os.path.join(self._directory, 'output_00002.bin'))
+        self.assertEqual((1, COMPRESSION_CHUNK_ROWS, np.float32), (header['compression'], header['chunk_rows'], header['dtype']))
+        self.assertEqual(['t', 'x', 'k', 'y'], [info['name'] for info in header['column_info']])
+        np.testing.assert_array_equal(np.tile(3.0 * np.arange(100001.0), (4, 1)), data)
+
+    def test_without_zlib(self):
+        executable = self._build(zlib=False)
+        batch_file_name = os.path.join(self._directory, 'batch.bin')
+        write_batch_file(batch_file_name, 0, np.array([[2.0]]), {}, {'StartingPoint': 0.0, 'EndingPoint': 2.0, 'PointInterval': 0.5}, 'binary',
+                         compress_output=True)
+        process = subprocess.run([executable, batch_file_name, os.path.join(self._directory, 'output_%05llu.bin')], capture_output=True)
+        self.assertNotEqual(0, process.returncode)
+        self.assertIn(b'without zlib', process.stderr)
+
+
+if __name__ == '__main__':
+    unittest.main()
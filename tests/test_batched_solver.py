@@ -0,0 +1,131 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from cellsolvertools.batched_solver import ERROR_FAILURE, TOO_MUCH_WORK, load_batched_model, solve_trials
+from cellsolvertools.campaign_manifest import manifest_summary, open_manifest
+from cellsolvertools.ensemble_statistics import load_statistics
+from cellsolvertools.result_cube import open_result_cube, variable_view
+from cellsolvertools.simple_sundials_solver_manager import SimulationConfigurationError, entry_point
+
+# dx/dt = -k x, y = 2 x.
+decay_model_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resources', 'decay.cellml')
+
+# dx/dt = -r, r = k x for t < 1, exp(k) for t < 2 and max(k, x) after.
+piecewise_model = """<?xml version="1.0" encoding="UTF-8"?>
+<model xmlns="http://www.cellml.org/cellml/2.0#" xmlns:cellml="http://www.cellml.org/cellml/2.0#" name="piecewise">
+  <component name="main">
+    <variable name="t" units="dimensionless" interface="public_and_private"/>
+    <variable name="x" units="dimensionless" initial_value="1"/>
+    <variable name="k" units="dimensionless" initial_value="0.5"/>
+    <variable name="r" units="dimensionless"/>
+    <math xmlns="http://www.w3.org/1998/Math/MathML">
+      <apply><eq/><ci>r</ci><piecewise>
+        <piece><apply><times/><ci>k</ci><ci>x</ci></apply><apply><lt/><ci>t</ci><cn cellml:units="dimensionless">1</cn></apply></piece>
+        <piece><apply><exp/><ci>k</ci></apply><apply><lt/><ci>t</ci><cn cellml:units="dimensionless">2</cn></apply></piece>
+        <otherwise><apply><max/><ci>k</ci><ci>x</ci></apply></otherwise>
+      </piecewise></apply>
+      <apply><eq/><apply><diff/><bvar><ci>t</ci></bvar><ci>x</ci></apply><apply><minus/><ci>r</ci></apply></apply>
+    </math>
+  </component>
+</model>
+"""
+
+simulation_config = {'StartingPoint': 0.0, 'EndingPoint': 4.0, 'PointInterval': 0.5}
+
+
+class BatchedSolverTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    def _model_file(self, name, contents):
+        filename = os.path.join(self._directory, f'{name}.cellml')
+        with open(filename, 'w') as f:
+            f.write(contents)
+        return filename
+
+    def test_external_variables(self):
+        model = load_batched_model(decay_model_file, ['main.k'])
+        self.assertEqual(['main.t', 'main.x', 'main.k', 'main.y'], [f"{info['component']}.{info['name']}" for info in model['column_info']])
+
+        k = np.linspace(0.1, 2.0, 200)
+        outputs, flags = solve_trials(model, k[:, np.newaxis], simulation_config, {'RelativeTolerance': 1e-08, 'AbsoluteTolerance': 1e-10})
+        self.assertEqual((200, 9, 4), outputs.shape)
+        np.testing.assert_array_equal(np.zeros(200), flags)
+        time = np.linspace(0.0, 4.0, 9)
+        np.testing.assert_array_equal(np.tile(time, (200, 1)), outputs[:, :, 0])
+        np.testing.assert_allclose(np.exp(-np.outer(k, time)), outputs[:, :, 1], rtol=1e-6)
+        np.testing.assert_array_equal(np.tile(k[:, np.newaxis], (1, 9)), outputs[:, :, 2])
+        np.testing.assert_allclose(2.0 * outputs[:, :, 1], outputs[:, :, 3])
+
+    def test_piecewise(self):
+        model = load_batched_model(self._model_file('piecewise', piecewise_model))
+        outputs, flags = solve_trials(model, np.empty((2, 0)), simulation_config)
+        np.testing.assert_array_equal([0, 0], flags)
+        x = outputs[0, :, 1]
+        self.assertAlmostEqual(np.exp(-0.5), x[2], 6)
+        self.assertAlmostEqual(np.exp(-0.5) - np.exp(0.5), x[4], 5)
+        self.assertAlmostEqual(np.exp(-0.5) - np.exp(0.5) - 1.0, x[8], 5)
+
+    def test_failures(self):
+        model = load_batched_model(decay_model_file, ['main.k'])
+        outputs, flags = solve_trials(model, np.array([[0.5], [np.nan], [1.0]]), simulation_config)
+        np.testing.assert_array_equal([0, ERROR_FAILURE, 0], flags)
+        self.assertTrue(np.isnan(outputs[1, 1:]).all())
+        self.assertAlmostEqual(np.exp(-4.0), outputs[2, -1, 1], 6)
+
+        _, flags = solve_trials(model, np.array([[0.5], [1.0]]), simulation_config, {'MaximumNumberOfSteps': 2, 'RelativeTolerance': 1e-12})
+        np.testing.assert_array_equal([TOO_MUCH_WORK, TOO_MUCH_WORK], flags)
+
+    def test_campaign(self):
+        simulation_dir = os.path.join(self._directory, 'simulation')
+        config = {'num_trials': 50, 'workers': 1, 'report_interval': None, 'solver_backend': 'numpy', 'chunk_size': 16,
+                  'model_file': decay_model_file,
+                  'uncertainties': {'main.k': {'distribution': 'uniform', 'p1': 0.5, 'p2': 1.5}},
+                  'sampling': {'seed': 4},
+                  'application': {'simulation_dir': simulation_dir},
+                  'simulation': simulation_config}
+        self.assertRaises(SimulationConfigurationError, entry_point, config)
+
+        config['consolidate'] = True
+        summary = entry_point(config)
+        self.assertEqual(50, summary['completed'])
+        self.assertEqual([], summary['failed_trials'])
+        self.assertEqual([], os.listdir(os.path.join(simulation_dir, 'output')))
+        manifest = open_manifest(os.path.join(simulation_dir, 'campaign.sqlite'))
+        self.assertEqual(50, manifest_summary(manifest)['completed'])
+        manifest.close()
+
+        cube = open_result_cube(os.path.join(simulation_dir, 'results'))
+        k = variable_view(cube, 'main.k')[:, 0]
+        self.assertTrue(np.all((k >= 0.5) & (k <= 1.5)))
+        np.testing.assert_allclose(np.exp(-4.0 * k), variable_view(cube, 'main.x')[:, -1], rtol=1e-5)
+
+        config['resume'] = True
+        self.assertEqual(0, entry_point(config)['completed'])
+
+        # The statistics of a resumed campaign take the trials completed since their last checkpoint from the result cube.
+        statistics_file = os.path.join(simulation_dir, 'statistics.npz')
+        self.assertRaises(SimulationConfigurationError, entry_point, {**config, 'consolidate': False, 'statistics': True})
+        self.assertEqual(0, entry_point({**config, 'statistics': True})['completed'])
+        statistics = load_statistics(statistics_file)
+        self.assertEqual(50, statistics['count'])
+        np.testing.assert_allclose(variable_view(cube, 'main.x')[:, -1].mean(), statistics['mean'][-1, 1])
+
+        # So does adaptive stopping.
+        adaptive_config = {'targets': [{'variable': 'main.x', 'reduce': 'final'}], 'tolerance': 0.5, 'min_trials': 10}
+        self.assertRaises(SimulationConfigurationError, entry_point, {**config, 'consolidate': False, 'adaptive': adaptive_config})
+        summary = entry_point({**config, 'adaptive': adaptive_config})
+        self.assertEqual(0, summary['completed'])
+        self.assertEqual(50, summary['convergence']['count'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from cellsolvertools.binary_output import OutputFormatError, is_output_file, load_output, read_output_header, write_output
+
+column_info = [
+    {'component': 'environment', 'name': 'time', 'units': 'ms', 'type': 'VARIABLE_OF_INTEGRATION'},
+    {'component': 'membrane', 'name': 'v', 'units': 'mV', 'type': 'STATE'},
+    {'component': 'membrane', 'name': 'i_stim', 'units': 'uA', 'type': 'ALGEBRAIC'},
+]
+
+
+class BinaryOutputTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+        self._data = np.column_stack([np.arange(50.0), np.sin(np.arange(50.0)), np.cos(np.arange(50.0))])
+
+    def tearDown(self):
+        for f in os.listdir(self._directory):
+            os.remove(os.path.join(self._directory, f))
+        os.rmdir(self._directory)
+
+    def _filename(self, name):
+        return os.path.join(self._directory, name)
+
+    def test_round_trip(self):
+        filename = self._filename('output.bin')
+        write_output(filename, self._data, column_info, model='test')
+
+        header = read_output_header(filename)
+        self.assertTrue(is_output_file(filename))
+        self.assertEqual((50, 3, 'test'), (header['rows'], header['columns'], header['model']))
+        self.assertEqual(column_info, header['column_info'])
+        self.assertEqual(0, header['header_size'] % 64)
+
+        _, data = load_output(filename)
+        np.testing.assert_array_equal(self._data.T, data)
+
+        _, column = load_output(filename, 1)
+        self.assertIsInstance(column, np.memmap)
+        np.testing.assert_array_equal(self._data[:, 1], column)
+
+    def test_compressed_float32(self):
+        filename = self._filename('output.bin')
+        write_output(filename, self._data, column_info, dtype=np.float32, compress=True)
+
+        header, data = load_output(filename, [0, 2])
+        self.assertEqual(np.float32, header['dtype'])
+        np.testing.assert_array_equal(self._data[:, [0, 2]].T.astype(np.float32), data)
+
+        _, column = load_output(filename, 1)
+        np.testing.assert_array_equal(self._data[:, 1].astype(np.float32), column)
+
+    def test_compressed_chunks(self):
+        filename = self._filename('output.bin')
+        write_output(filename, self._data, column_info, compress=True, chunk_rows=16)
+
+        header, data = load_output(filename)
+        self.assertEqual((1, 16), (header['compression'], header['chunk_rows']))
+        np.testing.assert_array_equal(self._data.T, data)
+        np.testing.assert_array_equal(self._data[:, 2], load_output(filename, 2)[1])
+
+        write_output(filename, np.empty((0, 3)), column_info, compress=True)
+        self.assertEqual((3, 0), load_output(filename)[1].shape)
+
+    def test_not_output_file(self):
+        filename = self._filename('output.csv')
+        with open(filename, 'w') as f:
+            f.write('time,v\n0,1\n')
+
+        self.assertFalse(is_output_file(filename))
+        self.assertFalse(is_output_file(self._directory))
+        self.assertRaises(OutputFormatError, read_output_header, filename)
+
+
+if __name__ == '__main__':
+    unittest.main()
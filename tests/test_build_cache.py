@@ -0,0 +1,81 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from cellsolvertools.build_code import build_cache_key, cached_executables, store_executables
+from cellsolvertools.generate_code import generate_external_variable_c_code
+
+external_variable_info = [{'index': 1, 'name': 'r', 'component_name': 'dimensions'}]
+
+
+class BuildCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+        self._model = self._path('model.cellml')
+        self._src_dir = self._path('src')
+        os.makedirs(self._src_dir)
+        self._write(self._model, '<model/>')
+        self._write(os.path.join(self._src_dir, 'CMakeLists.txt'), 'project(siss)')
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    def _path(self, name):
+        return os.path.join(self._directory, name)
+
+    @staticmethod
+    def _write(filename, contents):
+        with open(filename, 'w') as f:
+            f.write(contents)
+
+    def _key(self, config=None):
+        return build_cache_key(self._model, config or {}, self._path('sundials'), self._src_dir)
+
+    def test_key(self):
+        key = self._key()
+        self.assertEqual(key, self._key())
+        self.assertNotEqual(key, self._key({'external_variables': {'dimensions.r': {}}}))
+        self.assertNotEqual(key, self._key({'shared_library': True}))
+
+        uncertainties = {'dimensions.r': {'distribution': 'uniform', 'p1': 1, 'p2': 2}, 'dimensions.l': {'distribution': 'normal', 'p1': 6, 'p2': 0.5}}
+        external_key = self._key({'external_variables': uncertainties})
+        self.assertNotEqual(external_key, self._key({'external_variables': dict(reversed(list(uncertainties.items())))}))
+        self.assertEqual(external_key, self._key({'external_variables': {**uncertainties, 'dimensions.r': {'distribution': 'uniform', 'p1': 0, 'p2': 3}}}))
+
+        self._write(os.path.join(self._src_dir, 'CMakeLists.txt'), 'project(siss C)')
+        self.assertNotEqual(key, self._key())
+        changed_source_key = self._key()
+        self._write(self._model, '<model name="m"/>')
+        self.assertNotEqual(changed_source_key, self._key())
+
+    def test_store(self):
+        cache_dir = self._path('cache')
+        application_config = {'executable': self._path('siss'), 'batch_executable': self._path('siss-batch')}
+        self.assertIsNone(cached_executables(cache_dir, 'abc'))
+        self._write(application_config['executable'], 'siss')
+        self.assertIsNone(store_executables(cache_dir, 'abc', application_config))
+
+        self._write(application_config['batch_executable'], 'siss-batch')
+        executables = store_executables(cache_dir, 'abc', application_config)
+        self.assertEqual(executables, cached_executables(cache_dir, 'abc'))
+        with open(executables['batch_executable']) as f:
+            self.assertEqual('siss-batch', f.read())
+        self.assertEqual(executables, store_executables(cache_dir, 'abc', application_config))
+        self.assertEqual(['abc'], os.listdir(cache_dir))
+
+    def test_unchanged_generated_code(self):
+        generate_external_variable_c_code(external_variable_info, self._directory)
+        filename = self._path('external_variables.c')
+        os.utime(filename, (0, 0))
+
+        generate_external_variable_c_code(external_variable_info, self._directory)
+        self.assertEqual(0, os.stat(filename).st_mtime)
+
+        generate_external_variable_c_code([{'index': 2, 'name': 'l', 'component_name': 'dimensions'}], self._directory)
+        self.assertNotEqual(0, os.stat(filename).st_mtime)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+from cellsolvertools.campaign_manifest import completed_trials, create_manifest, incomplete_trials, manifest_samples, manifest_summary, open_manifest, record_trials
+from cellsolvertools.ensemble_statistics import load_statistics
+from cellsolvertools.simple_sundials_solver_manager import entry_point
+
+# Stands in for siss-batch, trial 3 fails the first time it is solved.
+batch_script = f"""#!{sys.executable}
+import os, struct, sys
+with open(sys.argv[1], 'rb') as f:
+    header = struct.unpack('=8sQQQddddddqiiii', f.read(struct.calcsize('=8sQQQddddddqiiii')))
+failed = 0
+for trial in range(header[1] + 1, header[1] + header[2] + 1):
+    marker = os.path.join(os.path.dirname(sys.argv[1]), 'failed_once')
+    flag = 0
+    if trial == 3 and not os.path.isfile(marker):
+        open(marker, 'w').close()
+        flag = -3
+        failed += 1
+    else:
+        with open(sys.argv[2].replace('%05llu', '%05d') % trial, 'w') as f:
+            f.write('main.t,main.x\\n0,1\\n1,0.5\\n')
+    print(trial, flag)
+sys.exit(1 if failed else 0)
+"""
+
+# Stands in for a single trial solver reading its parameters from the file channel, a negative parameter fails.
+trial_script = f"""#!{sys.executable}
+import os, struct, sys
+with open(os.environ['EXTERNAL_VARIABLES_FILE'], 'rb') as f:
+    k, = struct.unpack('=d', f.read())
+if k < 0.0:
+    sys.exit(1)
+with open(sys.argv[3], 'w') as f:
+    f.write(f'main.t,main.x\\n0,{{k}}\\n')
+"""
+
+
+class CampaignManifestTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    def test_manifest(self):
+        filename = os.path.join(self._directory, 'campaign.sqlite')
+        outputs = [os.path.join(self._directory, f'output_{trial}.csv') for trial in range(1, 5)]
+        samples = np.arange(8.0).reshape(4, 2)
+        manifest = create_manifest(filename, ['a.x', 'b.y'], samples, 7, outputs)
+        with open(outputs[0], 'w') as f:
+            f.write('done')
+        self.assertEqual([2], record_trials(manifest, [(1, 0, outputs[0]), (2, -3, outputs[1])]))
+        self.assertEqual({'pending': 2, 'completed': 1, 'failed': 1}, manifest_summary(manifest))
+        self.assertEqual([1], completed_trials(manifest))
+        manifest.close()
+
+        manifest = open_manifest(filename)
+        parameter_ids, manifest_values = manifest_samples(manifest)
+        self.assertEqual(['a.x', 'b.y'], parameter_ids)
+        np.testing.assert_array_equal(samples, manifest_values)
+        self.assertEqual([2, 3, 4], incomplete_trials(manifest))
+
+        # A completed trial whose output has gone is run again.
+        os.remove(outputs[0])
+        self.assertEqual([1, 2, 3, 4], incomplete_trials(manifest))
+        manifest.close()
+
+    def _config(self, **kwargs):
+        executable = os.path.join(self._directory, 'siss-batch')
+        if not os.path.isfile(executable):
+            with open(executable, 'w') as f:
+                f.write(batch_script)
+            os.chmod(executable, stat.S_IRWXU)
+        config = {'num_trials': 5, 'workers': 2, 'chunk_size': 2, 'report_interval': None,
+                  'application': {'simulation_dir': self._directory, 'executable': executable, 'batch_executable': executable, 'prebuilt': True},
+                  'simulation': {'StartingPoint': 0.0, 'EndingPoint': 1.0, 'PointInterval': 1.0}}
+        config.update(kwargs)
+        return config
+
+    def test_retry_and_resume(self):
+        summary = entry_point(self._config(statistics=True))
+        self.assertEqual([3], summary['failed_trials'])
+        self.assertFalse(os.path.isfile(os.path.join(self._directory, 'output', 'simulation_output_00003.csv')))
+
+        # As if the campaign stopped before its statistics were checkpointed, the completed trials are added again from their outputs.
+        statistics_file = os.path.join(self._directory, 'statistics.npz')
+        os.remove(statistics_file)
+        summary = entry_point(self._config(resume=True, statistics=True))
+        self.assertEqual(1, summary['completed'])
+        self.assertEqual([], summary['failed_trials'])
+        statistics = load_statistics(statistics_file)
+        self.assertEqual(5, statistics['count'])
+        self.assertEqual(list(range(5)), statistics['trials'].tolist())
+        manifest = open_manifest(os.path.join(self._directory, 'campaign.sqlite'))
+        self.assertEqual({'pending': 0, 'completed': 5, 'failed': 0}, manifest_summary(manifest))
+        self.assertEqual([(3, 2)], manifest.execute('SELECT trial, attempts FROM trials WHERE attempts > 1').fetchall())
+        manifest.close()
+
+    def test_retries(self):
+        summary = entry_point(self._config(max_retries=1))
+        self.assertEqual(4, summary['completed'])
+        self.assertEqual([], summary['failed'])
+        self.assertEqual([], summary['failed_trials'])
+        self.assertEqual(5, len(os.listdir(os.path.join(self._directory, 'output'))))
+
+    def test_parameter_file_removed(self):
+        executable = os.path.join(self._directory, 'siss')
+        with open(executable, 'w') as f:
+            f.write(trial_script)
+        os.chmod(executable, stat.S_IRWXU)
+        config = self._config(chunk_size=0, parameter_channel='file', uncertainties={'main.k': {'distribution': 'uniform', 'p1': -1.0, 'p2': 1.0}},
+                              sampling={'seed': 4})
+        config['application']['executable'] = executable
+        summary = entry_point(config)
+        self.assertGreater(len(summary['failed_trials']), 0)
+        output_files = os.listdir(os.path.join(self._directory, 'output'))
+        self.assertEqual(5 - len(summary['failed_trials']), len(output_files))
+        self.assertTrue(all(name.endswith('.csv') for name in output_files))
+
+
+if __name__ == '__main__':
+    unittest.main()
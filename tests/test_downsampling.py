@@ -0,0 +1,43 @@
+import unittest
+
+import numpy as np
+
+from cellsolvertools.downsampling import downsample_indices, lttb_indices, min_max_indices, shared_downsample_indices
+
+
+class DownsamplingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self._x = np.linspace(0.0, 50.0, 5000)
+        self._y = np.sin(self._x)[np.newaxis, :] * np.arange(1.0, 4.0)[:, np.newaxis]
+        # A single point spike that must survive downsampling.
+        self._y[1, 1234] = 100.0
+
+    def test_lttb(self):
+        indices = lttb_indices(self._x, self._y, 200)
+        self.assertEqual((3, 200), indices.shape)
+        self.assertTrue((np.diff(indices, axis=1) > 0).all())
+        self.assertEqual([0, 4999], indices[0, [0, -1]].tolist())
+        self.assertIn(1234, indices[1])
+
+        # Shapes are kept when there are few enough points.
+        self.assertEqual((3, 5000), lttb_indices(self._x, self._y, 6000).shape)
+
+    def test_min_max(self):
+        indices = min_max_indices(self._y, 100)
+        self.assertEqual((3, 200), indices.shape)
+        self.assertTrue((np.diff(indices, axis=1) >= 0).all())
+        self.assertIn(1234, indices[1])
+        for trace, kept in zip(self._y, indices):
+            self.assertEqual(trace.min(), trace[kept].min())
+            self.assertEqual(trace.max(), trace[kept].max())
+
+    def test_shared(self):
+        indices = shared_downsample_indices(self._x, self._y, 100, 'minmax')
+        self.assertLessEqual(len(indices), 200)
+        self.assertIn(1234, indices)
+        self.assertRaises(ValueError, downsample_indices, self._x, self._y, 100, 'decimate')
+
+
+if __name__ == '__main__':
+    unittest.main()
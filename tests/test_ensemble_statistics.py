@@ -0,0 +1,90 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from cellsolvertools.ensemble_statistics import create_statistics, load_statistics, save_statistics, statistics_summary, update_statistics
+from cellsolvertools.simple_sundials_solver_manager import statistics_handler
+
+
+class EnsembleStatisticsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(8)
+        self._trials = rng.normal(loc=np.arange(30.0)[:, np.newaxis], scale=2.0, size=(1000, 30, 2))
+        self._file = tempfile.NamedTemporaryFile(suffix='.npz', delete=False).name
+        os.remove(self._file)
+
+    def tearDown(self):
+        if os.path.exists(self._file):
+            os.remove(self._file)
+
+    def test_statistics(self):
+        statistics = create_statistics(30, 2)
+        for trial in self._trials:
+            update_statistics(statistics, trial)
+
+        summary = statistics_summary(statistics)
+        self.assertEqual(1000, summary['count'])
+        np.testing.assert_allclose(self._trials.mean(axis=0), summary['mean'])
+        np.testing.assert_allclose(self._trials.std(axis=0, ddof=1), summary['std'])
+        np.testing.assert_array_equal(self._trials.min(axis=0), summary['min'])
+        np.testing.assert_array_equal(self._trials.max(axis=0), summary['max'])
+        for p, estimate in summary['quantiles'].items():
+            np.testing.assert_allclose(np.quantile(self._trials, p, axis=0), estimate, atol=0.5)
+
+    def test_few_trials(self):
+        statistics = create_statistics(30, 2)
+        for trial in self._trials[:3]:
+            update_statistics(statistics, trial)
+
+        np.testing.assert_allclose(np.median(self._trials[:3], axis=0), statistics_summary(statistics)['quantiles'][0.5])
+
+    def test_checkpoint(self):
+        statistics = create_statistics(30, 2)
+        for trial in self._trials[:500]:
+            update_statistics(statistics, trial)
+        save_statistics(statistics, self._file)
+        for trial in self._trials[500:]:
+            update_statistics(statistics, trial)
+
+        restored = load_statistics(self._file)
+        for trial in self._trials[500:]:
+            update_statistics(restored, trial)
+
+        for key, value in statistics_summary(statistics).items():
+            if key == 'quantiles':
+                for p in value:
+                    np.testing.assert_array_equal(value[p], statistics_summary(restored)[key][p])
+            else:
+                np.testing.assert_array_equal(value, statistics_summary(restored)[key])
+
+    def test_handler(self):
+        column_info = [{'component': 'environment', 'name': 'time'}, {'component': 'membrane', 'name': 'v'}]
+        handler, checkpoint, included = statistics_handler(self._file, checkpoint_interval=4)
+        for index, trial in enumerate(self._trials[:10]):
+            handler(index, trial, column_info)
+        self.assertEqual(8, load_statistics(self._file)['count'])
+
+        checkpoint()
+        statistics = load_statistics(self._file)
+        self.assertEqual(10, statistics['count'])
+        self.assertEqual(['environment.time', 'membrane.v'], statistics['variable_ids'].tolist())
+        self.assertEqual(list(range(10)), statistics['trials'].tolist())
+        self.assertEqual(set(range(10)), included)
+
+    def test_handler_resume(self):
+        column_info = [{'component': 'environment', 'name': 'time'}, {'component': 'membrane', 'name': 'v'}]
+        # A resumed campaign keeps the trials of the checkpoint and does not add them again.
+        for trials, resume, count in [(range(3), False, 3), (range(2), False, 2), (range(4), True, 4)]:
+            handler, checkpoint, included = statistics_handler(self._file, resume=resume)
+            for index in trials:
+                handler(index, self._trials[index], column_info)
+            checkpoint()
+            self.assertEqual(count, load_statistics(self._file)['count'])
+        self.assertEqual(set(range(4)), included)
+
+
+if __name__ == '__main__':
+    unittest.main()
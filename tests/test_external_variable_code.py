@@ -0,0 +1,66 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from cellsolvertools.generate_code import generate_external_variable_c_code
+from cellsolvertools.simple_sundials_solver_manager import pack_parameter_values
+
+external_variable_info = [
+    {'index': 3, 'name': 'l', 'component_name': 'dimensions'},
+    {'index': 1, 'name': 'r', 'component_name': 'dimensions'},
+]
+
+test_main = """
+#include <stdio.h>
+
+#include "external_variables.h"
+
+int main(void)
+{
+  printf("%.17g %.17g\\n", computeExternalVariable(0.0, NULL, NULL, 3), computeExternalVariable(0.0, NULL, NULL, 1));
+  return 0;
+}
+"""
+
+
+@unittest.skipUnless(shutil.which('cc'), 'requires a C compiler')
+class ExternalVariableCodeTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self._output_dir = tempfile.mkdtemp()
+        generate_external_variable_c_code(external_variable_info, self._output_dir)
+        with open(os.path.join(self._output_dir, 'main.c'), 'w') as f:
+            f.write(test_main)
+        self._executable = os.path.join(self._output_dir, 'external_variables_test')
+        subprocess.run(['cc', '-std=c99', 'main.c', 'external_variables.c', '-o', self._executable], cwd=self._output_dir, check=True)
+        self._values = {'dimensions__l': 0.1, 'dimensions__r': 2.0 / 3.0}
+
+    def tearDown(self):
+        shutil.rmtree(self._output_dir)
+
+    def _run(self, env, parameter_input=None):
+        result = subprocess.run([self._executable], env={**os.environ, **env}, input=parameter_input, capture_output=True, check=True)
+        return [float(v) for v in result.stdout.split()]
+
+    def test_environment(self):
+        env = {name: value.hex() for name, value in self._values.items()}
+        self.assertEqual(list(self._values.values()), self._run(env))
+
+    def test_parameter_file(self):
+        parameter_file = os.path.join(self._output_dir, 'parameters')
+        with open(parameter_file, 'wb') as f:
+            f.write(pack_parameter_values(self._values))
+        self.assertEqual(list(self._values.values()), self._run({'EXTERNAL_VARIABLES_FILE': parameter_file}))
+
+    def test_stdin(self):
+        self.assertEqual(list(self._values.values()), self._run({'EXTERNAL_VARIABLES_FILE': '-'}, pack_parameter_values(self._values)))
+
+    def test_missing_values(self):
+        result = subprocess.run([self._executable], env={'PATH': os.environ.get('PATH', '')}, capture_output=True)
+        self.assertNotEqual(0, result.returncode)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from cellsolvertools.generate_code import ModelAnalysisError, analyse_model, analysed_model_metadata, generate_c_code, generated_python_code
+from cellsolvertools.utilities import import_code
+
+# dx/dt = -k x, y = c x.
+decay_model_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resources', 'scaled_decay.cellml')
+
+
+class GenerateCodeTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+        self._model = decay_model_file
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    def test_metadata(self):
+        analysis = analyse_model(self._model)
+        m = import_code(generated_python_code(analysis), 'generated_model_python_code')
+        metadata = analysed_model_metadata(analysis)
+
+        def as_names(info):
+            return {**info, 'type': info['type'].name}
+
+        self.assertEqual(as_names(m.VOI_INFO), metadata['voi_info'])
+        self.assertEqual([as_names(s) for s in m.STATE_INFO], metadata['state_info'])
+        self.assertEqual([as_names(v) for v in m.VARIABLE_INFO], metadata['variable_info'])
+
+    def test_external_variables(self):
+        analysis = analyse_model(self._model, ['main.c', 'main.k'])
+        self.assertEqual(['c', 'k'], [info['name'] for info in analysis['external_variable_info']])
+        for info in analysis['external_variable_info']:
+            self.assertEqual(info['index'], analysis['variable_index'][('main', info['name'])].index())
+        self.assertEqual({('main', 'x'), ('main', 'k'), ('main', 'c'), ('main', 'y')}, set(analysis['variable_index']))
+
+        self.assertRaises(ModelAnalysisError, analyse_model, self._model, ['main.b'])
+        self.assertRaises(ModelAnalysisError, analyse_model, self._model, ['other.k'])
+
+    def test_c_code(self):
+        generate_c_code(self._model, self._directory, {'external_variables': {'main.k': {}}})
+        for filename in ['decay.h', 'decay.c', 'external_variables.h', 'external_variables.c', 'batch_solver.c', 'model_files.cmake']:
+            self.assertTrue(os.path.isfile(os.path.join(self._directory, filename)), filename)
+
+
+if __name__ == '__main__':
+    unittest.main()
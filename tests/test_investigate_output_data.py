@@ -0,0 +1,75 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from cellsolvertools.binary_output import trial_output_file_name, write_output
+from cellsolvertools.investigate_output_data import extract_result_for_config, load_trials, trial_output_files
+from cellsolvertools.result_cube import create_result_cube
+
+column_info = [{'component': 'environment', 'name': 'time'}, {'component': 'membrane', 'name': 'v'}, {'component': 'membrane', 'name': 'i'}]
+
+membrane_model_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resources', 'membrane.cellml')
+
+
+class LoadTrialsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+        self._time = np.arange(10.0)
+        for trial in range(6):
+            data = np.column_stack([self._time, self._time + trial, self._time * trial])
+            binary = trial % 2 == 0
+            filename = trial_output_file_name(self._directory, trial + 1, binary)
+            if binary:
+                write_output(filename, data, column_info)
+            else:
+                np.savetxt(filename, data, delimiter=',', header='environment.time,membrane.v,membrane.i', comments='')
+        # Not a trial output, e.g. the parameters written by the file parameter channel.
+        with open(os.path.join(self._directory, 'simulation_output_00001.csv.parameters'), 'wb') as f:
+            f.write(b'\0' * 8)
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    def test_load(self):
+        filenames = trial_output_files(self._directory)
+        self.assertEqual(6, len(filenames))
+
+        columns = [0, 2, 1]
+        data = load_trials(filenames, columns, workers=3)
+        self.assertEqual((6, 10, 3), data.shape)
+        for trial in range(6):
+            np.testing.assert_array_equal(np.column_stack([self._time, self._time * trial, self._time + trial]), data[trial])
+        self.assertEqual([0, 2, 1], columns)
+
+    def test_dtype(self):
+        data = load_trials(trial_output_files(self._directory), [1], dtype=np.float32, processes=True, workers=2)
+        self.assertEqual(np.float32, data.dtype)
+        np.testing.assert_array_equal(self._time + 5, data[5, :, 0])
+
+    def test_extract(self):
+        config = [{'id': 'membrane.i'}, {'id': 'membrane.v'}]
+
+        time, series = extract_result_for_config(membrane_model_file, config, self._directory, workers=2)
+        np.testing.assert_array_equal(self._time, time)
+        self.assertEqual(['membrane.i', 'membrane.v'], list(series))
+        np.testing.assert_array_equal(np.outer(np.arange(6), self._time), series['membrane.i'])
+        # Every variable is a view of the one array the trials were loaded into.
+        self.assertIsNotNone(series['membrane.i'].base)
+        self.assertIs(series['membrane.i'].base, series['membrane.v'].base)
+        self.assertRaises(ValueError, extract_result_for_config, membrane_model_file, [{'id': 'membrane.w'}], self._directory)
+
+        cube_directory = os.path.join(self._directory, 'results')
+        cube = create_result_cube(cube_directory, 2, 10, column_info)
+        cube['data'][:] = 1.0
+        time, series = extract_result_for_config(membrane_model_file, config, cube_directory)
+        self.assertEqual((2, 10), series['membrane.v'].shape)
+        # Views of the memory-mapped cube.
+        self.assertIsInstance(series['membrane.v'], np.memmap)
+
+
+if __name__ == '__main__':
+    unittest.main()
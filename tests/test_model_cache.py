@@ -0,0 +1,72 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from cellsolvertools import model_cache
+from cellsolvertools.generate_code import ModelGenerationError
+from cellsolvertools.model_cache import cached_python_code, clear_memo, model_metadata
+from cellsolvertools.utilities import get_parameters_from_model
+
+# dx/dt = -k x, y = 2 x.
+decay_model_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resources', 'decay.cellml')
+
+
+class ModelCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+        self._cache_dir = os.path.join(self._directory, 'cache')
+        clear_memo()
+
+    def tearDown(self):
+        clear_memo()
+        shutil.rmtree(self._directory)
+
+    def _model(self, name='decay.cellml', k=0.5):
+        with open(decay_model_file) as f:
+            model = f.read()
+        filename = os.path.join(self._directory, name)
+        with open(filename, 'w') as f:
+            f.write(model.replace('name="k" units="dimensionless" initial_value="0.5"', f'name="k" units="dimensionless" initial_value="{k}"'))
+        return filename
+
+    def test_metadata(self):
+        metadata = model_metadata(self._model(), self._cache_dir)
+        self.assertEqual({'name': 't', 'units': 'dimensionless', 'component': 'main', 'type': 'VARIABLE_OF_INTEGRATION'}, metadata['voi_info'])
+        self.assertEqual([('x', 'STATE')], [(s['name'], s['type']) for s in metadata['state_info']])
+        self.assertEqual([('k', 'CONSTANT'), ('y', 'ALGEBRAIC')], [(v['name'], v['type']) for v in metadata['variable_info']])
+        self.assertIn('STATE_INFO', cached_python_code(self._model(), self._cache_dir))
+
+    def test_cache_hits(self):
+        model_file = self._model()
+        metadata = model_metadata(model_file, self._cache_dir)
+        with mock.patch.object(model_cache, 'analyse_model', side_effect=AssertionError('model analysed again')):
+            self.assertIs(metadata, model_metadata(model_file, self._cache_dir))
+            clear_memo()
+            self.assertEqual(metadata, model_metadata(model_file, self._cache_dir))
+            # The same model under another name is the same entry.
+            self.assertEqual(metadata, model_metadata(self._model('copy.cellml'), self._cache_dir))
+
+    def test_eviction(self):
+        for k in range(4):
+            model_metadata(self._model(f'decay_{k}.cellml', k), self._cache_dir, max_entries=2)
+
+        self.assertEqual(4, len(os.listdir(self._cache_dir)))
+        self.assertEqual({model_cache.model_cache_key(self._model(f'decay_{k}.cellml', k)) for k in [2, 3]},
+                         {os.path.splitext(f)[0] for f in os.listdir(self._cache_dir)})
+
+    def test_invalid_model(self):
+        model_file = os.path.join(self._directory, 'invalid.cellml')
+        with open(model_file, 'w') as f:
+            f.write('<model/>')
+        self.assertRaises(ModelGenerationError, model_metadata, model_file, self._cache_dir)
+
+    def test_parameters_from_model(self):
+        with mock.patch.dict(os.environ, {'CELLSOLVERTOOLS_CACHE_DIR': self._cache_dir}):
+            self.assertEqual({'main': {'x': 'STATE', 'k': 'CONSTANT', 'y': 'ALGEBRAIC'}}, get_parameters_from_model(self._model()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from cellsolvertools.binary_output import trial_output_file_name, write_output
+from cellsolvertools.multi_trial_plot import _load_data_file, load_selected_series
+
+column_info = [{'component': 'environment', 'name': 'time'}, {'component': 'membrane', 'name': 'v'},
+               {'component': 'membrane', 'name': 'i'}, {'component': 'membrane', 'name': 'g'}]
+
+
+class LoadSelectedSeriesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+        self._time = np.arange(8.0)
+        # Binary, csv and Cell Solver pickle data files in turn, series j of trial t being t + j * time.
+        self._data_files = []
+        for trial in range(9):
+            data = np.column_stack([self._time] + [trial + j * self._time for j in range(1, 4)])
+            if trial % 3 == 0:
+                filename = trial_output_file_name(self._directory, trial + 1, True)
+                write_output(filename, data, column_info)
+            elif trial % 3 == 1:
+                filename = trial_output_file_name(self._directory, trial + 1, False)
+                np.savetxt(filename, data, delimiter=',', header='environment.time,membrane.v,membrane.i,membrane.g', comments='')
+            else:
+                filename = os.path.join(self._directory, f'simulation_output_{trial + 1:05d}.pickle')
+                with open(filename, 'wb') as f:
+                    pickle.dump({'x': data[:, 0], 'x_info': column_info[0], 'y_n': list(data[:, 1:].T), 'y_n_info': column_info[1:],
+                                 'title': 'membrane'}, f)
+            self._data_files.append(filename)
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    def _expected(self, trial, index):
+        return trial + (index + 1) * self._time
+
+    def test_selected_series(self):
+        indices = [2, 0]
+        for workers in [1, 3]:
+            selected = load_selected_series(self._data_files, indices, workers)
+
+            # Only the selected series, in the order asked for, file after file whichever worker loaded them.
+            self.assertEqual(len(self._data_files) * len(indices), len(selected))
+            for position, series in enumerate(selected):
+                trial, index = divmod(position, len(indices))
+                np.testing.assert_array_equal(self._expected(trial, indices[index]), series)
+
+    def test_data_files(self):
+        for trial, data_file in enumerate(self._data_files[:3]):
+            data = _load_data_file(data_file)
+            np.testing.assert_array_equal(self._time, data['x'])
+            self.assertEqual(['v', 'i', 'g'], [info['name'] for info in data['y_n_info']])
+            np.testing.assert_array_equal(self._expected(trial, 1), data['y_n'][1])
+
+        self.assertEqual([], load_selected_series([], [0], 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+from cellsolvertools.generate_code import analyse_model
+from cellsolvertools.omex_archive import OmexArchiveError, ingest_omex_archive
+from cellsolvertools.utilities import is_cellml_file, is_omex_file
+
+decay_model = """<?xml version="1.0" encoding="UTF-8"?>
+<model xmlns="http://www.cellml.org/cellml/2.0#" name="decay">
+  <component name="decay">
+    <variable name="t" units="dimensionless"/>
+    <variable name="x" units="dimensionless" initial_value="1"/>
+    <math xmlns="http://www.w3.org/1998/Math/MathML">
+      <apply><eq/><apply><diff/><bvar><ci>t</ci></bvar><ci>x</ci></apply><apply><minus/><ci>x</ci></apply></apply>
+    </math>
+  </component>
+</model>
+"""
+
+# A model the master model could import.
+library_model = decay_model.replace('name="decay">', 'name="library">', 1)
+
+sedml = """<?xml version="1.0" encoding="UTF-8"?>
+<sedML xmlns="http://sed-ml.org/sed-ml/level1/version3" level="1" version="3">
+  <listOfSimulations>
+    <uniformTimeCourse id="simulation" initialTime="0" outputStartTime="0" outputEndTime="50" numberOfSteps="100"/>
+  </listOfSimulations>
+</sedML>
+"""
+
+manifest = """<?xml version="1.0" encoding="UTF-8"?>
+<omexManifest xmlns="http://identifiers.org/combine.specifications/omex-manifest">
+  <content location="." format="http://identifiers.org/combine.specifications/omex"/>
+  <content location="./manifest.xml" format="http://identifiers.org/combine.specifications/omex-manifest"/>
+  <content location="./models/decay.cellml" format="http://identifiers.org/combine.specifications/cellml"/>
+  <content location="./main.cellml" format="https://identifiers.org/combine.specifications/cellml.2.0" master="true"/>
+  <content location="./simulation.sedml" format="http://identifiers.org/combine.specifications/sed-ml"/>
+  <content location="./config.json" format="http://purl.org/NET/mediatypes/application/json"/>
+  <content location="./data.csv" format="http://purl.org/NET/mediatypes/text/csv"/>
+</omexManifest>
+"""
+
+config = {'num_trials': 5, 'uncertainties': {'decay.x': {'distribution': 'uniform', 'p1': 0.5, 'p2': 1.5}}}
+
+
+class OmexArchiveTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+        self._cache_dir = os.path.join(self._directory, 'cache')
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    def _archive(self, name, contents):
+        filename = os.path.join(self._directory, name)
+        with zipfile.ZipFile(filename, 'w') as omex_zip:
+            for location, data in contents.items():
+                omex_zip.writestr(location, data)
+        return filename
+
+    def _complete_archive(self, name='model.omex'):
+        return self._archive(name, {'manifest.xml': manifest, 'main.cellml': decay_model, 'models/decay.cellml': library_model,
+                                    'simulation.sedml': sedml, 'config.json': json.dumps(config), 'data.csv': 'x\n1\n'})
+
+    def test_ingest(self):
+        filename = self._complete_archive()
+        archive = ingest_omex_archive(filename, self._cache_dir)
+
+        self.assertEqual(os.path.join(archive['directory'], 'main.cellml'), archive['model_file'])
+        self.assertEqual(config, archive['config'])
+        self.assertEqual({'StartingPoint': 0.0, 'EndingPoint': 50.0, 'PointInterval': 0.5}, archive['simulation'])
+        self.assertEqual(['models/decay.cellml', 'main.cellml', 'simulation.sedml', 'config.json', 'data.csv'],
+                         [entry['location'] for entry in archive['manifest']])
+        # Only the CellML files are extracted.
+        self.assertFalse(os.path.exists(os.path.join(archive['directory'], 'data.csv')))
+        self.assertEqual('decay', analyse_model(archive['model_file'])['name'])
+        self.assertEqual('library', analyse_model(os.path.join(archive['directory'], 'models', 'decay.cellml'))['name'])
+
+        # Ingesting the archive again, even under another name, reads the cache.
+        os.remove(os.path.join(archive['directory'], 'models', 'decay.cellml'))
+        again = ingest_omex_archive(shutil.copy(filename, os.path.join(self._directory, 'copy.omex')), self._cache_dir)
+        self.assertEqual(archive, again)
+        self.assertFalse(os.path.exists(os.path.join(archive['directory'], 'models', 'decay.cellml')))
+        self.assertEqual([archive['hash']], os.listdir(self._cache_dir))
+
+    def test_eviction(self):
+        for num_trials in range(1, 4):
+            contents = {'manifest.xml': manifest, 'main.cellml': decay_model, 'models/decay.cellml': library_model, 'simulation.sedml': sedml,
+                        'config.json': json.dumps({**config, 'num_trials': num_trials}), 'data.csv': ''}
+            ingest_omex_archive(self._archive(f'{num_trials}.omex', contents), self._cache_dir, max_entries=2)
+
+        self.assertEqual(2, len(os.listdir(self._cache_dir)))
+
+    def test_invalid_archives(self):
+        no_model = self._archive('no_model.omex', {'manifest.xml': manifest.replace('cellml', 'sbml'), 'main.sbml': ''})
+        self.assertRaises(OmexArchiveError, ingest_omex_archive, no_model, self._cache_dir)
+        escaping = self._archive('escaping.omex', {'manifest.xml': manifest.replace('./models/decay.cellml', '../decay.cellml')})
+        self.assertRaises(OmexArchiveError, ingest_omex_archive, escaping, self._cache_dir)
+        missing = self._archive('missing.omex', {'manifest.xml': manifest, 'main.cellml': decay_model})
+        self.assertRaises(OmexArchiveError, ingest_omex_archive, missing, self._cache_dir)
+        self.assertEqual([], os.listdir(self._cache_dir))
+
+    def test_sniffing(self):
+        omex = self._complete_archive()
+        not_omex = self._archive('plain.zip', {'main.cellml': decay_model})
+        cellml = os.path.join(self._directory, 'main.cellml')
+        # Parsing stops at the root element, what follows it is never read.
+        with open(cellml, 'w') as f:
+            f.write(decay_model.replace('</model>', '<unclosed>' + 'x' * 100000))
+        sbml = os.path.join(self._directory, 'model.sbml')
+        with open(sbml, 'w') as f:
+            f.write('<sbml xmlns="http://www.sbml.org/sbml/level3/version2/core"/>')
+
+        self.assertTrue(is_omex_file(omex))
+        self.assertFalse(is_omex_file(not_omex))
+        self.assertFalse(is_omex_file(cellml))
+        self.assertFalse(is_omex_file(self._directory))
+        self.assertFalse(is_omex_file(os.path.join(self._directory, 'missing.omex')))
+
+        self.assertTrue(is_cellml_file(cellml))
+        self.assertFalse(is_cellml_file(sbml))
+        self.assertFalse(is_cellml_file(omex))
+        self.assertFalse(is_cellml_file(self._directory))
+        self.assertFalse(is_cellml_file(os.path.join(self._directory, 'missing.cellml')))
+        with zipfile.ZipFile(omex) as omex_zip, omex_zip.open('models/decay.cellml') as f:
+            self.assertTrue(is_cellml_file(f))
+
+
+if __name__ == '__main__':
+    unittest.main()
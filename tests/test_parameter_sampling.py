@@ -0,0 +1,67 @@
+import unittest
+
+import numpy as np
+
+from cellsolvertools.sample_parameter_uncertainties import SamplingError, sample_parameter_uncertainties
+
+parameter_normal = {
+    "dimensions.l": {"distribution": "normal", "p1": 6, "p2": 0.5},
+    "dimensions.r": {"distribution": "normal", "p1": 2, "p2": 3}
+}
+
+parameter_mixed = {
+    "dimensions.l": {"distribution": "uniform", "p1": 1, "p2": 3},
+    "dimensions.r": {"distribution": "normal", "p1": 2, "p2": 3, "p3": 0, "p4": 4}
+}
+
+
+class NumPySamplingTestCase(unittest.TestCase):
+
+    def test_normal(self):
+        names, samples = sample_parameter_uncertainties(parameter_normal, 10000, seed=1)
+
+        self.assertEqual(['dimensions__l', 'dimensions__r'], names)
+        self.assertEqual((10000, 2), samples.shape)
+        self.assertAlmostEqual(6, np.mean(samples[:, 0]), 1)
+        self.assertAlmostEqual(0.5, np.std(samples[:, 0]), 1)
+        self.assertAlmostEqual(2, np.mean(samples[:, 1]), 1)
+        self.assertAlmostEqual(3, np.std(samples[:, 1]), 1)
+
+    def test_trial_streams(self):
+        _, samples = sample_parameter_uncertainties(parameter_mixed, 3000, seed=7)
+        _, later_samples = sample_parameter_uncertainties(parameter_mixed, 10, seed=7, start=2040)
+
+        np.testing.assert_array_equal(samples[2040:2050], later_samples)
+
+    def test_truncation(self):
+        for method in ['random', 'lhs']:
+            _, samples = sample_parameter_uncertainties(parameter_mixed, 5000, method=method, seed=3)
+
+            self.assertTrue(np.all(samples[:, 1] >= 0))
+            self.assertTrue(np.all(samples[:, 1] <= 4))
+            self.assertTrue(np.all(samples[:, 0] >= 1))
+            self.assertTrue(np.all(samples[:, 0] <= 3))
+
+    def test_latin_hypercube(self):
+        _, samples = sample_parameter_uncertainties({"a.b": {"distribution": "uniform", "p1": 0, "p2": 1}}, 100, method='lhs', seed=2)
+
+        np.testing.assert_array_equal(np.arange(100), np.sort(np.floor(samples[:, 0] * 100)))
+
+    def test_correlation(self):
+        _, samples = sample_parameter_uncertainties(parameter_normal, 20000, seed=5, correlation=[[1.0, 0.8], [0.8, 1.0]])
+
+        self.assertAlmostEqual(0.8, np.corrcoef(samples.T)[0, 1], 1)
+        self.assertAlmostEqual(6, np.mean(samples[:, 0]), 1)
+        self.assertAlmostEqual(3, np.std(samples[:, 1]), 1)
+
+    def test_unsupported(self):
+        self.assertRaises(SamplingError, sample_parameter_uncertainties, {"a.b": {"distribution": "zipf", "p1": 2}}, 10)
+        self.assertRaises(SamplingError, sample_parameter_uncertainties, {"a.b": {"distribution": "gamma", "p1": 2, "p2": 1}}, 10, method='lhs')
+        self.assertRaises(SamplingError, sample_parameter_uncertainties, parameter_normal, 10, correlation=[[1.0, 2.0], [2.0, 1.0]])
+        # Truncations holding next to none of the distribution.
+        self.assertRaises(SamplingError, sample_parameter_uncertainties, {"a.b": {"distribution": "bernoulli", "p1": 0.5, "p2": 0.4, "p3": 0.6}}, 10)
+        self.assertRaises(SamplingError, sample_parameter_uncertainties, {"a.b": {"distribution": "gamma", "p1": 2, "p2": 1, "p3": 50, "p4": 51}}, 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from cellsolvertools.binary_output import trial_output_file_name, write_output
+from cellsolvertools.investigate_output_data import result_cube_views
+from cellsolvertools.result_cube import ResultCubeError, consolidate_trial, open_result_cube, read_trial_output, variable_view
+from cellsolvertools.simple_sundials_solver_manager import output_file_callback, result_cube_handler
+
+column_info = [
+    {'component': 'environment', 'name': 'time', 'units': 'ms', 'type': 'VARIABLE_OF_INTEGRATION'},
+    {'component': 'membrane', 'name': 'v', 'units': 'mV', 'type': 'STATE'},
+]
+
+
+class ResultCubeTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+        self._cube_directory = os.path.join(self._directory, 'results')
+        self._time = np.arange(20.0)
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    def _write_trial(self, trial, binary=True):
+        filename = trial_output_file_name(self._directory, trial + 1, binary)
+        data = np.column_stack([self._time, self._time * trial])
+        if binary:
+            write_output(filename, data, column_info)
+        else:
+            np.savetxt(filename, data, delimiter=',', header='environment.time,membrane.v', comments='')
+        return filename
+
+    def test_consolidate(self):
+        cube = None
+        for trial in [2, 0]:
+            cube = consolidate_trial(self._cube_directory, 4, trial, *read_trial_output(self._write_trial(trial, trial == 0)), cube=cube)
+
+        cube = open_result_cube(self._cube_directory)
+        self.assertEqual((4, 20, 2), cube['data'].shape)
+        self.assertEqual([True, False, True, False], cube['completed'].tolist())
+        v = variable_view(cube, 'membrane.v')
+        np.testing.assert_array_equal(self._time * 2, v[2])
+        self.assertTrue(np.isnan(v[1]).all())
+        self.assertTrue(np.shares_memory(v, cube['data']))
+        self.assertRaises(ResultCubeError, variable_view, cube, 'membrane.w')
+
+    def test_views(self):
+        for trial in range(3):
+            consolidate_trial(self._cube_directory, 3, trial, *read_trial_output(self._write_trial(trial)))
+
+        time, views = result_cube_views(self._cube_directory, ['membrane.v'], 1, 3)
+        np.testing.assert_array_equal(self._time, time)
+        np.testing.assert_array_equal(np.outer([1, 2], self._time), views['membrane.v'])
+
+    def test_callback(self):
+        on_complete = output_file_callback([result_cube_handler(self._cube_directory, 3)])
+        # The second trial of the block failed and has no output.
+        outputs = [self._write_trial(0), trial_output_file_name(self._directory, 2, True), self._write_trial(2)]
+        on_complete({'index': 1, 'returncode': 0, 'trial': {'first_trial': 0, 'outputs': outputs}})
+
+        self.assertEqual([True, False, True], open_result_cube(self._cube_directory)['completed'].tolist())
+
+    def test_new_campaign(self):
+        for trial in range(3):
+            consolidate_trial(self._cube_directory, 3, trial, *read_trial_output(self._write_trial(trial)))
+        # A cube of another campaign is not appended to.
+        self.assertRaises(ResultCubeError, consolidate_trial, self._cube_directory, 5, 4, *read_trial_output(self._write_trial(4)))
+
+        # A new campaign of the same size starts from an empty cube, a resumed one keeps the trials it has.
+        result_cube_handler(self._cube_directory, 3)(1, *read_trial_output(self._write_trial(1)))
+        self.assertEqual([False, True, False], open_result_cube(self._cube_directory)['completed'].tolist())
+        result_cube_handler(self._cube_directory, 3, resume=True)(2, *read_trial_output(self._write_trial(2)))
+        self.assertEqual([False, True, True], open_result_cube(self._cube_directory)['completed'].tolist())
+        handler = result_cube_handler(self._cube_directory, 5, resume=True)
+        self.assertRaises(ResultCubeError, handler, 4, *read_trial_output(self._write_trial(4)))
+
+
+if __name__ == '__main__':
+    unittest.main()
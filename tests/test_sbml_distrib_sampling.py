@@ -1,9 +1,11 @@
 # import matplotlib.pyplot as graph
 import unittest
+
+import roadrunner
 from statistics import mean, stdev
 
 from cellsolvertools.define_parameter_uncertainties import create_model_from_config
-from cellsolvertools.evaluate_sbml_model_initial_values import evaluate_parameter_initial_values, load_model
+from cellsolvertools.evaluate_sbml_model_initial_values import evaluate_parameter_initial_values, load_model, evaluate_model_samples
 
 parameter_normal = {
     "dimensions.l": {"distribution": "normal", "p1": 6, "p2": 0.5},
@@ -34,6 +36,22 @@ class SamplingTestCase(unittest.TestCase):
         # graph.hist(param_2, 50)
         # graph.show()
 
+    def test_normal_batch(self):
+        random_seed = roadrunner.Config.getValue(roadrunner.Config.RANDOM_SEED)
+        roadrunner.Config.setValue(roadrunner.Config.RANDOM_SEED, 2)
+        try:
+            xml = create_model_from_config(parameter_normal)
+            parameter_ids, samples = evaluate_model_samples(xml, 10000)
+
+            self.assertEqual(['dimensions__l', 'dimensions__r'], parameter_ids)
+            self.assertEqual((10000, 2), samples.shape)
+            self.assertAlmostEqual(6, mean(samples[:, 0]), 1)
+            self.assertAlmostEqual(0.5, stdev(samples[:, 0]), 1)
+            self.assertAlmostEqual(2, mean(samples[:, 1]), 1)
+            self.assertAlmostEqual(3, stdev(samples[:, 1]), 1)
+        finally:
+            roadrunner.Config.setValue(roadrunner.Config.RANDOM_SEED, random_seed)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,113 @@
+import math
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from cellsolvertools.result_cube import append_trial, create_result_cube
+from cellsolvertools.sample_parameter_uncertainties import _block_generator
+from cellsolvertools.sensitivity_analysis import SENSITIVITY_FILE, WEIGHT_BLOCK_SIZE, _poisson_weights, load_sensitivity, saltelli_samples, sobol_indices
+from cellsolvertools.simple_sundials_solver_manager import SimulationConfigurationError, entry_point
+
+# dx/dt = -k x, y = c x.
+decay_model_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resources', 'scaled_decay.cellml')
+
+uniform = {'distribution': 'uniform', 'p1': -math.pi, 'p2': math.pi}
+
+# The Ishigami function's indices (a = 7, b = 0.1), in parameter order.
+ishigami_first_order = [0.3139, 0.4424, 0.0]
+ishigami_total_order = [0.5576, 0.4424, 0.2437]
+
+column_info = [{'component': 'main', 'name': name, 'units': 'dimensionless'} for name in ['t', 'ishigami', 'blend', 'constant']]
+
+
+def _outputs(x):
+    # Over three time points: the Ishigami function, a blend moving from the first parameter to the second and a constant.
+    time = np.array([0.0, 0.5, 1.0])
+    ishigami = np.sin(x[0]) + 7.0 * np.sin(x[1]) ** 2 + 0.1 * x[2] ** 4 * np.sin(x[0])
+    return np.column_stack([time, np.full(3, ishigami), (1.0 - time) * x[0] + time * x[1], np.ones(3)])
+
+
+class SensitivityAnalysisTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    def test_design(self):
+        names, samples = saltelli_samples({'main.a': uniform, 'main.b': uniform, 'main.c': uniform}, 10, seed=3)
+        self.assertEqual(['main__a', 'main__b', 'main__c'], names)
+        self.assertEqual((50, 3), samples.shape)
+        a, b, ab = samples[:10], samples[10:20], samples[20:].reshape(3, 10, 3)
+        self.assertFalse(np.any(a == b))
+        for i in range(3):
+            expected = a.copy()
+            expected[:, i] = b[:, i]
+            np.testing.assert_array_equal(expected, ab[i])
+        np.testing.assert_array_equal(samples, saltelli_samples({'main.a': uniform, 'main.b': uniform, 'main.c': uniform}, 10, seed=3)[1])
+
+    def test_indices(self):
+        base_samples = 4096
+        _, samples = saltelli_samples({'main.a': uniform, 'main.b': uniform, 'main.c': uniform}, base_samples, seed=7)
+        cube = create_result_cube(os.path.join(self._directory, 'results'), len(samples), 3, column_info)
+        for trial, x in enumerate(samples):
+            append_trial(cube, trial, _outputs(x))
+
+        indices = sobol_indices(cube, base_samples, 3, bootstrap=50, seed=1)
+        self.assertEqual(base_samples, indices['count'])
+        self.assertEqual(['main.ishigami', 'main.blend', 'main.constant'], list(indices['variable_ids']))
+        self.assertEqual((3, 3, 3), indices['first_order'].shape)
+        self.assertEqual((2, 3, 3, 3), indices['first_order_interval'].shape)
+        np.testing.assert_allclose(ishigami_first_order, indices['first_order'][:, 1, 0], atol=0.05)
+        np.testing.assert_allclose(ishigami_total_order, indices['total_order'][:, 1, 0], atol=0.05)
+        low, high = indices['total_order_interval'][:, :, 1, 0]
+        self.assertTrue(np.all((low <= ishigami_total_order) & (ishigami_total_order <= high)))
+        np.testing.assert_allclose([[1.0, 0.5, 0.0], [0.0, 0.5, 1.0], [0.0, 0.0, 0.0]], indices['first_order'][:, :, 1], atol=0.05)
+        self.assertTrue(np.all(np.isnan(indices['first_order'][:, :, 2])))
+
+        # Reading the cube a few base samples at a time gives the same indices.
+        chunked = sobol_indices(cube, base_samples, 3, ['main.ishigami'], reduction='final', bootstrap=50, seed=1, block_bytes=1000)
+        np.testing.assert_allclose(indices['first_order'][:, -1:, :1], chunked['first_order'])
+        np.testing.assert_allclose(indices['total_order'][:, -1:, :1], chunked['total_order'])
+        np.testing.assert_allclose(indices['first_order_interval'][..., -1:, :1], chunked['first_order_interval'])
+
+        # A base sample whose trials did not all complete is left out.
+        cube['completed'][2 * base_samples + 5] = False
+        self.assertEqual(base_samples - 1, sobol_indices(cube, base_samples, 3, bootstrap=0)['count'])
+
+    def test_bootstrap_weights(self):
+        weights = _poisson_weights(5, 2, 0, WEIGHT_BLOCK_SIZE)
+        np.testing.assert_array_equal(weights[:, 100:300], _poisson_weights(5, 2, 100, 300))
+        # The weights are not drawn from the stream the design's uniforms come from.
+        design = _block_generator(5, 0).poisson(1.0, (2, WEIGHT_BLOCK_SIZE))
+        self.assertFalse(np.array_equal(design, weights))
+
+    def test_campaign(self):
+        simulation_dir = os.path.join(self._directory, 'simulation')
+        config = {'workers': 1, 'report_interval': None, 'solver_backend': 'numpy', 'model_file': decay_model_file,
+                  'uncertainties': {'main.k': {'distribution': 'uniform', 'p1': 0.5, 'p2': 1.5}, 'main.c': {'distribution': 'uniform', 'p1': 0.9, 'p2': 1.1}},
+                  'sensitivity': {'base_samples': 256, 'outputs': ['main.y'], 'reduction': 'final', 'bootstrap': 20},
+                  'sampling': {'seed': 2},
+                  'application': {'simulation_dir': simulation_dir},
+                  'simulation': {'StartingPoint': 0.0, 'EndingPoint': 2.0, 'PointInterval': 0.5}}
+        self.assertRaises(SimulationConfigurationError, entry_point, {**config, 'consolidate': False})
+        self.assertRaises(SimulationConfigurationError, entry_point, {**config, 'sampling': {'correlation': [[1.0, 0.5], [0.5, 1.0]]}})
+
+        summary = entry_point(config)
+        self.assertEqual(1024, config['num_trials'])
+        self.assertEqual(1024, summary['completed'])
+        indices = load_sensitivity(os.path.join(simulation_dir, SENSITIVITY_FILE))
+        self.assertEqual(['main__k', 'main__c'], list(indices['parameter_names']))
+        self.assertEqual(256, indices['count'])
+        np.testing.assert_array_equal(summary['sensitivity']['total_order'], indices['total_order'])
+        # y = c exp(-2 k), the decay rate varies far more than the scale.
+        self.assertGreater(indices['total_order'][0, 0, 0], 0.8)
+        self.assertLess(indices['total_order'][1, 0, 0], 0.2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import math
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+import numpy as np
+
+from cellsolvertools.batch_file import solver_settings
+from cellsolvertools.campaign_manifest import manifest_summary, open_manifest
+from cellsolvertools.generate_code import analyse_model, write_c_code
+from cellsolvertools.result_cube import open_result_cube, variable_view
+from cellsolvertools.shared_library_solver import create_solver, delete_solver, load_solver_library, open_solver_pool, output_point_count, solve_trials
+from cellsolvertools.simple_sundials_solver_manager import entry_point
+
+# dx/dt = -k x, y = 2 x.
+decay_model_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resources', 'decay.cellml')
+
+# Stands in for the CVODE batch solver, every column of a trial's output is k t, trials with a negative k fail and k = 0 ends the process.
+stand_in_solver_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resources', 'stand_in_solver.c')
+
+simulation_config = {'StartingPoint': 0.0, 'EndingPoint': 2.0, 'PointInterval': 0.5}
+
+
+@unittest.skipUnless(shutil.which('cc'), 'requires a C compiler')
+class SharedLibrarySolverTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+        write_c_code(analyse_model(decay_model_file, ['main.k']), self._directory)
+        shutil.copy(stand_in_solver_file, self._directory)
+        self._library_file = os.path.join(self._directory, 'libsiss-solver.so')
+        subprocess.run(['cc', '-std=c99', '-shared', '-fPIC', '-fvisibility=hidden', '-DEXTERNAL_VARIABLES', 'solver_library.c', 'stand_in_solver.c',
+                        'decay.c', 'external_variables.c', '-lm', '-o', self._library_file], cwd=self._directory, check=True)
+        self._settings = solver_settings({}, simulation_config)
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    def test_library(self):
+        library = load_solver_library(self._library_file)
+        self.assertEqual('decay', library['model'])
+        self.assertEqual(1, library['parameter_count'])
+        self.assertEqual([('t', 'VARIABLE_OF_INTEGRATION'), ('x', 'STATE'), ('k', 'EXTERNAL'), ('y', 'ALGEBRAIC')],
+                         [(info['name'], info['type']) for info in library['column_info']])
+        self.assertEqual(5, output_point_count(library, self._settings))
+
+        solver = create_solver(library, self._settings)
+        outputs = np.zeros((2, 5, 4))
+        np.testing.assert_array_equal([0, -3], solve_trials(library, solver, np.array([[2.0], [-1.0]]), outputs))
+        delete_solver(library, solver)
+        np.testing.assert_array_equal(np.tile(2.0 * np.linspace(0.0, 2.0, 5)[:, np.newaxis], (1, 4)), outputs[0])
+
+    def test_pool(self):
+        samples = np.array([[1.0], [2.0], [-1.0], [0.0], [3.0], [4.0], [5.0]])
+        outputs = {}
+        flags = {}
+
+        def on_complete(indices, block_outputs, block_flags):
+            for index, output, flag in zip(indices, block_outputs, block_flags):
+                outputs[index] = output.copy()
+                flags[index] = flag
+
+        pool = open_solver_pool(self._library_file, self._settings, 2, 2)
+        try:
+            summary = pool['run'](samples, [0, 1, 2, 4, 5, 6], on_complete, report_interval=None)
+            self.assertEqual([3], summary['failed'])
+            self.assertEqual(-3, flags[2])
+            self.assertEqual(6, summary['completed'])
+            np.testing.assert_array_equal(samples[6, 0] * np.linspace(0.0, 2.0, 5), outputs[6][:, 1])
+
+            # The worker solving trial 4 dies, its block of trials 3 and 4 fails and the pool carries on with another worker.
+            summary = pool['run'](samples, range(7), on_complete, report_interval=None)
+            self.assertEqual([3, 4], sorted(summary['failed']))
+            self.assertEqual(7, summary['completed'])
+            summary = pool['run'](samples, [5, 6], on_complete, report_interval=None)
+            self.assertEqual([], summary['failed'])
+        finally:
+            pool['close']()
+
+    def test_campaign(self):
+        simulation_dir = os.path.join(self._directory, 'simulation')
+        config = {'num_trials': 20, 'workers': 2, 'report_interval': None, 'solver_backend': 'library', 'consolidate': True,
+                  'uncertainties': {'main.k': {'distribution': 'uniform', 'p1': 0.5, 'p2': 1.5}},
+                  'application': {'simulation_dir': simulation_dir, 'solver_library': self._library_file, 'prebuilt': True},
+                  'simulation': simulation_config}
+        summary = entry_point(config)
+        self.assertEqual(20, summary['completed'])
+        self.assertEqual([], summary['failed_trials'])
+        self.assertEqual([], os.listdir(os.path.join(simulation_dir, 'output')))
+        manifest = open_manifest(os.path.join(simulation_dir, 'campaign.sqlite'))
+        self.assertEqual(20, manifest_summary(manifest)['completed'])
+        manifest.close()
+
+        cube = open_result_cube(os.path.join(simulation_dir, 'results'))
+        k = variable_view(cube, 'main.k')[:, 1] / 0.5
+        self.assertTrue(np.all((k >= 0.5) & (k <= 1.5)))
+        self.assertFalse(math.isclose(k[0], k[1]))
+        np.testing.assert_allclose(2.0 * k, variable_view(cube, 'main.x')[:, -1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import json
+import os
+import re
+import subprocess
+import sys
+import unittest
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+# Dependencies that only some code paths need, none of them is imported by starting a console script.
+HEAVY_MODULES = ['cellsolver', 'libcellml', 'libsbml', 'matplotlib', 'pandas', 'plotly', 'redis', 'roadrunner', 'sbmlutils', 'scipy']
+
+# Seconds, as reported by -X importtime, to import a console script's module.
+IMPORT_TIME_BUDGET = 0.3
+
+
+def console_script_modules():
+    with open(os.path.join(here, '..', 'setup.py')) as f:
+        return sorted(set(re.findall(r"=(cellsolvertools\.\w+):main'", f.read())))
+
+
+def _python(*args):
+    return subprocess.run([sys.executable, *args], capture_output=True, text=True)
+
+
+class StartupTestCase(unittest.TestCase):
+
+    def test_imports(self):
+        modules = console_script_modules()
+        self.assertIn('cellsolvertools.pipeline', modules)
+        for module in modules:
+            with self.subTest(module=module):
+                imported = _python('-X', 'importtime', '-c', f'import json, sys, {module}; print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))')
+                self.assertEqual(0, imported.returncode, imported.stderr)
+                self.assertEqual([], json.loads(imported.stdout))
+                cumulative = [int(line.split('|')[1]) for line in imported.stderr.splitlines() if line.rstrip().endswith(f' {module}')]
+                self.assertLess(cumulative[0] * 1e-6, IMPORT_TIME_BUDGET)
+
+    def test_help(self):
+        for module in console_script_modules():
+            with self.subTest(module=module):
+                self.assertEqual(0, _python('-m', module, '--help').returncode)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+from cellsolvertools import tracing
+from cellsolvertools.trial_scheduler import run_trials
+
+
+@tracing.traced('square')
+def _square(x):
+    return x * x
+
+
+class TracingTestCase(unittest.TestCase):
+
+    def tearDown(self):
+        tracing.disable()
+
+    def test_disabled(self):
+        tracing.enable()
+        tracing.disable()
+        with tracing.span('ignored'):
+            self.assertEqual(4, _square(2))
+        tracing.enable()
+        self.assertEqual({}, tracing.summary()['stages'])
+
+    def test_spans(self):
+        tracing.enable()
+        with tracing.span('outer', model='m'):
+            self.assertEqual(9, _square(3))
+            self.assertEqual(16, _square(4))
+
+        stages = tracing.summary()['stages']
+        self.assertEqual(['square', 'outer'], list(stages))
+        self.assertEqual(2, stages['square']['count'])
+        self.assertGreaterEqual(stages['outer']['wall'], stages['square']['wall'])
+        self.assertGreater(stages['outer']['lifetime_max_rss'], 0)
+
+    @unittest.skipUnless(os.path.isfile('/proc/self/statm'), 'requires /proc')
+    def test_span_memory(self):
+        tracing.enable()
+        with tracing.span('allocate'):
+            block = b'\1' * 2 ** 26
+        del block
+        with tracing.span('idle'):
+            pass
+
+        stages = tracing.summary()['stages']
+        # Each span reports the memory it took, the lifetime peak stays where the allocation left it.
+        self.assertGreater(stages['allocate']['rss_change'], 2 ** 25)
+        self.assertLess(stages['idle']['rss_change'], 2 ** 25)
+        self.assertGreater(stages['idle']['lifetime_max_rss'], 2 ** 26)
+        self.assertIn('lifetime peak RSS', tracing.format_summary())
+
+    def test_trials(self):
+        tracing.enable()
+        trials = [{'index': i, 'args': [sys.executable, '-c', 'import time; time.sleep(0.05)']} for i in range(1, 7)]
+        results = []
+        run_trials(trials, 2, on_complete=results.append, report_interval=None)
+
+        self.assertEqual({'slot 0', 'slot 1'}, {r['worker'] for r in results})
+        self.assertTrue(all(r['queue_wait'] >= 0.0 for r in results))
+        # The last trials to start waited for two others to finish.
+        self.assertGreater(max(r['queue_wait'] for r in results), 0.1)
+
+        summary = tracing.summary()
+        self.assertEqual(6, summary['trials']['count'])
+        self.assertEqual(6, sum(worker['trials'] for worker in summary['workers'].values()))
+        self.assertIn('slot 1', tracing.format_summary())
+
+        directory = tempfile.mkdtemp()
+        filename = os.path.join(directory, 'trace.json')
+        try:
+            tracing.write_report(filename, io.StringIO())
+            with open(filename) as f:
+                events = json.load(f)['traceEvents']
+        finally:
+            os.remove(filename)
+            os.rmdir(directory)
+
+        lanes = {event['args']['name']: event['tid'] for event in events if event['ph'] == 'M'}
+        self.assertEqual({'main', 'slot 0', 'slot 1'}, set(lanes))
+        trial_events = [event for event in events if event.get('cat') == 'trial']
+        self.assertEqual(6, len(trial_events))
+        self.assertTrue(all(event['tid'] in [lanes['slot 0'], lanes['slot 1']] and event['dur'] > 0 for event in trial_events))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import io
+import os
+import sys
+import threading
+import time
+import unittest
+
+from cellsolvertools.trial_scheduler import run_trials
+
+
+def _python_trial(index, code, **kwargs):
+    return {'index': index, 'args': [sys.executable, '-c', code], **kwargs}
+
+
+def exit_with_argument():
+    # Entry point for in-process trials, its only argument is the exit code or 'crash' to kill the worker.
+    if sys.argv[1] == 'crash':
+        os._exit(3)
+    sys.exit(int(sys.argv[1]))
+
+
+class TrialSchedulerTestCase(unittest.TestCase):
+
+    def test_exit_status(self):
+        results = []
+        stream = io.StringIO()
+        trials = (_python_trial(i, f'import sys; sys.exit({1 if i % 3 == 0 else 0})') for i in range(1, 8))
+        summary = run_trials(trials, 3, on_complete=results.append, report_interval=None, stream=stream)
+
+        self.assertEqual(7, summary['completed'])
+        self.assertEqual([3, 6], sorted(summary['failed']))
+        self.assertEqual(list(range(1, 8)), sorted([r['index'] for r in results]))
+        self.assertTrue(all(r['wall_time'] > 0 for r in results))
+        self.assertIn('Trial 3 failed with exit code 1.', stream.getvalue())
+
+    def test_lazy_submission(self):
+        pulled = []
+
+        def trials():
+            for i in range(20):
+                pulled.append(i)
+                # Never more trials pulled than finished plus running, or waiting on the callback, twice the workers.
+                self.assertLessEqual(len(pulled) - len(finished), 2 + 4)
+                yield _python_trial(i, 'pass')
+
+        finished = []
+        run_trials(trials(), 2, on_complete=finished.append, report_interval=None)
+        self.assertEqual(20, len(finished))
+
+    def test_slow_callback(self):
+        threads = set()
+
+        def on_complete(result):
+            threads.add(threading.get_ident())
+            time.sleep(0.5)
+            results.append(result)
+
+        # The callback runs on a thread of its own, the trials do not wait for it to start.
+        results = []
+        run_trials((_python_trial(i, 'pass') for i in range(4)), 2, on_complete=on_complete, report_interval=None)
+        self.assertEqual(4, len(results))
+        self.assertEqual(1, len(threads))
+        self.assertNotIn(threading.get_ident(), threads)
+        started = [r['started'] for r in results]
+        self.assertLess(max(started) - min(started), 0.5)
+
+    def test_input_and_output(self):
+        results = []
+        trial = _python_trial(1, 'import sys; sys.stdout.write(sys.stdin.read().upper())', input=b'abc', capture_output=True)
+        run_trials([trial], 1, on_complete=results.append, report_interval=None)
+
+        self.assertEqual(b'ABC', results[0]['stdout'])
+
+    def test_missing_application(self):
+        stream = io.StringIO()
+        summary = run_trials([{'index': 1, 'args': ['/does/not/exist']}], 1, report_interval=None, stream=stream)
+
+        self.assertEqual([1], summary['failed'])
+
+    def test_entry_point(self):
+        outcomes = ['0', '2', '0', 'crash', '0', '0', '0']
+        trials = ({'index': i + 1, 'args': ['trial', outcome]} for i, outcome in enumerate(outcomes))
+        results = []
+        stream = io.StringIO()
+        summary = run_trials(trials, 2, on_complete=results.append, report_interval=None, stream=stream, entry_point=f'{__name__}:exit_with_argument')
+
+        self.assertEqual(7, summary['completed'])
+        self.assertEqual([2, 4], sorted(summary['failed']))
+        self.assertEqual({1: 0, 2: 2, 3: 0, 4: -1, 5: 0, 6: 0, 7: 0}, {r['index']: r['returncode'] for r in results})
+        self.assertIn('Trial 4 failed with exit code -1. The worker process terminated abruptly.', stream.getvalue())
+        # The workers outlive their trials.
+        self.assertLess(len({r['worker'] for r in results if r['returncode'] == 0}), 5)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,182 @@
+import asyncio
+import io
+import json
+import os
+import shutil
+import socket
+import stat
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+
+from cellsolvertools.batch_file import batch_task
+from cellsolvertools.trial_scheduler import MAX_TASK_ATTEMPTS, run_trials
+from cellsolvertools.work_queue import WorkQueueError, open_work_queue, serve_broker
+from cellsolvertools.worker_agent import run_task, serve
+
+solver_config = {'IntegrationMethod': 'BDF', 'IterationType': 'Newton'}
+simulation_config = {'StartingPoint': 0.0, 'EndingPoint': 1.0, 'PointInterval': 0.1}
+
+# Stands in for siss-batch, fails for the second block.
+batch_script = """#!/bin/sh
+case "$1" in
+  *batch_00002-*.batch) echo "no convergence" >&2; exit 1;;
+esac
+echo "$1 $2"
+"""
+
+
+class WorkQueueTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    def _check_queue(self, work_queue):
+        self.assertIsNone(work_queue['get']('tasks', 0.05))
+        for i in range(3):
+            work_queue['put']('tasks', {'index': i, 'samples': [[0.1, 2.5]]})
+        work_queue['put']('results', {'index': 9})
+        self.assertEqual([0, 1, 2], [work_queue['get']('tasks', 1.0)['index'] for _ in range(3)])
+        self.assertEqual({'index': 9}, work_queue['get']('results', 1.0))
+        self.assertIsNone(work_queue['get']('tasks', 0.05))
+        work_queue['close']()
+
+    def test_memory(self):
+        self._check_queue(open_work_queue('memory://'))
+
+    def test_spool(self):
+        self._check_queue(open_work_queue(f'spool://{self._directory}'))
+
+    def test_broker(self):
+        started = threading.Event()
+        address = os.path.join(self._directory, 'broker.socket')
+        threading.Thread(target=lambda: asyncio.run(serve_broker(address, started)), daemon=True).start()
+        self.assertTrue(started.wait(5.0))
+        self._check_queue(open_work_queue(f'unix://{address}'))
+
+    def test_broker_disconnect(self):
+        started = threading.Event()
+        address = os.path.join(self._directory, 'broker.socket')
+        threading.Thread(target=lambda: asyncio.run(serve_broker(address, started)), daemon=True).start()
+        self.assertTrue(started.wait(5.0))
+        # A client waiting for a task goes away before the task arrives.
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client.connect(address)
+        client.sendall(json.dumps({'op': 'get', 'queue': 'tasks', 'timeout': None}).encode() + b'\n')
+        client.close()
+
+        work_queue = open_work_queue(f'unix://{address}')
+        work_queue['put']('tasks', {'index': 1})
+        self.assertEqual({'index': 1}, work_queue['get']('tasks', 2.0))
+        work_queue['close']()
+
+    def test_unsupported(self):
+        self.assertRaises(WorkQueueError, open_work_queue, 'ftp://somewhere')
+
+    def _build_cache(self):
+        cache_dir = os.path.join(self._directory, 'build-cache')
+        entry_dir = os.path.join(cache_dir, 'abc')
+        os.makedirs(entry_dir)
+        for name in ['executable', 'batch_executable']:
+            filename = os.path.join(entry_dir, name)
+            with open(filename, 'w') as f:
+                f.write(batch_script)
+            os.chmod(filename, stat.S_IRWXU)
+        return cache_dir
+
+    def test_run_task(self):
+        cache_dir = self._build_cache()
+        task = batch_task(1, 0, np.ones((2, 1)), 'abc', solver_config, simulation_config, os.path.join(self._directory, 'out', 'o_%05llu.csv'))
+        result = run_task(task, cache_dir, self._directory)
+        self.assertEqual(0, result['returncode'])
+        self.assertIn('o_%05llu.csv', result['stdout'])
+
+        # Tasks with the same index, from different campaigns, have batch files of their own.
+        work_dir = os.path.join(self._directory, 'work')
+        os.makedirs(work_dir)
+        batch_files = [run_task(task, cache_dir, work_dir)['stdout'].split()[0] for _ in range(2)]
+        self.assertNotEqual(batch_files[0], batch_files[1])
+        self.assertEqual([], os.listdir(work_dir))
+
+        result = run_task({**task, 'build': 'def'}, cache_dir, self._directory)
+        self.assertEqual(-1, result['returncode'])
+        self.assertIn('def', result['stderr'])
+
+    def test_distributed_trials(self):
+        work_queue = open_work_queue('memory://')
+        cache_dir = self._build_cache()
+        pattern = os.path.join(self._directory, 'output', 'simulation_output_%05llu.csv')
+        samples = np.arange(10.0).reshape(5, 2)
+        trials = [{'index': index + 1, 'first_trial': first, 'task': batch_task(index + 1, first, samples[first:first + 2], 'abc', solver_config,
+                                                                                   simulation_config, pattern, reply_to='results-test')}
+                  for index, first in enumerate(range(0, 5, 2))]
+
+        agent = threading.Thread(target=serve, args=(work_queue, cache_dir, 2, 0.5, io.StringIO()))
+        agent.start()
+        results = []
+        stream = io.StringIO()
+        summary = run_trials(trials, 1, on_complete=results.append, report_interval=None, stream=stream, work_queue=work_queue)
+        agent.join()
+
+        self.assertEqual(3, summary['completed'])
+        self.assertEqual([2], summary['failed'])
+        self.assertIn('no convergence', stream.getvalue())
+        self.assertEqual([1, 2, 3], sorted(r['index'] for r in results))
+        self.assertTrue(all(r['trial']['task']['reply_to'] == 'results-test' for r in results))
+        self.assertTrue(os.path.isdir(os.path.dirname(pattern)))
+
+    def _trials(self, count, pulled):
+        pattern = os.path.join(self._directory, 'output', 'simulation_output_%05llu.csv')
+        for index in range(count):
+            pulled.append(index)
+            yield {'index': index + 1, 'first_trial': index, 'task': batch_task(index + 1, index, np.ones((1, 2)), 'abc', solver_config, simulation_config,
+                                                                                pattern, reply_to='results-test')}
+
+    def test_lost_task(self):
+        work_queue = open_work_queue('memory://')
+        cache_dir = self._build_cache()
+        # The first task handed out goes to an agent that dies with it.
+        lost = []
+
+        def put(name, item):
+            if name == 'tasks' and not lost:
+                lost.append(item['index'])
+            else:
+                work_queue['put'](name, item)
+
+        agent = threading.Thread(target=serve, args=(work_queue, cache_dir, 1, 1.0, io.StringIO()))
+        agent.start()
+        pulled = []
+        first_result_pulled = []
+        stream = io.StringIO()
+        summary = run_trials(self._trials(5, pulled), 1, on_complete=lambda result: first_result_pulled.append(len(pulled)), report_interval=None,
+                             stream=stream, work_queue={**work_queue, 'put': put}, task_timeout=0.2)
+        agent.join()
+
+        self.assertEqual([1], lost)
+        self.assertEqual(5, summary['completed'])
+        self.assertEqual([2], summary['failed'])
+        self.assertIn('task 1', stream.getvalue())
+        # Only two tasks are handed out before the first answer.
+        self.assertEqual(2, first_result_pulled[0])
+
+    def test_no_agents(self):
+        work_queue = open_work_queue('memory://')
+        results = []
+        summary = run_trials(self._trials(1, []), 1, on_complete=results.append, report_interval=None, stream=io.StringIO(), work_queue=work_queue,
+                             task_timeout=0.05)
+
+        self.assertEqual([1], summary['failed'])
+        self.assertEqual(-1, results[0]['returncode'])
+        # The task was handed out again each time its lease ran out.
+        self.assertEqual([1] * MAX_TASK_ATTEMPTS, [work_queue['get']('tasks', 0.0)['index'] for _ in range(MAX_TASK_ATTEMPTS)])
+        self.assertIsNone(work_queue['get']('tasks', 0.0))
+
+
+if __name__ == '__main__':
+    unittest.main()